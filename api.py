@@ -0,0 +1,213 @@
+# api.py
+"""
+API HTTP (FastAPI) pour la saisie du journal et les états, sans interface Tkinter.
+
+Lancement : uvicorn api:app --host 0.0.0.0 --port 8000
+
+Chaque requête reçoit sa propre session (dépendance get_db). Les routes sont
+synchrones (def) : FastAPI les exécute dans son pool de threads, la boucle
+asynchrone n'est donc jamais bloquée par SQLite.
+"""
+from datetime import date, datetime
+from typing import List, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query
+from sqlalchemy.orm import Session
+from database import SessionLocal
+import models
+import crud
+import schemas
+import services.accounting as accounting
+from services import ledger
+from services.facturation import facturer_periode
+
+app = FastAPI(title="bois_m", description="Journal, comptabilisation, stocks et facturation")
+
+
+def get_db():
+    """Session par requête, fermée en fin de requête"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def startup():
+    from init_db import init_database
+    init_database()
+
+
+# ========================
+# JOURNAL QUOTIDIEN
+# ========================
+def _curseur(ligne) -> str:
+    return f"{ligne.date_operation.isoformat()}|{ligne.id}"
+
+
+def _lire_curseur(after: str):
+    try:
+        date_operation, journal_id = after.rsplit("|", 1)
+        return datetime.fromisoformat(date_operation), int(journal_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+
+@app.get("/journal", response_model=schemas.JournalPage)
+def lister_journal(after: Optional[str] = None, limit: int = Query(200, ge=1, le=1000),
+                   type_journal: Optional[str] = None, q: Optional[str] = None,
+                   db: Session = Depends(get_db)):
+    """
+    Journal du plus récent au plus ancien, paginé par curseur ; `q` : recherche plein
+    texte, classée par pertinence et non paginée (au plus `limit` lignes) : `after`
+    n'y a pas de sens et est refusé (400).
+    """
+    if q:
+        if after:
+            raise HTTPException(status_code=400, detail="Recherche plein texte non paginée : after est refusé avec q")
+        lignes = crud.search_journal(db, q, type_journal=type_journal, limit=limit)
+        return {"items": [dict(ligne._mapping) for ligne in lignes], "next_cursor": None}
+
+    lignes = crud.get_journal_page(db, after=_lire_curseur(after) if after else None,
+                                   limit=limit, type_journal=type_journal)
+    return {
+        "items": [dict(ligne._mapping) for ligne in lignes],
+        "next_cursor": _curseur(lignes[-1]) if len(lignes) == limit else None
+    }
+
+
+def _resultats(resultats):
+    return [{
+        "journal_id": resultat["journal_id"],
+        "status": resultat["status"],
+        "message": resultat["message"],
+        "nombre_ecritures": len(resultat["ecritures"])
+    } for resultat in resultats]
+
+
+@app.post("/journal", response_model=schemas.JournalBatchResult, status_code=201)
+def creer_journal(lot: schemas.JournalBatch, db: Session = Depends(get_db)):
+    """Enregistre un lot d'entrées (une transaction), comptabilisées dans la foulée si demandé"""
+    journaux = [models.JournalQuotidien(**entree.dict(exclude_none=True)) for entree in lot.entries]
+    db.add_all(journaux)
+    db.flush()
+
+    if not lot.comptabiliser:
+        db.commit()
+        return {"ids": [journal.id for journal in journaux], "comptabilisation": []}
+
+    resultats = accounting.post_journal_entries(db, journaux)
+    return {"ids": [journal.id for journal in journaux], "comptabilisation": _resultats(resultats)}
+
+
+@app.post("/journal/comptabiliser", response_model=List[schemas.PostingResult])
+def comptabiliser_journal(demande: schemas.PostingRequest, db: Session = Depends(get_db)):
+    """Comptabilise des entrées existantes en un lot (une erreur n'annule que son entrée)"""
+    journaux = {journal.id: journal for journal in db.query(models.JournalQuotidien).filter(
+        models.JournalQuotidien.id.in_(demande.ids)
+    )}
+    resultats = {resultat["journal_id"]: resultat for resultat in accounting.post_journal_entries(
+        db, [journaux[journal_id] for journal_id in dict.fromkeys(demande.ids) if journal_id in journaux]
+    )}
+    introuvable = {"status": "error", "message": "Entrée introuvable", "ecritures": []}
+    return _resultats([resultats.get(journal_id, dict(introuvable, journal_id=journal_id))
+                       for journal_id in dict.fromkeys(demande.ids)])
+
+
+# ========================
+# STOCKS
+# ========================
+def _curseur_stock(ligne) -> str:
+    return f"{ligne['famille'] or ''}|{ligne['code']}"
+
+
+@app.get("/stocks/mouvements")
+def mouvements_stock(start_date: date, end_date: date, familles: Optional[List[str]] = Query(None),
+                     after: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000),
+                     db: Session = Depends(get_db)):
+    """
+    Stock initial, production, consommation, vente et stock final par produit et par famille.
+    Avec `limit`, les lignes sont paginées par curseur (famille, code) ; les sous-totaux
+    et le total général portent toujours sur toute la sélection.
+    """
+    if after and "|" not in after:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    rapport = crud.get_stock_movements(db, start_date, end_date, familles,
+                                       apres=tuple(after.split("|", 1)) if after else None, limite=limit)
+    suite = rapport.pop("suite")
+    if limit is None:
+        return rapport
+    return dict(rapport, next_cursor=_curseur_stock(rapport["lignes"][-1]) if suite else None)
+
+
+# ========================
+# TABLEAU DE BORD ET TRÉSORERIE
+# ========================
+@app.get("/dashboard/metriques")
+def metriques(date_reference: Optional[date] = None, db: Session = Depends(get_db)):
+    return accounting.get_dashboard_metrics(db, date_reference)
+
+
+@app.get("/dashboard/rendement")
+def rendement(start: date, end: date, granularity: str = Query("day", regex="^(day|week|month)$"),
+              db: Session = Depends(get_db)):
+    return accounting.get_rendement_series(db, start, end, granularity)
+
+
+@app.get("/tresorerie/balance")
+def balance_tresorerie(date_fin: Optional[date] = None, db: Session = Depends(get_db)):
+    return {"date_fin": date_fin, "solde": crud.get_balance_tresorerie(db, date_fin)}
+
+
+@app.get("/tresorerie/operations")
+def operations_tresorerie(date_debut: Optional[date] = None, date_fin: Optional[date] = None,
+                          after: Optional[str] = None, limit: int = Query(200, ge=1, le=1000),
+                          db: Session = Depends(get_db)):
+    """Opérations de la période paginées par curseur (date_operation, id), comme le journal"""
+    if after:
+        date_operation, tresorerie_id = _lire_curseur(after)
+        after = (date_operation.date(), tresorerie_id)
+    lignes = crud.get_tresorerie_operations(db, date_debut, date_fin, after=after, limit=limit)
+    return {
+        "items": [dict(ligne._mapping) for ligne in lignes],
+        "next_cursor": _curseur(lignes[-1]) if len(lignes) == limit else None,
+        "totaux": crud.get_tresorerie_totaux(db, date_debut, date_fin)
+    }
+
+
+@app.get("/comptabilite/balance")
+def balance_generale(periode: str = Query(..., regex=r"^\d{4}(-\d{2})?$"), classe: Optional[int] = None,
+                     db: Session = Depends(get_db)):
+    return ledger.get_balance_generale(db, periode, classe)
+
+
+# ========================
+# FACTURES
+# ========================
+@app.get("/factures", response_model=schemas.FacturePage)
+def lister_factures(client_id: Optional[int] = None, statut: Optional[str] = None,
+                    page: int = Query(0, ge=0), page_size: int = Query(50, ge=1, le=500),
+                    db: Session = Depends(get_db)):
+    factures = crud.get_factures(db, client_id, statut, limit=page_size + 1, offset=page * page_size)
+    return {
+        "items": factures[:page_size],
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(factures) > page_size
+    }
+
+
+@app.get("/factures/{facture_id}", response_model=schemas.FactureOut)
+def lire_facture(facture_id: int, db: Session = Depends(get_db)):
+    facture = crud.get_facture(db, facture_id)
+    if not facture:
+        raise HTTPException(status_code=404, detail="Facture introuvable")
+    return facture
+
+
+@app.post("/factures/periode", response_model=List[schemas.FactureGeneree], status_code=201)
+def facturer(demande: schemas.FacturationPeriode, db: Session = Depends(get_db)):
+    """Facture les BL non facturés de la période, une facture par client"""
+    if demande.date_debut > demande.date_fin:
+        raise HTTPException(status_code=400, detail="La date de début ne peut pas être postérieure à la date de fin")
+    return facturer_periode(db, demande.date_debut, demande.date_fin, demande.client_ids)
@@ -1,28 +1,59 @@
 # app.py
+import time
+DEBUT = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, date
+import logging
 import os
-from database import SessionLocal, engine
-import models
-import crud
-import services.accounting as accounting
-import services.production as production
+import sys
 from ui.main_window import MainWindow
+from ui import tasks
 from init_db import init_database
+from services.stocks import ensure_instantanes_stock
+
+logger = logging.getLogger("bois_m.demarrage")
+
+
+def rapport_demarrage(etapes):
+    """Journalise (niveau DEBUG) la durée de chaque étape du démarrage, depuis le lancement du processus"""
+    precedent = DEBUT
+    for nom, instant in etapes:
+        logger.debug("%s : %.0f ms", nom, (instant - precedent) * 1000)
+        precedent = instant
+    logger.debug("Fenêtre affichée en %.0f ms", (precedent - DEBUT) * 1000)
+
 
 def main():
-    # Initialiser la base de données
+    # Journalisation : BOIS_M_LOG=DEBUG affiche les durées du démarrage et de
+    # construction des onglets ; avertissements seulement par défaut
+    logging.basicConfig(level=os.environ.get("BOIS_M_LOG", "WARNING").upper(),
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    etapes = [("Imports", time.perf_counter())]
+
+    # Initialiser la base de données (rien à faire si elle est déjà à jour) ;
+    # en cas d'échec, l'application ne démarre pas sur un schéma incomplet
     try:
-        init_database()
-        print("Base de données initialisée avec succès")
+        if init_database():
+            print("Base de données initialisée avec succès")
     except Exception as e:
         print(f"Erreur lors de l'initialisation de la base de données: {e}")
         messagebox.showerror("Erreur", f"Impossible d'initialiser la base de données: {str(e)}")
-        return
+        sys.exit(1)
+    etapes.append(("Base de données", time.perf_counter()))
+
+    # Arrêtés de stock des mois clos, en arrière-plan
+    tasks.get_executor().submit(ensure_instantanes_stock)
 
     # Créer la fenêtre principale
     app = MainWindow()
+    etapes.append(("Fenêtre principale", time.perf_counter()))
+
+    def premier_affichage():
+        etapes.append(("Premier affichage", time.perf_counter()))
+        rapport_demarrage(etapes)
+    app.after_idle(premier_affichage)
     app.mainloop()
 
 if __name__ == "__main__":
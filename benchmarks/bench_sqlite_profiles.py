@@ -0,0 +1,112 @@
+# benchmarks/bench_sqlite_profiles.py
+"""
+Débit de comptabilisation selon le profil SQLite (database.SQLITE_PROFILES).
+
+Chaque profil travaille sur une base temporaire neuve : des achats et ventes
+sont saisis puis comptabilisés un par un (une transaction par entrée, comme
+depuis le formulaire du journal), puis en un seul lot.
+
+Usage : python -m benchmarks.bench_sqlite_profiles [--entries 500]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import services.accounting as accounting
+
+
+def _seed(db):
+    for compte, classe in [("401000", 4), ("411000", 4), ("4456", 4), ("4457", 4), ("4458", 4), ("311000", 3), ("701000", 7)]:
+        db.add(models.PlanComptable(compte=compte, libelle=compte, classe=classe))
+    produit = models.Produit(code="MP001", designation="Bois de Chêne", famille="MP", unite_mesure="m³",
+                             prix_achat=500, prix_vente=700, compte_stock="311000", compte_vente="701000")
+    client = models.Client(nom="Client bench", compte_comptable="411000")
+    fournisseur = models.Fournisseur(nom="Fournisseur bench", compte_comptable="401000")
+    db.add_all([produit, client, fournisseur])
+    db.commit()
+    return produit, client, fournisseur
+
+
+def _journaux(db, n, produit, client, fournisseur):
+    journaux = []
+    for i in range(n):
+        achat = i % 2 == 0
+        journaux.append(models.JournalQuotidien(
+            date_operation=datetime.now(),
+            type_journal="ACHAT" if achat else "VENTE",
+            type_document="FACTURE",
+            numero_piece=f"BENCH-{i:06d}",
+            libelle="Bench",
+            produit_id=produit.id,
+            client_id=None if achat else client.id,
+            fournisseur_id=fournisseur.id if achat else None,
+            unite_production="GENERAL",
+            quantite=1.0,
+            prix_unitaire=500,
+            montant_ht=500,
+            montant_tva=95,
+            montant_ttc=595,
+            droit_timbre=5 if not achat else 0
+        ))
+    db.add_all(journaux)
+    db.commit()
+    return journaux
+
+
+def run_profile(profile, entries):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = database.create_db_engine(url, profile)
+        models.Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        try:
+            produit, client, fournisseur = _seed(db)
+
+            # Une session et une transaction par entrée, comme le formulaire du journal
+            ids = [journal.id for journal in _journaux(db, entries, produit, client, fournisseur)]
+            db.commit()  # termine la transaction de lecture avant d'écrire depuis d'autres sessions
+            debut = time.perf_counter()
+            for journal_id in ids:
+                db_entree = Session()
+                try:
+                    accounting.process_journal_entry(db_entree, db_entree.get(models.JournalQuotidien, journal_id))
+                finally:
+                    db_entree.close()
+            unitaire = time.perf_counter() - debut
+
+            journaux = _journaux(db, entries, produit, client, fournisseur)
+            debut = time.perf_counter()
+            accounting.post_journal_entries(db, journaux)
+            lot = time.perf_counter() - debut
+        finally:
+            db.close()
+            engine.dispose()
+
+    return {
+        "profile": profile,
+        "entries": entries,
+        "unitaire_s": round(unitaire, 4),
+        "unitaire_entries_per_s": round(entries / unitaire, 1),
+        "lot_s": round(lot, 4),
+        "lot_entries_per_s": round(entries / lot, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit de comptabilisation par profil SQLite")
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--profiles", nargs="*", default=list(database.SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    results = [run_profile(profile, args.entries) for profile in args.profiles]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
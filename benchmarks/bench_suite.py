@@ -0,0 +1,234 @@
+# benchmarks/bench_suite.py
+"""
+Banc d'essai des chemins de comptabilisation et de reporting.
+
+Une base temporaire est remplie par le générateur synthétique (achats et
+consommations de MP, productions de SF/PF/déchets, ventes, caisse, charges),
+l'historique est comptabilisé par lots, puis sont chronométrés :
+- process_journal_entry (une session et une transaction par entrée) ;
+- get_dashboard_metrics, get_balance_tresorerie, get_balance_generale ;
+- calculate_daily_metrics, calculate_production_costs (métriques de production) ;
+- get_stock_movements (état des stocks du dernier mois) ;
+- facturer_periode (facturation des BL du dernier mois).
+
+Les résultats sont écrits en JSON (--output). Avec les mêmes paramètres et la
+même graine, deux exécutions travaillent sur les mêmes données ; --compare
+affiche l'écart avec un résultat précédent.
+
+Les statistiques du cache des tables de référence (referentiel_cache.py)
+sont jointes aux résultats. Avec --sql-stats, les requêtes les plus coûteuses et les N+1 détectés
+(instrumentation.py) sont ajoutés aux résultats.
+
+Usage : python -m benchmarks.bench_suite [--lignes 20000] [--output resultats.json] [--compare precedent.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+import database
+import instrumentation
+import referentiel_cache
+import models
+import crud
+import services.accounting as accounting
+from services import ledger, production
+from services.facturation import facturer_periode
+from init_db import seed_database
+from benchmarks.generate_data import generer_referentiel, generer_journal, iter_lignes
+
+
+def _stats(durees):
+    """Statistiques (ms) d'une série de durées en secondes"""
+    durees = sorted(durees)
+    centile = lambda p: durees[min(len(durees) - 1, int(p * len(durees)))] * 1000
+    return {
+        "n": len(durees),
+        "total_s": round(sum(durees), 4),
+        "moyenne_ms": round(sum(durees) / len(durees) * 1000, 3),
+        "p50_ms": round(centile(0.50), 3),
+        "p95_ms": round(centile(0.95), 3),
+        "max_ms": round(durees[-1] * 1000, 3)
+    }
+
+
+def chronometrer(fonction, repetitions):
+    durees = []
+    for i in range(repetitions):
+        debut = time.perf_counter()
+        fonction(i)
+        durees.append(time.perf_counter() - debut)
+    return _stats(durees)
+
+
+def _version_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def preparer(Session, args):
+    """Génère les données et comptabilise l'historique ; retourne les ids laissés à comptabiliser"""
+    db = Session()
+    try:
+        seed_database(db)
+        clients, fournisseurs, produits = generer_referentiel(
+            db, args.clients, args.fournisseurs, args.produits, random.Random(args.graine))
+        generer_journal(db, iter_lignes(args.lignes, args.jours, clients, fournisseurs, produits,
+                                        random.Random(args.graine)))
+        ids = [i for (i,) in db.query(models.JournalQuotidien.id).order_by(
+            models.JournalQuotidien.date_operation, models.JournalQuotidien.id)]
+        db.commit()
+    finally:
+        db.close()
+    return ids[:-args.unitaires], ids[-args.unitaires:]
+
+
+def comptabiliser_historique(Session, ids, taille_lot):
+    """Comptabilise l'historique par lots (post_journal_entries) ; retourne durée et statuts"""
+    statuts = {}
+    debut = time.perf_counter()
+    for i in range(0, len(ids), taille_lot):
+        db = Session()
+        try:
+            journaux = db.query(models.JournalQuotidien).filter(
+                models.JournalQuotidien.id.in_(ids[i:i + taille_lot])
+            ).order_by(models.JournalQuotidien.date_operation, models.JournalQuotidien.id).all()
+            for resultat in accounting.post_journal_entries(db, journaux):
+                statuts[resultat["status"]] = statuts.get(resultat["status"], 0) + 1
+        finally:
+            db.close()
+    duree = time.perf_counter() - debut
+    return {"lignes": len(ids), "duree_s": round(duree, 3),
+            "lignes_par_s": round(len(ids) / duree, 1) if duree else None, "statuts": statuts}
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database.create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", args.profile)
+        models.Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        stats_sql = None
+        try:
+            historique, unitaires = preparer(Session, args)
+            if args.sql_stats:
+                stats_sql = instrumentation.QueryStats(seuil_lent_ms=float("inf")).attach(engine)
+            resultats = {"post_journal_entries": comptabiliser_historique(Session, historique, args.lot)}
+
+            # Une session et une transaction par entrée, comme le formulaire du journal
+            statuts = {}
+            def comptabiliser_une(i):
+                db = Session()
+                try:
+                    journal = db.get(models.JournalQuotidien, unitaires[i])
+                    statut = accounting.post_journal_entries(db, [journal])[0]["status"]
+                    statuts[statut] = statuts.get(statut, 0) + 1
+                finally:
+                    db.close()
+            resultats["process_journal_entry"] = dict(chronometrer(comptabiliser_une, len(unitaires)), statuts=statuts)
+
+            fin = date.today()
+            debut_mois = fin - timedelta(days=30)
+            jours = [fin - timedelta(days=n) for n in range(args.repetitions)]
+            db = Session()
+            try:
+                resultats["get_dashboard_metrics"] = chronometrer(
+                    lambda i: accounting.get_dashboard_metrics(db, jours[i]), args.repetitions)
+                resultats["calculate_daily_metrics"] = chronometrer(
+                    lambda i: production.calculate_daily_metrics(db, jours[i]), args.repetitions)
+                resultats["calculate_production_costs"] = chronometrer(
+                    lambda i: production.calculate_production_costs(db, jours[i]), args.repetitions)
+                resultats["get_balance_tresorerie"] = chronometrer(
+                    lambda i: crud.get_balance_tresorerie(db), args.repetitions)
+                resultats["get_balance_tresorerie_datee"] = chronometrer(
+                    lambda i: crud.get_balance_tresorerie(db, jours[i]), args.repetitions)
+                resultats["get_balance_generale"] = chronometrer(
+                    lambda i: ledger.get_balance_generale(db, debut_mois.strftime("%Y-%m")), args.repetitions)
+                resultats["get_stock_movements"] = chronometrer(
+                    lambda i: crud.get_stock_movements(db, debut_mois, fin), args.repetitions)
+                db.commit()
+
+                factures = []
+                resultats["facturer_periode"] = chronometrer(
+                    lambda i: factures.extend(facturer_periode(db, debut_mois, fin)), 1)
+                resultats["facturer_periode"]["factures"] = len(factures)
+                resultats["facturer_periode"]["bl"] = sum(facture["nombre_bl"] for facture in factures)
+            finally:
+                db.close()
+        finally:
+            if stats_sql:
+                stats_sql.detach()
+            engine.dispose()
+
+    resultats["cache_referentiel"] = referentiel_cache.stats_cache()
+    if stats_sql:
+        resultats["sql"] = stats_sql.report(limite=10)
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": _version_git(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "profile": args.profile,
+            "parametres": {cle: getattr(args, cle) for cle in
+                           ("lignes", "jours", "clients", "fournisseurs", "produits", "unitaires",
+                            "repetitions", "lot", "graine")}
+        },
+        "resultats": resultats
+    }
+
+
+def comparer(precedent, actuel):
+    """Affiche, par mesure, la durée moyenne avant/après et le rapport"""
+    if precedent["meta"]["parametres"] != actuel["meta"]["parametres"]:
+        print("Attention : paramètres différents, mesures non comparables")
+    print(f"{'mesure':<32}{'avant':>12}{'après':>12}{'rapport':>10}")
+    for nom, mesure in actuel["resultats"].items():
+        if nom in ("sql", "cache_referentiel"):
+            continue
+        avant = precedent["resultats"].get(nom, {})
+        cle = "moyenne_ms" if "moyenne_ms" in mesure else "duree_s"
+        if cle not in avant or not avant[cle]:
+            continue
+        print(f"{nom:<32}{avant[cle]:>12}{mesure[cle]:>12}{mesure[cle] / avant[cle]:>9.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai comptabilisation et reporting")
+    parser.add_argument("--lignes", type=int, default=20000, help="lignes de journal générées")
+    parser.add_argument("--jours", type=int, default=90)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--fournisseurs", type=int, default=20)
+    parser.add_argument("--produits", type=int, default=40)
+    parser.add_argument("--unitaires", type=int, default=200, help="entrées comptabilisées une par une")
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--lot", type=int, default=1000, help="taille des lots de comptabilisation")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--profile", default=database.SQLITE_PROFILE, choices=list(database.SQLITE_PROFILES))
+    parser.add_argument("--sql-stats", action="store_true", help="ajoute aux résultats les requêtes SQL les plus coûteuses")
+    parser.add_argument("--output", help="fichier JSON de résultats")
+    parser.add_argument("--compare", help="résultats JSON d'une exécution précédente")
+    args = parser.parse_args()
+
+    resultat = run(args)
+    texte = json.dumps(resultat, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fichier:
+            fichier.write(texte + "\n")
+    print(texte)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fichier:
+            comparer(json.load(fichier), resultat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# benchmarks/generate_data.py
+"""
+Générateur de données synthétiques pour les essais de charge : tiers,
+produits et lignes de journal (non comptabilisées) réparties sur une période.
+
+Les lignes sont insérées par lots (executemany) dans une seule transaction ;
+le trigger plein texte est suspendu pendant le chargement et journal_fts
+complété en une requête à la fin. Même graine, mêmes données.
+
+Usage : python -m benchmarks.generate_data --db charge.db [--lignes 1000000] [--jours 365]
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from itertools import islice
+from sqlalchemy import func, text
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import crud
+from init_db import seed_database
+
+UNITES = ["Scierie", "Déroulage", "Atelier Nord", "Broyeur"]
+FAMILLES = ["MP", "SF", "PF", "déchet"]
+TYPES_CHARGE = ["MO", "ELEC", "AMORT"]
+# Répartition des types de journal (poids)
+TYPES_JOURNAL = {"VENTE": 35, "ACHAT": 20, "PRODUCTION": 15, "CONSOMMATION": 15, "CHARGES": 10, "CAISSE": 5}
+# Familles de produits concernées par type de journal (scierie : on achète et
+# consomme du bois brut, on produit et vend semi-finis, produits finis et déchets)
+FAMILLES_PAR_TYPE = {
+    "ACHAT": ["MP"],
+    "CONSOMMATION": ["MP"],
+    "PRODUCTION": ["SF", "PF", "déchet"],
+    "VENTE": ["PF", "SF", "déchet"],
+}
+
+
+def generer_referentiel(db, clients, fournisseurs, produits, aleatoire):
+    """Crée les tiers et produits synthétiques manquants ; retourne leurs identifiants"""
+    crud.upsert_rows(db, models.Client, [
+        {"code": f"GEN-C{i:06d}", "nom": f"Client {i}", "compte_comptable": "411000"} for i in range(clients)
+    ], ("code",), mise_a_jour=False)
+    crud.upsert_rows(db, models.Fournisseur, [
+        {"code": f"GEN-F{i:06d}", "nom": f"Fournisseur {i}", "compte_comptable": "401000"} for i in range(fournisseurs)
+    ], ("code",), mise_a_jour=False)
+    crud.upsert_rows(db, models.Produit, [{
+        "code": f"GEN-P{i:06d}",
+        "designation": f"Produit {i}",
+        "famille": FAMILLES[i % len(FAMILLES)],
+        "unite_mesure": "m³",
+        "prix_achat": round(aleatoire.uniform(50, 800), 2),
+        "prix_vente": round(aleatoire.uniform(100, 1500), 2),
+        "compte_stock": "311000",
+        "compte_achat": "601000",
+        "compte_vente": "701000"
+    } for i in range(produits)], ("code",), mise_a_jour=False)
+    db.commit()
+
+    return (
+        [i for (i,) in db.query(models.Client.id).filter(models.Client.code.like("GEN-C%"))],
+        [i for (i,) in db.query(models.Fournisseur.id).filter(models.Fournisseur.code.like("GEN-F%"))],
+        [(i, famille) for i, famille in db.query(models.Produit.id, models.Produit.famille).filter(
+            models.Produit.code.like("GEN-P%"))]
+    )
+
+
+# Colonnes alimentées par le générateur, dans l'ordre des tuples de iter_lignes
+COLONNES = [
+    "date_operation", "type_journal", "type_document", "numero_piece", "libelle", "produit_id",
+    "client_id", "fournisseur_id", "unite_production", "quantite", "prix_unitaire", "montant_ht",
+    "taux_tva", "montant_tva", "montant_ttc", "tva_applicable", "dt_applicable", "droit_timbre",
+    "comptabilisee", "type_charge"
+]
+
+
+def iter_lignes(nombre, jours, clients, fournisseurs, produits, aleatoire, debut_numero=0):
+    """
+    Lignes de journal synthétiques, en tuples dans l'ordre de COLONNES et au
+    format de stockage SQLite de SQLAlchemy (dates en texte, booléens 0/1)
+    pour passer directement au pilote. Les dates sont croissantes, comme une
+    saisie au fil de l'eau (les index sur la date sont remplis en fin d'arbre).
+    """
+    types = aleatoire.choices(list(TYPES_JOURNAL), list(TYPES_JOURNAL.values()), k=nombre)
+    instants = sorted(aleatoire.randrange(jours * 86400) for _ in range(nombre))
+    premier_jour = date.today() - timedelta(days=jours)
+    jours_iso = [(premier_jour + timedelta(days=n)).isoformat() for n in range(jours + 1)]
+    uniform, choice = aleatoire.uniform, aleatoire.choice
+    produits_par_type = {
+        type_journal: [produit_id for produit_id, famille in produits if famille in familles]
+        for type_journal, familles in FAMILLES_PAR_TYPE.items()
+    }
+    for i, type_journal, instant in zip(range(debut_numero, debut_numero + nombre), types, instants):
+        jour, seconde = divmod(instant, 86400)
+        heure, seconde = divmod(seconde, 3600)
+        minute, seconde = divmod(seconde, 60)
+        quantite = round(uniform(1, 50), 2)
+        prix_unitaire = round(uniform(50, 1500), 2)
+        montant_ht = round(quantite * prix_unitaire, 2)
+        tva = type_journal == "VENTE" or type_journal == "ACHAT"
+        montant_tva = round(montant_ht * 0.19, 2) if tva else 0
+        vente = type_journal == "VENTE"
+        yield (
+            f"{jours_iso[jour]} {heure:02d}:{minute:02d}:{seconde:02d}.000000",
+            type_journal,
+            choice(("BL", "FACTURE")) if vente else "FACTURE",
+            f"GEN-{i:08d}",
+            f"{type_journal.capitalize()} synthétique {i}",
+            choice(produits_par_type[type_journal]) if type_journal in produits_par_type else None,
+            choice(clients) if vente or type_journal == "CAISSE" else None,
+            choice(fournisseurs) if type_journal == "ACHAT" else None,
+            choice(UNITES),
+            quantite,
+            prix_unitaire,
+            montant_ht,
+            19.0 if tva else 0,
+            montant_tva,
+            round(montant_ht + montant_tva, 2),
+            int(tva),
+            int(vente),
+            0,
+            0,
+            choice(TYPES_CHARGE) if type_journal == "CHARGES" else None
+        )
+
+
+def generer_journal(db, lignes, taille_lot=50000):
+    """
+    Insère les lignes par lots (executemany du pilote) dans une seule
+    transaction, trigger plein texte suspendu puis index complété en une
+    requête. Retourne le nombre de lignes insérées.
+    """
+    sql = (f"INSERT INTO journal_quotidien ({', '.join(COLONNES)}) "
+           f"VALUES ({', '.join('?' for _ in COLONNES)})")
+    total = 0
+    try:
+        dernier_id = db.query(func.max(models.JournalQuotidien.id)).scalar() or 0
+        db.execute(text("DROP TRIGGER IF EXISTS journal_fts_ai"))
+        connexion = db.connection()
+        for lot in iter(lambda: list(islice(lignes, taille_lot)), []):
+            connexion.exec_driver_sql(sql, lot)
+            total += len(lot)
+        crud.index_journal_fts(db, dernier_id)
+        for ddl in models.JOURNAL_FTS_DDL:
+            db.execute(text(ddl))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération de données synthétiques")
+    parser.add_argument("--db", required=True, help="fichier SQLite (créé s'il n'existe pas)")
+    parser.add_argument("--lignes", type=int, default=1000000)
+    parser.add_argument("--jours", type=int, default=365)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--fournisseurs", type=int, default=100)
+    parser.add_argument("--produits", type=int, default=200)
+    parser.add_argument("--lot", type=int, default=50000)
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--profile", default=database.SQLITE_PROFILE, choices=list(database.SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    engine = database.create_db_engine(f"sqlite:///{os.path.abspath(args.db)}", args.profile)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    aleatoire = random.Random(args.graine)
+    try:
+        seed_database(db)
+        clients, fournisseurs, produits = generer_referentiel(db, args.clients, args.fournisseurs,
+                                                              args.produits, aleatoire)
+        deja = db.query(models.JournalQuotidien.id).filter(
+            models.JournalQuotidien.numero_piece.like("GEN-%")).count()
+        db.commit()
+
+        debut = time.perf_counter()
+        total = generer_journal(db, iter_lignes(args.lignes, args.jours, clients, fournisseurs, produits,
+                                                aleatoire, debut_numero=deja), args.lot)
+        duree = time.perf_counter() - debut
+    finally:
+        db.close()
+        engine.dispose()
+
+    print(json.dumps({
+        "db": args.db,
+        "profile": args.profile,
+        "lignes": total,
+        "duree_s": round(duree, 3),
+        "lignes_par_s": round(total / duree, 1) if duree else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
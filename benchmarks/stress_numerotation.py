@@ -0,0 +1,79 @@
+# benchmarks/stress_numerotation.py
+"""
+Débit de crud.reserver_numeros sous contention : plusieurs processus, chacun
+avec son moteur, réservent en parallèle des numéros (unitaires ou par blocs)
+sur une même base. Une partie des transactions est annulée volontairement.
+Affiche le débit en JSON (unicité et continuité des numéros : voir
+tests/test_numerotation.py).
+
+Usage : python -m benchmarks.stress_numerotation [--workers 8] [--iterations 200]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from multiprocessing import Pool
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import crud
+
+
+def _worker(args):
+    url, profile, iterations, graine = args
+    engine = database.create_db_engine(url, profile)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    aleatoire = random.Random(graine)
+    valides = []
+    try:
+        for _ in range(iterations):
+            type_document = aleatoire.choice(list(crud.PREFIXES_DOCUMENTS))
+            nombre = aleatoire.choice([1, 1, 1, 5, 20])
+            db = Session()
+            try:
+                numeros = crud.reserver_numeros(db, nombre, type_document)
+                if aleatoire.random() < 0.1:
+                    db.rollback()  # document abandonné : les numéros sont rendus
+                    continue
+                db.commit()
+                valides.extend(numeros)
+            finally:
+                db.close()
+    finally:
+        engine.dispose()
+    return valides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress de la numérotation des documents")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--profile", default=database.SQLITE_PROFILE, choices=list(database.SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'numerotation.db')}"
+        engine = database.create_db_engine(url, args.profile)
+        models.Base.metadata.create_all(bind=engine)
+        engine.dispose()
+
+        debut = time.perf_counter()
+        with Pool(args.workers) as pool:
+            lots = pool.map(_worker, [(url, args.profile, args.iterations, graine) for graine in range(args.workers)])
+        duree = time.perf_counter() - debut
+
+    numeros = [numero for lot in lots for numero in lot]
+    print(json.dumps({
+        "profile": args.profile,
+        "workers": args.workers,
+        "reservations": args.workers * args.iterations,
+        "numeros_valides": len(numeros),
+        "duree_s": round(duree, 3),
+        "reservations_par_s": round(args.workers * args.iterations / duree, 1)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
 # crud.py
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func, select
+from sqlalchemy import and_, or_, desc, func, select, case, literal, literal_column, union_all, text, table, column, bindparam
+from sqlalchemy.types import Date, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from models import *
-from datetime import datetime, date
+from database import verrou_ecriture
+import stock_cache
+import referentiel_cache
+from datetime import datetime, date, timedelta
 import math
 # ========================
 # GESTION DES FAMILLES DE PRODUITS
@@ -37,7 +42,10 @@ def delete_famille_produit(db: Session, famille_id: int):
 # GESTION DES PRODUITS
 # ========================
 def get_produits(db: Session):
-    return db.query(Produit).all()
+    return referentiel_cache.liste(db, Produit, ("tous",), lambda: db.query(Produit).all())
+
+def get_produit(db: Session, produit_id: int):
+    return referentiel_cache.get(db, Produit, produit_id)
 
 def create_produit(db: Session, produit_data: dict):
     db_produit = Produit(**produit_data)
@@ -92,11 +100,127 @@ def get_sales_for_product(db: Session, product_id: int, start_date: datetime, en
     ).scalar() or 0
 
 def get_initial_stock_for_product(db: Session, product_id: int, start_date: datetime):
-    """Récupère le stock initial d'un produit donné au début d'une période."""
-    return db.query(func.sum(Stock.quantite)).filter(
-        Stock.produit_id == product_id,
-        Stock.date_derniere_operation < start_date
-    ).scalar() or 0
+    """Récupère le stock initial d'un produit donné au début d'une période (toutes unités)."""
+    return sum(quantite for quantite, _ in get_stock_a_date(db, start_date, produit_id=product_id).values())
+
+
+# Rapport des mouvements de stock en une requête : stock initial (dernier
+# arrêté + mouvements jusqu'au début de la période) et flux de la période lus
+# dans un seul parcours de mouvements_stock, lignes par produit (paginées par
+# curseur (famille, code)) puis sous-totaux par famille (niveau 1) calculés
+# sur toute la sélection
+_MOUVEMENTS_STOCK_SQL = """
+    WITH arrete AS (
+        SELECT MAX(date_arrete) AS jour FROM stocks_instantanes WHERE date_arrete < :jour_debut
+    ),
+    instantanes AS (
+        SELECT produit_id, SUM(quantite) AS quantite FROM stocks_instantanes
+        WHERE date_arrete = (SELECT jour FROM arrete)
+        GROUP BY produit_id
+    ),
+    flux AS (
+        SELECT produit_id,
+               SUM(CASE WHEN date_mouvement < :debut THEN quantite ELSE 0 END) AS initial,
+               SUM(CASE WHEN date_mouvement >= :debut AND type_mouvement = 'PRODUCTION' THEN quantite ELSE 0 END) AS production,
+               -SUM(CASE WHEN date_mouvement >= :debut AND type_mouvement = 'CONSOMMATION' THEN quantite ELSE 0 END) AS consommation,
+               -SUM(CASE WHEN date_mouvement >= :debut AND type_mouvement = 'VENTE' THEN quantite ELSE 0 END) AS vente,
+               SUM(CASE WHEN date_mouvement >= :debut THEN quantite ELSE 0 END) AS variation
+        FROM mouvements_stock
+        WHERE date_mouvement >= IFNULL(date((SELECT jour FROM arrete), '+1 day'), '') AND date_mouvement < :fin
+        GROUP BY produit_id
+    ),
+    lignes AS (
+        SELECT p.id AS produit_id, p.code, p.designation, p.famille, IFNULL(p.prix_vente, 0) AS prix_vente,
+               IFNULL(i.quantite, 0) + IFNULL(f.initial, 0) AS stock_initial,
+               IFNULL(f.production, 0) AS production,
+               IFNULL(f.consommation, 0) AS consommation,
+               IFNULL(f.vente, 0) AS vente,
+               IFNULL(i.quantite, 0) + IFNULL(f.initial, 0) + IFNULL(f.variation, 0) AS stock_final
+        FROM produits p
+        LEFT JOIN instantanes i ON i.produit_id = p.id
+        LEFT JOIN flux f ON f.produit_id = p.id
+        {filtre_familles}
+    )
+    SELECT * FROM (
+        SELECT 0 AS niveau, produit_id, code, designation, famille, prix_vente,
+               stock_initial, production, consommation, vente, stock_final, NULL AS valeur
+        FROM lignes
+        {filtre_curseur}
+        ORDER BY IFNULL(famille, ''), code
+        LIMIT :limite
+    )
+    UNION ALL
+    SELECT 1, NULL, NULL, NULL, famille, NULL, SUM(stock_initial), SUM(production), SUM(consommation),
+           SUM(vente), SUM(stock_final), SUM(prix_vente * stock_final)
+    FROM lignes
+    GROUP BY famille
+"""
+
+
+def get_stock_movements(db: Session, start_date: date, end_date: date, familles: list = None,
+                        apres: tuple = None, limite: int = None):
+    """
+    Retourne les mouvements de stock de la période pour tous les produits :
+    stock initial, production, consommation, vente et stock final par produit,
+    ainsi que les sous-totaux par famille.
+    Avec limite, au plus `limite` lignes après le curseur apres = (famille ou
+    "", code) ; "suite" indique s'il en reste. Les sous-totaux et le total
+    général portent toujours sur toute la sélection.
+    Une seule requête (_MOUVEMENTS_STOCK_SQL) : stock initial depuis le dernier
+    arrêté comme get_stock_a_date, flux de la période par agrégation
+    conditionnelle, sous-totaux par famille en UNION ALL. Le stock final
+    inclut aussi les achats et ajustements de la période. Seuls les
+    mouvements écrits en base sont comptés.
+    """
+    debut = datetime.combine(start_date, datetime.min.time())
+    fin = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    requete = text(_MOUVEMENTS_STOCK_SQL.format(
+        filtre_familles="WHERE p.famille IN :familles" if familles else "",
+        filtre_curseur="WHERE (IFNULL(famille, ''), code) > (:famille_apres, :code_apres)" if apres else ""
+    )).bindparams(bindparam("debut", type_=DateTime), bindparam("fin", type_=DateTime),
+                  bindparam("jour_debut", type_=Date))
+    # une ligne de plus que demandé : indique s'il reste une page
+    parametres = {"debut": debut, "fin": fin, "jour_debut": start_date,
+                  "limite": limite + 1 if limite is not None else -1}
+    if apres:
+        parametres["famille_apres"], parametres["code_apres"] = apres
+    if familles:
+        requete = requete.bindparams(bindparam("familles", expanding=True))
+        parametres["familles"] = list(familles)
+
+    lignes = []
+    sous_totaux = {}
+    for row in db.execute(requete, parametres):
+        if row.niveau == 0:
+            lignes.append({
+                "produit_id": row.produit_id,
+                "code": row.code,
+                "designation": row.designation,
+                "famille": row.famille,
+                "prix_vente": float(row.prix_vente),
+                "stock_initial": row.stock_initial,
+                "production": row.production,
+                "consommation": row.consommation,
+                "vente": row.vente,
+                "stock_final": row.stock_final
+            })
+        else:
+            sous_totaux[row.famille] = {
+                "stock_initial": row.stock_initial,
+                "production": row.production,
+                "consommation": row.consommation,
+                "vente": row.vente,
+                "stock_final": row.stock_final,
+                "valeur": float(row.valeur)
+            }
+
+    return {
+        "lignes": lignes[:limite],
+        "familles": sous_totaux,
+        "total_general": sum(t["valeur"] for t in sous_totaux.values()),
+        "suite": limite is not None and len(lignes) > limite
+    }
+
 
 # ========================
 # GESTION DES CLIENTS
@@ -105,11 +229,11 @@ def get_clients(db: Session, actif_only=True):
     query = db.query(Client)
     if actif_only:
         query = query.filter(Client.actif == True)
-    return query.all()
+    return referentiel_cache.liste(db, Client, ("actifs" if actif_only else "tous",), query.all)
 
 
 def get_client(db: Session, client_id: int):
-    return db.query(Client).filter(Client.id == client_id).first()
+    return referentiel_cache.get(db, Client, client_id)
 
 
 def create_client(db: Session, client_data: dict):
@@ -137,11 +261,11 @@ def get_fournisseurs(db: Session, actif_only=True):
     query = db.query(Fournisseur)
     if actif_only:
         query = query.filter(Fournisseur.actif == True)
-    return query.all()
+    return referentiel_cache.liste(db, Fournisseur, ("actifs" if actif_only else "tous",), query.all)
 
 
 def get_fournisseur(db: Session, fournisseur_id: int):
-    return db.query(Fournisseur).filter(Fournisseur.id == fournisseur_id).first()
+    return referentiel_cache.get(db, Fournisseur, fournisseur_id)
 
 
 def create_fournisseur(db: Session, fournisseur_data: dict):
@@ -166,7 +290,8 @@ def update_fournisseur(db: Session, fournisseur_id: int, fournisseur_data: dict)
 # GESTION DES PARAMÈTRES
 # ========================
 def get_parametres_by_type(db: Session, type_param: str):
-    return db.query(Parametres).filter(Parametres.type_param == type_param).all()
+    return referentiel_cache.liste(db, Parametres, ("type", type_param),
+                                   db.query(Parametres).filter(Parametres.type_param == type_param).all)
 
 
 def create_parametre(db: Session, param_data: dict):
@@ -196,6 +321,44 @@ def create_compte(db: Session, compte_data: dict):
     return db_compte
 
 
+# ========================
+# CHARGEMENT EN MASSE
+# ========================
+def upsert_rows(db: Session, model, rows: list, cles: tuple, mise_a_jour: bool = True) -> dict:
+    """
+    Insère ou met à jour en masse des lignes identifiées par les colonnes `cles`
+    (aucune contrainte d'unicité requise) : une requête pour les lignes déjà en
+    base, puis un INSERT groupé pour les nouvelles et, si mise_a_jour, un
+    UPDATE groupé pour celles dont une valeur diffère. Ne valide pas la
+    transaction.
+
+    Retourne {"inseres": n, "mis_a_jour": n}.
+    """
+    colonnes = sorted(set().union(*rows) - set(cles)) if rows and mise_a_jour else []
+    existants = {}
+    for ligne in db.query(model.id, *[getattr(model, c) for c in list(cles) + colonnes]):
+        valeurs = dict(ligne._mapping)
+        existants[tuple(valeurs[c] for c in cles)] = valeurs
+
+    nouveaux, modifies = [], []
+    for row in rows:
+        cle = tuple(row[c] for c in cles)
+        existant = existants.get(cle)
+        if cle not in existants:
+            nouveaux.append(row)
+            existants[cle] = None  # une clé répétée dans rows n'est insérée qu'une fois
+        elif mise_a_jour and existant and any(existant[c] != v for c, v in row.items()):
+            modifies.append(dict(row, id=existant["id"]))
+
+    if nouveaux:
+        db.bulk_insert_mappings(model, nouveaux)
+    if modifies:
+        db.bulk_update_mappings(model, modifies)
+    if nouveaux or modifies:
+        referentiel_cache.invalider(model, db)  # écritures en masse : pas d'événement ORM
+    return {"inseres": len(nouveaux), "mis_a_jour": len(modifies)}
+
+
 # ========================
 # GESTION DU JOURNAL QUOTIDIEN
 # ========================
@@ -215,6 +378,151 @@ def get_journal_entries(db: Session, date_debut: date = None, date_fin: date = N
     return query.all()
 
 
+def get_journal_page(db: Session, after: tuple = None, limit: int = 200, type_journal: str = None):
+    """
+    Page du journal triée du plus récent au plus ancien, paginée par clé
+    (date_operation, id) : `after` est la clé de la dernière ligne de la page
+    précédente. Les noms du tiers et du produit sont ramenés par jointure.
+    """
+    query = db.query(*_journal_columns()).outerjoin(
+        Client, Client.id == JournalQuotidien.client_id
+    ).outerjoin(
+        Fournisseur, Fournisseur.id == JournalQuotidien.fournisseur_id
+    ).outerjoin(
+        Produit, Produit.id == JournalQuotidien.produit_id
+    )
+
+    if type_journal:
+        query = query.filter(JournalQuotidien.type_journal == type_journal)
+    if after:
+        date_operation, journal_id = after
+        query = query.filter(or_(
+            JournalQuotidien.date_operation < date_operation,
+            and_(JournalQuotidien.date_operation == date_operation, JournalQuotidien.id < journal_id)
+        ))
+
+    return query.order_by(
+        desc(JournalQuotidien.date_operation), desc(JournalQuotidien.id)
+    ).limit(limit).all()
+
+
+def _journal_columns():
+    """Colonnes affichées dans le tableau du journal, avec noms du tiers et du produit"""
+    return (
+        JournalQuotidien.id,
+        JournalQuotidien.date_operation,
+        JournalQuotidien.type_journal,
+        JournalQuotidien.numero_piece,
+        JournalQuotidien.libelle,
+        JournalQuotidien.quantite,
+        JournalQuotidien.montant_ttc,
+        func.coalesce(Client.nom, Fournisseur.nom, "").label("tiers"),
+        func.coalesce(Produit.designation, "").label("produit")
+    )
+
+
+def ensure_journal_fts(db: Session):
+    """Crée l'index plein texte du journal s'il manque (base existante) et l'alimente"""
+    existe = db.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal_fts'"
+    )).first()
+    if not existe:
+        rebuild_journal_fts(db)
+
+
+def ensure_indexes(db: Session):
+    """Crée les index déclarés dans les modèles qui manquent sur une base
+    existante (create_all ne touche pas aux tables déjà présentes).
+    Idempotent : ne crée que les index absents de sqlite_master."""
+    crees = []
+    for table_ in Base.metadata.sorted_tables:
+        for index in table_.indexes:
+            colonnes = ", ".join(c.name for c in index.columns)
+            unique = "UNIQUE " if index.unique else ""
+            existe = db.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :nom"
+            ), {"nom": index.name}).first()
+            if not existe:
+                db.execute(text(
+                    f"CREATE {unique}INDEX IF NOT EXISTS {index.name} ON {table_.name} ({colonnes})"
+                ))
+                crees.append(index.name)
+    db.commit()
+    return crees
+
+
+def ensure_versions_referentiel(db: Session):
+    """Crée les triggers de versions_referentiel qui manquent (base existante) ;
+    retourne True si au moins un a été créé"""
+    existants = db.execute(text(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_version_%'"
+    )).scalar()
+    if existants == len(VERSIONS_REFERENTIEL_DDL):
+        return False
+    for ddl in VERSIONS_REFERENTIEL_DDL:
+        db.execute(text(ddl))
+    db.commit()
+    return True
+
+
+def rebuild_journal_fts(db: Session):
+    """Reconstruit entièrement l'index plein texte du journal"""
+    for ddl in JOURNAL_FTS_DDL:
+        db.execute(text(ddl))
+    db.execute(text("DELETE FROM journal_fts"))
+    index_journal_fts(db)
+    db.commit()
+
+
+def index_journal_fts(db: Session, depuis_id: int = 0):
+    """Ajoute à l'index plein texte les lignes du journal d'id > depuis_id
+    (chargements en masse faits sans le trigger). Ne valide pas la transaction."""
+    db.execute(text("""
+        INSERT INTO journal_fts(rowid, numero_piece, libelle, tiers, produit)
+        SELECT j.id, j.numero_piece, j.libelle,
+               COALESCE(c.nom, f.nom, ''), COALESCE(p.designation, '')
+        FROM journal_quotidien j
+        LEFT JOIN clients c ON c.id = j.client_id
+        LEFT JOIN fournisseurs f ON f.id = j.fournisseur_id
+        LEFT JOIN produits p ON p.id = j.produit_id
+        WHERE j.id > :depuis_id
+    """), {"depuis_id": depuis_id})
+
+
+def search_journal(db: Session, search: str, type_journal: str = None, date_debut: date = None, date_fin: date = None, limit: int = 200):
+    """
+    Recherche plein texte (FTS5) dans le journal sur la pièce, le libellé, le
+    tiers et le produit. Chaque mot est cherché en préfixe, sans tenir compte
+    des accents ; les résultats sont classés par pertinence (bm25).
+    """
+    mots = [mot.replace('"', '""') for mot in search.split()]
+    if not mots:
+        return []
+    requete_fts = " ".join(f'"{mot}"*' for mot in mots)
+
+    journal_fts = table("journal_fts", column("rowid"), column("rank"))
+    query = db.query(*_journal_columns()).join(
+        journal_fts, journal_fts.c.rowid == JournalQuotidien.id
+    ).outerjoin(
+        Client, Client.id == JournalQuotidien.client_id
+    ).outerjoin(
+        Fournisseur, Fournisseur.id == JournalQuotidien.fournisseur_id
+    ).outerjoin(
+        Produit, Produit.id == JournalQuotidien.produit_id
+    ).filter(
+        literal_column("journal_fts").op("MATCH")(requete_fts)
+    )
+
+    if type_journal:
+        query = query.filter(JournalQuotidien.type_journal == type_journal)
+    if date_debut:
+        query = query.filter(JournalQuotidien.date_operation >= datetime.combine(date_debut, datetime.min.time()))
+    if date_fin:
+        query = query.filter(JournalQuotidien.date_operation <= datetime.combine(date_fin, datetime.max.time()))
+
+    return query.order_by(journal_fts.c.rank).limit(limit).all()
+
+
 def create_journal_entry(db: Session, journal_data: dict):
     db_journal = JournalQuotidien(**journal_data)
     db.add(db_journal)
@@ -223,6 +531,16 @@ def create_journal_entry(db: Session, journal_data: dict):
     return db_journal
 
 
+def update_journal_entry(db: Session, journal_id: int, journal_data: dict):
+    db_journal = db.query(JournalQuotidien).filter(JournalQuotidien.id == journal_id).first()
+    if db_journal:
+        for key, value in journal_data.items():
+            setattr(db_journal, key, value)
+        db.commit()
+        db.refresh(db_journal)
+    return db_journal
+
+
 # ========================
 # GESTION DES ÉCRITURES COMPTABLES
 # ========================
@@ -243,6 +561,9 @@ def get_ecritures_comptables(db: Session, date_debut: date = None, date_fin: dat
 def create_ecriture_comptable(db: Session, ecriture_data: dict):
     db_ecriture = EcritureComptable(**ecriture_data)
     db.add(db_ecriture)
+    appliquer_soldes_tresorerie(db, [ecriture_data])
+    from services.ledger import appliquer_soldes_comptes
+    appliquer_soldes_comptes(db, [ecriture_data])
     db.commit()
     db.refresh(db_ecriture)
     return db_ecriture
@@ -251,12 +572,14 @@ def create_ecriture_comptable(db: Session, ecriture_data: dict):
 # ========================
 # GESTION DES FACTURES
 # ========================
-def get_factures(db: Session, client_id: int = None, statut: str = None):
-    query = db.query(Facture).order_by(desc(Facture.date_facture))
+def get_factures(db: Session, client_id: int = None, statut: str = None, limit: int = None, offset: int = 0):
+    query = db.query(Facture).order_by(desc(Facture.date_facture), desc(Facture.id))
     if client_id:
         query = query.filter(Facture.client_id == client_id)
     if statut:
         query = query.filter(Facture.statut == statut)
+    if limit is not None:
+        query = query.offset(offset).limit(limit)
     return query.all()
 
 
@@ -264,21 +587,76 @@ def get_facture(db: Session, facture_id: int):
     return db.query(Facture).filter(Facture.id == facture_id).first()
 
 
-def generer_numero_facture(db: Session) -> str:
-    """Génère un numéro de facture au format FACT-2025/0001"""
-    annee = datetime.now().year
-    seq = db.query(Sequence).filter(Sequence.annee == annee).first()
-    if not seq:
-        seq = Sequence(annee=annee, dernier_numero=0)
-        db.add(seq)
-        db.commit()
-    seq.dernier_numero += 1
+def get_bls_non_factures(db: Session, client_id: int, date_debut: date, date_fin: date):
+    """BL (ventes) d'un client non encore facturés sur la période.
+    L'ordre des filtres suit l'index ix_journal_client_type_facture."""
+    return db.query(JournalQuotidien).filter(
+        JournalQuotidien.client_id == client_id,
+        JournalQuotidien.type_journal == "VENTE",
+        JournalQuotidien.facture_id.is_(None),
+        JournalQuotidien.date_operation >= datetime.combine(date_debut, datetime.min.time()),
+        JournalQuotidien.date_operation <= datetime.combine(date_fin, datetime.max.time())
+    ).order_by(JournalQuotidien.date_operation, JournalQuotidien.id).all()
+
+
+PREFIXES_DOCUMENTS = {"FACTURE": "FACT", "AVOIR": "AV", "BL": "BL"}
+
+
+def reserver_numeros(db: Session, nombre: int = 1, type_document: str = "FACTURE", annee: int = None) -> list:
+    """
+    Réserve `nombre` numéros consécutifs pour un type de document et une année.
+
+    Une seule instruction (INSERT ... ON CONFLICT DO UPDATE ... RETURNING) :
+    l'incrément est atomique et prend le verrou d'écriture SQLite, deux
+    transactions ne peuvent donc pas obtenir le même numéro. La réservation
+    est validée avec la transaction de l'appelant (pas de trou en cas d'annulation).
+    Retourne les numéros formatés, ex. ["FACT-2025/0001", ...].
+    """
+    if nombre < 1:
+        raise ValueError("Le nombre de numéros à réserver doit être positif")
+    if type_document not in PREFIXES_DOCUMENTS:
+        raise ValueError(f"Type de document inconnu : {type_document}")
+    annee = annee or datetime.now().year
+
+    dernier = db.execute(text("""
+        INSERT INTO sequences (type_document, annee, dernier_numero)
+        VALUES (:type_document, :annee, :nombre)
+        ON CONFLICT (type_document, annee)
+        DO UPDATE SET dernier_numero = dernier_numero + excluded.dernier_numero
+        RETURNING dernier_numero
+    """), {"type_document": type_document, "annee": annee, "nombre": nombre}).scalar()
+
+    prefixe = PREFIXES_DOCUMENTS[type_document]
+    return [f"{prefixe}-{annee}/{numero:04d}" for numero in range(dernier - nombre + 1, dernier + 1)]
+
+
+def generer_numero_facture(db: Session, type_document: str = "FACTURE") -> str:
+    """Génère un numéro au format FACT-2025/0001 (validé avec le document)"""
+    return reserver_numeros(db, 1, type_document)[0]
+
+
+def ensure_sequences_par_type(db: Session):
+    """
+    Migration des bases existantes : la séquence devient unique par
+    (type_document, annee). SQLite ne sait pas retirer la contrainte UNIQUE
+    sur annee, la table est donc recréée et les compteurs recopiés en FACTURE.
+    """
+    colonnes = {ligne[1] for ligne in db.execute(text("PRAGMA table_info(sequences)"))}
+    if "type_document" in colonnes:
+        return False
+    db.execute(text("ALTER TABLE sequences RENAME TO sequences_old"))
+    Sequence.__table__.create(bind=db.connection())
+    db.execute(text(
+        "INSERT INTO sequences (id, type_document, annee, dernier_numero) "
+        "SELECT id, 'FACTURE', annee, dernier_numero FROM sequences_old"
+    ))
+    db.execute(text("DROP TABLE sequences_old"))
     db.commit()
-    return f"FACT-{annee}/{seq.dernier_numero:04d}"
+    return True
 
 
 def create_facture(db: Session, facture_data: dict):
-    # Générer automatiquement le numéro
+    # Générer automatiquement le numéro (validé avec la facture, en un seul commit)
     if "numero_facture" not in facture_data or not facture_data["numero_facture"]:
         facture_data["numero_facture"] = generer_numero_facture(db)
 
@@ -330,8 +708,65 @@ def get_stock_actuel(db: Session, produit_id: int, unite_production: str = None)
     return query.first()
 
 
-def update_stock(db: Session, produit_id: int, unite_production: str, quantite: float, cout_unitaire: float = None):
-    """Met à jour le stock avec CMP"""
+def appliquer_mouvement(quantite: float, cmp: float, delta: float, cout_unitaire: float = None):
+    """
+    Quantité et CMP après un mouvement de `delta` (signé).
+    Une entrée est valorisée à `cout_unitaire` (au CMP actuel s'il est absent)
+    et recalcule le CMP ; une sortie est valorisée au CMP, qui reste inchangé.
+    Le stock ne descend pas sous zéro ; vidé, son CMP revient à 0.
+    Retourne (quantite, cmp, quantite_mouvement, valeur_mouvement).
+    """
+    if delta > 0:
+        cout = cmp if cout_unitaire is None else float(cout_unitaire)
+        nouvelle_quantite = quantite + delta
+        valeur = delta * cout
+        if nouvelle_quantite > 0:
+            cmp = (quantite * cmp + valeur) / nouvelle_quantite
+    else:
+        nouvelle_quantite = max(0, quantite + delta)
+        delta = nouvelle_quantite - quantite
+        valeur = delta * cmp
+    if nouvelle_quantite <= 0:
+        cmp = 0
+    return nouvelle_quantite, cmp, delta, valeur
+
+
+def update_stock(db: Session, produit_id: int, unite_production: str, quantite: float, cout_unitaire: float = None,
+                 commit: bool = True, type_mouvement: str = "AJUSTEMENT", date_mouvement: datetime = None,
+                 journal_id: int = None):
+    """
+    Met à jour le stock avec CMP et enregistre le mouvement correspondant
+    dans mouvements_stock (daté de date_mouvement, maintenant par défaut).
+    Avec commit=False, la modification reste dans la transaction en cours
+    (utilisé par la comptabilisation par lot).
+
+    Si le cache des stocks est actif (stock_cache), le mouvement est appliqué
+    en mémoire et écrit à la validation de la transaction ; la ligne de
+    stocks n'est alors retournée qu'avec commit=True.
+    """
+    date_mouvement = date_mouvement or datetime.now()
+    # Verrou d'écriture pris avant de lire le stock : aucune autre connexion ne
+    # peut modifier la ligne en base d'ici la validation, et le cache relit la
+    # ligne en base au premier mouvement de la transaction
+    verrou_ecriture(db)
+    if stock_cache.actif():
+        actuel = stock_cache.lire(db, produit_id, unite_production, relire=True) or (0.0, float(cout_unitaire or 0))
+        nouvelle_quantite, cmp, delta, valeur = appliquer_mouvement(actuel[0], actuel[1], quantite, cout_unitaire)
+        stock_cache.enregistrer(db, produit_id, unite_production, nouvelle_quantite, cmp, {
+            "date_mouvement": date_mouvement,
+            "produit_id": produit_id,
+            "unite_production": unite_production,
+            "type_mouvement": type_mouvement,
+            "quantite": delta,
+            "cout_unitaire": cout_unitaire if quantite > 0 else None,
+            "valeur": valeur,
+            "journal_id": journal_id
+        })
+        if commit:
+            db.commit()
+            return get_stock_actuel(db, produit_id, unite_production)
+        return None
+
     stock = get_stock_actuel(db, produit_id, unite_production)
     if not stock:
         stock = Stock(
@@ -343,24 +778,92 @@ def update_stock(db: Session, produit_id: int, unite_production: str, quantite:
         )
         db.add(stock)
 
-    ancienne_valeur = stock.quantite * stock.cout_unitaire_moyen
-    nouvelle_quantite = stock.quantite + quantite
-    nouvelle_valeur = ancienne_valeur + (quantite * cout_unitaire if cout_unitaire else 0)
-
-    if nouvelle_quantite > 0:
-        stock.cout_unitaire_moyen = nouvelle_valeur / nouvelle_quantite
-    else:
-        stock.cout_unitaire_moyen = 0
-
-    stock.quantite = max(0, nouvelle_quantite)
-    stock.valeur_stock = stock.quantite * stock.cout_unitaire_moyen
+    nouvelle_quantite, cmp, delta, valeur = appliquer_mouvement(
+        stock.quantite or 0, float(stock.cout_unitaire_moyen or 0), quantite, cout_unitaire)
+    stock.quantite = nouvelle_quantite
+    stock.cout_unitaire_moyen = cmp
+    stock.valeur_stock = nouvelle_quantite * cmp
     stock.date_derniere_operation = datetime.now()
 
-    db.commit()
-    db.refresh(stock)
+    db.add(MouvementStock(
+        date_mouvement=date_mouvement,
+        produit_id=produit_id,
+        unite_production=unite_production,
+        type_mouvement=type_mouvement,
+        quantite=delta,
+        cout_unitaire=cout_unitaire if quantite > 0 else None,
+        valeur=valeur,
+        journal_id=journal_id
+    ))
+    if date_mouvement.date() < date.today():
+        # Mouvement antidaté : les arrêtés postérieurs sont à refaire
+        db.query(InstantaneStock).filter(
+            InstantaneStock.date_arrete >= date_mouvement.date()
+        ).delete(synchronize_session=False)
+
+    if commit:
+        db.commit()
+        db.refresh(stock)
     return stock
 
 
+def get_stock_courant(db: Session, produit_id: int, unite_production: str):
+    """(quantite, cmp) d'un produit dans une unité, mouvements non encore écrits compris ; None sans stock"""
+    if stock_cache.actif():
+        return stock_cache.lire(db, produit_id, unite_production)
+    stock = get_stock_actuel(db, produit_id, unite_production)
+    return (stock.quantite or 0, float(stock.cout_unitaire_moyen or 0)) if stock else None
+
+
+def get_stock_a_date(db: Session, date_ref: datetime, produit_id: int = None, unite_production: str = None):
+    """
+    Stock (quantité, valeur) par (produit_id, unite_production) avant date_ref :
+    dernier arrêté antérieur au jour de date_ref, plus les mouvements compris
+    entre cet arrêté et date_ref (une lecture d'index par requête), plus ceux
+    de la transaction en cours que le cache des stocks n'a pas encore écrits.
+    """
+    arrete = db.query(func.max(InstantaneStock.date_arrete)).filter(
+        InstantaneStock.date_arrete < date_ref.date()
+    ).scalar()
+
+    stocks = {}
+    if arrete:
+        query = db.query(InstantaneStock.produit_id, InstantaneStock.unite_production,
+                         InstantaneStock.quantite, InstantaneStock.valeur_stock).filter(
+            InstantaneStock.date_arrete == arrete)
+        if produit_id is not None:
+            query = query.filter(InstantaneStock.produit_id == produit_id)
+        if unite_production:
+            query = query.filter(InstantaneStock.unite_production == unite_production)
+        for pid, unite, quantite, valeur in query:
+            stocks[(pid, unite)] = [quantite, float(valeur or 0)]
+
+    query = db.query(
+        MouvementStock.produit_id, MouvementStock.unite_production,
+        func.sum(MouvementStock.quantite), func.sum(MouvementStock.valeur)
+    ).filter(MouvementStock.date_mouvement < date_ref)
+    if arrete:
+        query = query.filter(MouvementStock.date_mouvement >= datetime.combine(arrete + timedelta(days=1), datetime.min.time()))
+    if produit_id is not None:
+        query = query.filter(MouvementStock.produit_id == produit_id)
+    if unite_production:
+        query = query.filter(MouvementStock.unite_production == unite_production)
+    for pid, unite, quantite, valeur in query.group_by(MouvementStock.produit_id, MouvementStock.unite_production):
+        stock = stocks.setdefault((pid, unite), [0.0, 0.0])
+        stock[0] += quantite or 0
+        stock[1] += float(valeur or 0)
+
+    for mouvement in stock_cache.mouvements_en_attente(db):
+        if (mouvement["date_mouvement"] < date_ref
+                and (produit_id is None or mouvement["produit_id"] == produit_id)
+                and (not unite_production or mouvement["unite_production"] == unite_production)):
+            stock = stocks.setdefault((mouvement["produit_id"], mouvement["unite_production"]), [0.0, 0.0])
+            stock[0] += mouvement["quantite"]
+            stock[1] += mouvement["valeur"]
+
+    return {cle: (quantite, valeur) for cle, (quantite, valeur) in stocks.items()}
+
+
 # ========================
 # GESTION DES UNITÉS DE PRODUCTION
 # ========================
@@ -388,19 +891,150 @@ def calcul_droit_timbre(montant: float) -> float:
 # ========================
 # GESTION DE LA TRÉSORERIE
 # ========================
-def get_balance_tresorerie(db: Session):
-    """Calcule la balance de trésorerie (caisse + banque)"""
-    encaissements = db.query(func.sum(EcritureComptable.montant)).filter(
-        EcritureComptable.compte_debit.like('5%'),
-        EcritureComptable.compte_credit.like('4%')
-    ).scalar() or 0
+def get_balance_tresorerie(db: Session, date_fin: date = None):
+    """
+    Calcule la balance de trésorerie (caisse + banque) : encaissements
+    (débit 5 / crédit 4) moins décaissements (débit 4 / crédit 5).
+    Sans date, lue dans les cumuls soldes_tresorerie ; à une date, une seule
+    requête sur l'index (classe_debit, classe_credit, date_comptable).
+    """
+    if date_fin is None:
+        encaissements, decaissements = db.query(
+            func.coalesce(func.sum(SoldeTresorerie.encaissements), 0),
+            func.coalesce(func.sum(SoldeTresorerie.decaissements), 0)
+        ).one()
+        return encaissements - decaissements
+
+    encaissement = and_(EcritureComptable.classe_debit == "5", EcritureComptable.classe_credit == "4")
+    return db.query(func.coalesce(func.sum(case(
+        (encaissement, EcritureComptable.montant),
+        else_=-EcritureComptable.montant
+    )), 0)).filter(
+        or_(encaissement,
+            and_(EcritureComptable.classe_debit == "4", EcritureComptable.classe_credit == "5")),
+        EcritureComptable.date_comptable <= date_fin
+    ).scalar()
+
+
+def appliquer_soldes_tresorerie(db: Session, ecritures: list):
+    """Reporte des écritures (dictionnaires) dans soldes_tresorerie, sans valider"""
+    deltas = {}
+    for ecriture in ecritures:
+        debit, credit = ecriture["compte_debit"], ecriture["compte_credit"]
+        montant = float(ecriture["montant"] or 0)
+        if debit[:1] == "5" and credit[:1] == "4":
+            deltas.setdefault(debit, [0.0, 0.0])[0] += montant
+        elif debit[:1] == "4" and credit[:1] == "5":
+            deltas.setdefault(credit, [0.0, 0.0])[1] += montant
+
+    table_ = SoldeTresorerie.__table__
+    for compte, (encaissements, decaissements) in deltas.items():
+        stmt = sqlite_insert(table_).values(
+            compte=compte, encaissements=encaissements, decaissements=decaissements, date_maj=datetime.now()
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["compte"],
+            set_={
+                "encaissements": table_.c.encaissements + stmt.excluded.encaissements,
+                "decaissements": table_.c.decaissements + stmt.excluded.decaissements,
+                "date_maj": stmt.excluded.date_maj
+            }
+        ))
+
+
+def rebuild_soldes_tresorerie(db: Session):
+    """Recalcule soldes_tresorerie à partir de toutes les écritures"""
+    encaissement = and_(EcritureComptable.classe_debit == "5", EcritureComptable.classe_credit == "4")
+    decaissement = and_(EcritureComptable.classe_debit == "4", EcritureComptable.classe_credit == "5")
+    compte = case((encaissement, EcritureComptable.compte_debit), else_=EcritureComptable.compte_credit)
+    agregats = db.query(
+        compte,
+        func.sum(case((encaissement, EcritureComptable.montant), else_=0)),
+        func.sum(case((decaissement, EcritureComptable.montant), else_=0)),
+        func.datetime("now", "localtime")
+    ).filter(or_(encaissement, decaissement)).group_by(compte)
+
+    db.query(SoldeTresorerie).delete(synchronize_session=False)
+    db.execute(SoldeTresorerie.__table__.insert().from_select(
+        ["compte", "encaissements", "decaissements", "date_maj"], agregats.statement
+    ))
+    db.commit()
 
-    decaissements = db.query(func.sum(EcritureComptable.montant)).filter(
-        EcritureComptable.compte_debit.like('4%'),
-        EcritureComptable.compte_credit.like('5%')
-    ).scalar() or 0
 
-    return encaissements - decaissements
+def ensure_classes_ecritures(db: Session):
+    """
+    Migration des bases existantes : ajoute classe_debit / classe_credit à
+    ecritures_comptables, les renseigne, puis recalcule soldes_tresorerie.
+    """
+    colonnes = {ligne[1] for ligne in db.execute(text("PRAGMA table_info(ecritures_comptables)"))}
+    if "classe_debit" in colonnes and "classe_credit" in colonnes:
+        return False
+    for colonne in ("classe_debit", "classe_credit"):
+        if colonne not in colonnes:
+            db.execute(text(f"ALTER TABLE ecritures_comptables ADD COLUMN {colonne} VARCHAR(1)"))
+    db.execute(text(
+        "UPDATE ecritures_comptables SET classe_debit = substr(compte_debit, 1, 1), "
+        "classe_credit = substr(compte_credit, 1, 1)"
+    ))
+    rebuild_soldes_tresorerie(db)
+    return True
+
+
+def _filtre_periode_tresorerie(query, date_debut: date = None, date_fin: date = None):
+    if date_debut:
+        query = query.filter(Tresorerie.date_operation >= date_debut)
+    if date_fin:
+        query = query.filter(Tresorerie.date_operation <= date_fin)
+    return query
+
+
+def get_tresorerie_operations(db: Session, date_debut: date = None, date_fin: date = None,
+                              after: tuple = None, limit: int = 200):
+    """
+    Opérations de trésorerie de la période (plus récentes d'abord), paginées par
+    clé (date_operation, id) comme le journal : `after` est la clé de la dernière
+    ligne de la page précédente. Le nom du client ou du fournisseur est ramené
+    par jointure.
+    """
+    query = db.query(
+        Tresorerie.id,
+        Tresorerie.date_operation,
+        Tresorerie.type_operation,
+        Tresorerie.mode_paiement,
+        Tresorerie.montant,
+        Tresorerie.libelle,
+        Tresorerie.numero_piece,
+        func.coalesce(Client.nom, Fournisseur.nom, "").label("tiers")
+    ).outerjoin(
+        Client, Client.id == Tresorerie.client_id
+    ).outerjoin(
+        Fournisseur, Fournisseur.id == Tresorerie.fournisseur_id
+    )
+    query = _filtre_periode_tresorerie(query, date_debut, date_fin)
+    if after:
+        date_operation, tresorerie_id = after
+        query = query.filter(or_(
+            Tresorerie.date_operation < date_operation,
+            and_(Tresorerie.date_operation == date_operation, Tresorerie.id < tresorerie_id)
+        ))
+
+    return query.order_by(
+        desc(Tresorerie.date_operation), desc(Tresorerie.id)
+    ).limit(limit).all()
+
+
+def get_tresorerie_totaux(db: Session, date_debut: date = None, date_fin: date = None):
+    """Totaux des encaissements et décaissements de la période (une requête agrégée)"""
+    query = db.query(
+        func.coalesce(func.sum(case((Tresorerie.type_operation == "ENCAISSEMENT", Tresorerie.montant), else_=0)), 0),
+        func.coalesce(func.sum(case((Tresorerie.type_operation == "DECAISSEMENT", Tresorerie.montant), else_=0)), 0)
+    )
+    encaissements, decaissements = _filtre_periode_tresorerie(query, date_debut, date_fin).one()
+    return {
+        "encaissements": encaissements,
+        "decaissements": decaissements,
+        "solde": encaissements - decaissements
+    }
 
 
 # ========================
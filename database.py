@@ -1,15 +1,90 @@
 # database.py
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # Utilisation de SQLite pour simplicité
-SQLALCHEMY_DATABASE_URL = "sqlite:///./bois_m.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("BOIS_M_DATABASE_URL", "sqlite:///./bois_m.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Profils de réglage SQLite : PRAGMA appliqués à chaque nouvelle connexion.
+# - "defaut" : réglages d'origine de SQLite (journal DELETE, synchronous FULL)
+# - "performance" : WAL (les lecteurs ne bloquent plus l'écrivain), un seul fsync
+#   aux points de contrôle, cache et mmap dimensionnés, temporaires en mémoire
+SQLITE_PROFILES = {
+    "defaut": {
+        "busy_timeout": 5000,
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # en Kio (64 Mio)
+        "mmap_size": 268435456,  # 256 Mio
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+SQLITE_PROFILE = os.environ.get("BOIS_M_SQLITE_PROFILE", "performance")
+
+# Instructions qui ouvrent une transaction d'écriture (BEGIN IMMEDIATE)
+ECRITURES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "SAVEPOINT", "CREATE", "DROP", "ALTER")
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = SQLITE_PROFILE):
+    """Crée un moteur SQLite configuré selon un profil de SQLITE_PROFILES"""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Profil SQLite inconnu : {profile}")
+    pragmas = SQLITE_PROFILES[profile]
+
+    db_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(db_engine, "connect")
+    def _sqlite_connect(dbapi_connection, connection_record):
+        # pysqlite n'émet pas de BEGIN avant un SAVEPOINT : les transactions sont
+        # ouvertes par _sqlite_begin_ecriture pour que les SAVEPOINT (comptabilisation
+        # par lot) fonctionnent.
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma, valeur in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {valeur}")
+        cursor.close()
+
+    # Les lectures restent en autocommit (comme pysqlite par défaut) ; la transaction
+    # SQLite commence à la première écriture, par BEGIN IMMEDIATE : le verrou
+    # d'écriture est attendu (busy_timeout) avant toute lecture. Avec un BEGIN
+    # différé, une écriture qui lit d'abord la base (déclencheurs FTS5 de
+    # journal_fts) échoue aussitôt en « database is locked » si un autre écrivain
+    # a validé entre-temps.
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def _sqlite_begin_ecriture(conn, cursor, statement, parameters, context, executemany):
+        if not cursor.connection.in_transaction and statement.lstrip()[:9].upper().startswith(ECRITURES):
+            cursor.execute("BEGIN IMMEDIATE")
+
+    return db_engine
+
+
+def verrou_ecriture(db):
+    """Ouvre la transaction SQLite de la session par BEGIN IMMEDIATE si elle ne l'est
+    pas encore : les lectures qui suivent en base se font sous le verrou d'écriture.
+    Les caches en mémoire du processus (stock_cache, referentiel_cache) ne sont
+    pas couverts par ce verrou : ils vérifient eux-mêmes les écritures des autres
+    processus."""
+    connexion = db.connection().connection.connection  # connexion sqlite3 (SQLAlchemy 1.4.22)
+    if not connexion.in_transaction:
+        connexion.execute("BEGIN IMMEDIATE")
+
+
+engine = create_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Instrumentation SQL optionnelle : BOIS_M_SQL_STATS = seuil des requêtes lentes (ms),
+# rapport affiché à la fin du processus (voir instrumentation.py)
+if os.environ.get("BOIS_M_SQL_STATS"):
+    import atexit
+    import instrumentation
+    _sql_stats = instrumentation.enable(engine, seuil_lent_ms=float(os.environ["BOIS_M_SQL_STATS"]))
+    atexit.register(lambda: print(_sql_stats.format_report()))
+
 Base = declarative_base()
@@ -1,332 +1,177 @@
 # init_db.py
 import os
+import json
 from datetime import datetime, date
+from sqlalchemy import text
 from database import SessionLocal, engine
 import models
 import crud
+from services import accounting, comptabilisation, ledger, stocks
 
-# Créer toutes les tables
-models.Base.metadata.create_all(bind=engine)
+# Version du schéma et des données de référence, conservée dans
+# PRAGMA user_version. À incrémenter à chaque nouveau modèle, index ou
+# migration ensure_* : une base déjà à jour démarre sans aucune vérification.
+SCHEMA_VERSION = 8
 
+# Plan comptable, paramètres et données de démonstration
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "seed.json")
 
-def init_database():
-    db = SessionLocal()
-    try:
-        print("=== Initialisation de la base de données bois_m v2 ===")
-        print(f"Date et heure : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # 1. Vérifier si le plan comptable existe déjà
-        if not crud.get_all_comptes(db):
-            print("- Création du plan comptable algérien (classes 1 à 8)...")
-
-            # Classe 1 : Capital
-            crud.create_compte(db, {
-                "compte": "10", "libelle": "Capital", "classe": 1, "type_compte": "CAPITAL", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "11", "libelle": "Réserves", "classe": 1, "type_compte": "CAPITAL", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "12", "libelle": "Report à nouveau", "classe": 1, "type_compte": "CAPITAL", "niveau": 1
-            })
-
-            # Classe 2 : Immobilisations
-            crud.create_compte(db, {
-                "compte": "20", "libelle": "Immobilisations incorporelles", "classe": 2, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "21", "libelle": "Immobilisations corporelles", "classe": 2, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "23", "libelle": "Immobilisations en cours", "classe": 2, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "27", "libelle": "Ecarts de conversion - Actif", "classe": 2, "type_compte": "ACTIF", "niveau": 1
-            })
-
-            # Classe 3 : Stocks et en-cours
-            crud.create_compte(db, {
-                "compte": "31", "libelle": "Matières premières", "classe": 3, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "35", "libelle": "Produits finis", "classe": 3, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "38", "libelle": "Autres approvisionnements", "classe": 3, "type_compte": "ACTIF", "niveau": 1
-            })
-
-            # Classes 4 et 5 : Tiers et Trésorerie
-            crud.create_compte(db, {
-                "compte": "41", "libelle": "Clients", "classe": 4, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "40", "libelle": "Fournisseurs", "classe": 4, "type_compte": "PASSIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "51", "libelle": "Banques", "classe": 5, "type_compte": "ACTIF", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "53", "libelle": "Caisses", "classe": 5, "type_compte": "ACTIF", "niveau": 1
-            })
-
-            # Comptes détaillés
-            # Clients par défaut
-            crud.create_compte(db, {
-                "compte": "411000", "libelle": "Clients - Ventes", "classe": 4, "type_compte": "ACTIF", "niveau": 2
-            })
-            # Fournisseurs par défaut
-            crud.create_compte(db, {
-                "compte": "401000", "libelle": "Fournisseurs - Achats", "classe": 4, "type_compte": "PASSIF", "niveau": 2
-            })
-            # Caisse par défaut
-            crud.create_compte(db, {
-                "compte": "530000", "libelle": "Caisse principale", "classe": 5, "type_compte": "ACTIF", "niveau": 2
-            })
-
-            # TVA
-            crud.create_compte(db, {
-                "compte": "4456", "libelle": "TVA déductible sur achats", "classe": 4, "type_compte": "ACTIF", "niveau": 2
-            })
-            crud.create_compte(db, {
-                "compte": "4457", "libelle": "TVA collectée", "classe": 4, "type_compte": "PASSIF", "niveau": 2
-            })
-            # Droit de timbre
-            crud.create_compte(db, {
-                "compte": "4458", "libelle": "Droit de Timbre", "classe": 4, "type_compte": "PASSIF", "niveau": 2
-            })
-
-            # Classe 6 : Charges
-            crud.create_compte(db, {
-                "compte": "60", "libelle": "Achats", "classe": 6, "type_compte": "CHARGE", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "61", "libelle": "Services extérieurs", "classe": 6, "type_compte": "CHARGE", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "62", "libelle": "Autres services extérieurs", "classe": 6, "type_compte": "CHARGE", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "64", "libelle": "Charges de personnel", "classe": 6, "type_compte": "CHARGE", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "68", "libelle": "Dotations aux amortissements", "classe": 6, "type_compte": "CHARGE", "niveau": 1
-            })
-
-            # Classe 7 : Produits
-            crud.create_compte(db, {
-                "compte": "70", "libelle": "Ventes", "classe": 7, "type_compte": "PRODUIT", "niveau": 1
-            })
-            crud.create_compte(db, {
-                "compte": "71", "libelle": "Production stockée", "classe": 7, "type_compte": "PRODUIT", "niveau": 1
-            })
-
-            print("✅ Plan comptable créé avec succès.")
-        else:
-            print("- Plan comptable déjà existant. Skipping.")
-
-        # 2. Initialiser les paramètres
-        if not db.query(models.Parametres).filter(models.Parametres.type_param == "famille_produit").first():
-            print("- Création des familles de produits...")
-            familles = [
-                ("famille_produit", "MP", "Matière première"),
-                ("famille_produit", "SF", "Semi-fini"),
-                ("famille_produit", "PF", "Produit fini"),
-                ("famille_produit", "déchet", "Déchet"),
-            ]
-            for type_param, valeur, description in familles:
-                crud.create_parametre(db, {
-                    "type_param": type_param,
-                    "valeur": valeur,
-                    "description": description
-                })
-            print("✅ Familles de produits créées.")
 
-        if not db.query(models.Parametres).filter(models.Parametres.type_param == "unite_production").first():
-            print("- Création des unités de production...")
-            unites = [
-                ("unite_production", "Scierie", "Unité de sciage du bois"),
-                ("unite_production", "Déroulage", "Unité de déroulage"),
-                ("unite_production", "Atelier Nord", "Atelier de finition"),
-                ("unite_production", "Broyeur", "Unité de broyage des déchets"),
-            ]
-            for type_param, valeur, description in unites:
-                crud.create_parametre(db, {
-                    "type_param": type_param,
-                    "valeur": valeur,
-                    "description": description
-                })
-            print("✅ Unités de production créées.")
+def get_schema_version(db) -> int:
+    return db.execute(text("PRAGMA user_version")).scalar()
 
-        if not db.query(models.Parametres).filter(models.Parametres.type_param == "unite_mesure").first():
-            print("- Création des unités de mesure...")
-            unites_mesure = [
-                ("unite_mesure", "m³", "mètre cube"),
-                ("unite_mesure", "pièces", "unité"),
-                ("unite_mesure", "kg", "kilogramme"),
-                ("unite_mesure", "planches", "planches"),
-            ]
-            for type_param, valeur, description in unites_mesure:
-                crud.create_parametre(db, {
-                    "type_param": type_param,
-                    "valeur": valeur,
-                    "description": description
-                })
-            print("✅ Unités de mesure créées.")
 
-        # 3. Créer une séquence pour les factures si elle n'existe pas
-        current_year = datetime.now().year
-        if not db.query(models.Sequence).filter(models.Sequence.annee == current_year).first():
-            db_sequence = models.Sequence(annee=current_year, dernier_numero=0)
-            db.add(db_sequence)
-            db.commit()
-            print(f"✅ Séquence de facturation initialisée pour {current_year}.")
+def load_seed_data(chemin: str = SEED_FILE) -> dict:
+    with open(chemin, encoding="utf-8") as fichier:
+        return json.load(fichier)
 
-        # 4. Ajouter des données de test si la base est vide
-        if not crud.get_produits(db):
-            print("- Ajout des produits de test...")
-            produits = [
-                {
-                    "code": "MP001",
-                    "designation": "Bois de Chêne",
-                    "famille": "MP",
-                    "unite_mesure": "m³",
-                    "prix_achat": 500,
-                    "prix_vente": 700,
-                    "taux_tva": 19,
-                    "compte_stock": "311001",
-                    "compte_achat": "601001",
-                    "compte_vente": "701001"
-                },
-                {
-                    "code": "MP002",
-                    "designation": "Bois de Pin",
-                    "famille": "MP",
-                    "unite_mesure": "m³",
-                    "prix_achat": 300,
-                    "prix_vente": 450,
-                    "taux_tva": 19,
-                    "compte_stock": "311001",
-                    "compte_achat": "601001",
-                    "compte_vente": "701001"
-                },
-                {
-                    "code": "SF001",
-                    "designation": "Planches sciées",
-                    "famille": "SF",
-                    "unite_mesure": "planches",
-                    "prix_vente": 200,
-                    "taux_tva": 19,
-                    "compte_stock": "351001",
-                    "compte_vente": "701004"
-                },
-                {
-                    "code": "PF001",
-                    "designation": "Table en Chêne",
-                    "famille": "PF",
-                    "unite_mesure": "pièces",
-                    "prix_vente": 1200,
-                    "taux_tva": 19,
-                    "compte_stock": "351002",
-                    "compte_vente": "701002"
-                },
-                {
-                    "code": "PF002",
-                    "designation": "Chaise en Pin",
-                    "famille": "PF",
-                    "unite_mesure": "pièces",
-                    "prix_vente": 350,
-                    "taux_tva": 19,
-                    "compte_stock": "351002",
-                    "compte_vente": "701002"
-                },
-                {
-                    "code": "DECH001",
-                    "designation": "Copeaux de bois",
-                    "famille": "déchet",
-                    "unite_mesure": "kg",
-                    "prix_vente": 10,
-                    "taux_tva": 19,
-                    "compte_stock": "351003",
-                    "compte_vente": "701003"
-                }
-            ]
-            for prod in produits:
-                crud.create_produit(db, prod)
-            print("✅ Produits de test ajoutés.")
 
-        # 5. Ajouter des clients de test
-        if not crud.get_clients(db):
-            print("- Ajout des clients de test...")
-            clients = [
-                {
-                    "nom": "EURL Menuiserie Pro",
-                    "adresse": "123 Rue de l'Artisanat, Alger",
-                    "telephone": "0550123456",
-                    "email": "contact@menuiseriepro.dz",
-                    "nif": "1234567890123",
-                    "nis": "123456789",
-                    "rc": "ALG-123456",
-                    "compte_comptable": "411000"
-                },
-                {
-                    "nom": "SARL Bois & Design",
-                    "adresse": "456 Av. des Pins, Oran",
-                    "telephone": "0770987654",
-                    "email": "info@boisdesign.dz",
-                    "nif": "2345678901234",
-                    "nis": "234567890",
-                    "rc": "ORAN-789012",
-                    "compte_comptable": "411000"
-                }
-            ]
-            for client in clients:
-                crud.create_client(db, client)
-            print("✅ Clients de test ajoutés.")
+def seed_database(db, data: dict = None) -> dict:
+    """
+    Applique les données de SEED_FILE en un INSERT/UPDATE groupé par table,
+    dans une seule transaction (crud.upsert_rows) :
+    - plan comptable et paramètres : ajoutés s'ils manquent (par clé), les
+      lignes existantes, éventuellement modifiées par l'utilisateur, ne sont
+      pas touchées ;
+    - séquences de l'année : créées si absentes ;
+    - démonstration (produits, clients, fournisseurs) : seulement dans une table
+      vide ; stock initial des produits de démonstration s'il n'existe pas ;
+    - recettes : créées pour les produits présents qui n'en ont pas encore.
 
-        # 6. Ajouter des fournisseurs de test
-        if not crud.get_fournisseurs(db):
-            print("- Ajout des fournisseurs de test...")
-            fournisseurs = [
-                {
-                    "nom": "Scierie du Nord",
-                    "adresse": "789 Route Forestière, Tizi Ouzou",
-                    "telephone": "0660112233",
-                    "email": "scierie.nord@djezair.dz",
-                    "nif": "3456789012345",
-                    "nis": "345678901",
-                    "rc": "TIZI-345678",
-                    "compte_comptable": "401000"
-                },
-                {
-                    "nom": "Bois & Cie",
-                    "adresse": "321 Rue des Arbres, Constantine",
-                    "telephone": "0555998877",
-                    "email": "bois.cie@constantine.dz",
-                    "nif": "4567890123456",
-                    "nis": "456789012",
-                    "rc": "CONST-987654",
-                    "compte_comptable": "401000"
-                }
-            ]
-            for fournisseur in fournisseurs:
-                crud.create_fournisseur(db, fournisseur)
-            print("✅ Fournisseurs de test ajoutés.")
+    Retourne, par table, {"inseres": n, "mis_a_jour": n}.
+    """
+    data = data or load_seed_data()
+    demo = data.get("demo", {})
+    resultats = {}
+    try:
+        resultats["plan_comptable"] = crud.upsert_rows(db, models.PlanComptable, data["plan_comptable"], ("compte",),
+                                                       mise_a_jour=False)
+        resultats["parametres"] = crud.upsert_rows(db, models.Parametres, data["parametres"], ("type_param", "valeur"),
+                                                   mise_a_jour=False)
+
+        annee = datetime.now().year
+        resultats["sequences"] = crud.upsert_rows(db, models.Sequence, [
+            {"type_document": type_document, "annee": annee, "dernier_numero": 0}
+            for type_document in crud.PREFIXES_DOCUMENTS
+        ], ("type_document", "annee"), mise_a_jour=False)
+
+        for table_, model, cle in [("produits", models.Produit, "code"),
+                                   ("clients", models.Client, "nom"),
+                                   ("fournisseurs", models.Fournisseur, "nom")]:
+            if demo.get(table_) and db.query(model.id).first() is None:
+                resultats[table_] = crud.upsert_rows(db, model, demo[table_], (cle,), mise_a_jour=False)
+
+        produits = {code: (produit_id, prix_achat) for code, produit_id, prix_achat in db.query(
+            models.Produit.code, models.Produit.id, models.Produit.prix_achat
+        ).filter(models.Produit.code.in_([stock["produit"] for stock in demo.get("stocks", [])]))}
+        lignes_stock = []
+        for stock in demo.get("stocks", []):
+            if stock["produit"] not in produits:
+                continue
+            produit_id, prix_achat = produits[stock["produit"]]
+            cout = float(prix_achat or 0)
+            lignes_stock.append({
+                "produit_id": produit_id,
+                "unite_production": stock["unite_production"],
+                "quantite": stock["quantite"],
+                "cout_unitaire_moyen": cout,
+                "valeur_stock": stock["quantite"] * cout
+            })
+        resultats["stocks"] = crud.upsert_rows(db, models.Stock, lignes_stock, ("produit_id", "unite_production"), mise_a_jour=False)
+
+        codes = {code for recette in data.get("recettes", []) for code in [recette["produit"], *recette["composants"]]}
+        ids = dict(db.query(models.Produit.code, models.Produit.id).filter(models.Produit.code.in_(codes))) if codes else {}
+        existantes = {produit_id for (produit_id,) in db.query(models.Recette.produit_id)}
+        recettes = [recette for recette in data.get("recettes", [])
+                    if all(code in ids for code in [recette["produit"], *recette["composants"]])
+                    and ids[recette["produit"]] not in existantes]
+        resultats["recettes"] = crud.upsert_rows(db, models.Recette, [{
+            "produit_id": ids[recette["produit"]],
+            "quantite_produite": recette.get("quantite_produite", 1),
+            "taux_charges": recette.get("taux_charges", 20)
+        } for recette in recettes], ("produit_id",), mise_a_jour=False)
+        if recettes:
+            recette_ids = dict(db.query(models.Recette.produit_id, models.Recette.id).filter(
+                models.Recette.produit_id.in_([ids[recette["produit"]] for recette in recettes])))
+            crud.upsert_rows(db, models.LigneRecette, [
+                {"recette_id": recette_ids[ids[recette["produit"]]], "composant_id": ids[code], "quantite": quantite}
+                for recette in recettes for code, quantite in recette["composants"].items()
+            ], ("recette_id", "composant_id"), mise_a_jour=False)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return resultats
+
+
+def init_database(force: bool = False):
+    """
+    Crée le schéma, applique les migrations et insère les données de référence.
+    Retourne False sans rien faire si la base est déjà à SCHEMA_VERSION
+    (une seule lecture de l'en-tête SQLite), sauf si force est vrai. En cas
+    d'erreur, la transaction est annulée, la version n'est pas enregistrée et
+    l'exception est propagée.
+    """
+    db = SessionLocal()
+    try:
+        if not force and get_schema_version(db) == SCHEMA_VERSION:
+            return False
+        db.rollback()  # termine la lecture avant create_all (autre connexion)
 
-        # 7. Initialiser le stock pour les produits MP
-        produits_mp = db.query(models.Produit).filter(models.Produit.famille == "MP").all()
-        for produit in produits_mp:
-            if not crud.get_stock_actuel(db, produit.id, "GENERAL"):
-                crud.update_stock(db, produit.id, "GENERAL", 100, produit.prix_achat or 0)
-        print("✅ Stock initialisé pour les matières premières.")
+        print("=== Initialisation de la base de données bois_m v2 ===")
+        print(f"Date et heure : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
+        # Créer toutes les tables
+        models.Base.metadata.create_all(bind=engine)
+
+        # 0. Index plein texte du journal (bases créées avant son introduction)
+        crud.ensure_journal_fts(db)
+        if crud.ensure_sequences_par_type(db):
+            print("- Séquences de numérotation migrées par type de document")
+        if crud.ensure_classes_ecritures(db):
+            print("- Classes de comptes des écritures renseignées, soldes de trésorerie recalculés")
+        if ledger.ensure_soldes_comptes(db):
+            print("- Cumuls par compte (soldes_comptes) calculés")
+        if comptabilisation.ensure_journal_ecritures(db):
+            print("- Codes journal des écritures renseignés")
+        if crud.ensure_versions_referentiel(db):
+            print("- Versions des tables de référence suivies par trigger")
+        operations = comptabilisation.ensure_operations(db)
+        if operations:
+            print(f"- {operations} opération(s) analytique(s) reconstituée(s)")
+        ecarts = accounting.ensure_metriques_journalieres(db)
+        if ecarts:
+            print(f"- Métriques journalières recalculées sur les opérations ({ecarts} écart(s))")
+        crees = crud.ensure_indexes(db)
+        if crees:
+            print(f"- Index ajoutés : {', '.join(crees)}")
+
+        # 1. Données de référence et de démonstration (une seule transaction)
+        for table_, compte in seed_database(db).items():
+            if compte["inseres"] or compte["mis_a_jour"]:
+                print(f"- {table_} : {compte['inseres']} ajouté(s), {compte['mis_a_jour']} mis à jour")
+
+        # 2. Historique des stocks : mouvements initiaux et arrêtés mensuels
+        initiaux = stocks.ensure_mouvements_stock(db)
+        if initiaux:
+            print(f"- {initiaux} mouvement(s) de stock initial enregistré(s)")
+        arretes = stocks.ensure_instantanes_stock(db)
+        if arretes:
+            print(f"- {arretes} arrêté(s) de stock mensuel(s) créé(s)")
+
+        db.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+        db.commit()
         print("=== Initialisation terminée avec succès ! ===")
 
     except Exception as e:
         print(f"❌ Erreur lors de l'initialisation : {e}")
         db.rollback()
+        raise
     finally:
         db.close()
+    return True
 
 
 if __name__ == "__main__":
-    init_database()
+    init_database(force=True)
@@ -0,0 +1,223 @@
+# instrumentation.py
+"""
+Instrumentation SQL optionnelle, branchée sur les événements
+before/after_cursor_execute d'un moteur.
+
+Par forme de requête (texte SQL, listes IN repliées) : nombre d'exécutions,
+durées (total, max, histogramme), lignes lues ou modifiées et fonctions
+appelantes (premier cadre du projet hors SQLAlchemy). Signale les N+1 : une
+même requête SELECT répétée au moins `seuil_n_plus_1` fois dans une seule
+transaction. Les requêtes plus longues que `seuil_lent_ms` sont journalisées
+(logger "bois_m.sql").
+
+Activation : variable d'environnement BOIS_M_SQL_STATS (seuil des requêtes
+lentes en ms, ex. BOIS_M_SQL_STATS=50), rapport affiché à la sortie ; ou
+par programme :
+
+    from instrumentation import enable
+    stats = enable(engine, seuil_lent_ms=50)
+    ...
+    print(stats.format_report())
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from sqlalchemy import event
+
+logger = logging.getLogger("bois_m.sql")
+
+# Bornes supérieures (ms) des classes de l'histogramme des durées
+HISTOGRAMME_MS = [1, 5, 10, 50, 100, 500, 1000]
+
+_RACINE = os.path.dirname(os.path.abspath(__file__))
+_LISTE_IN = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_ESPACES = re.compile(r"\s+")
+
+
+def forme_requete(statement: str) -> str:
+    """Texte SQL normalisé : espaces réduits, listes de paramètres IN (?, ?, ...) repliées"""
+    return _LISTE_IN.sub("(?, ...)", _ESPACES.sub(" ", statement).strip())
+
+
+def _appelant():
+    """Première fonction du projet (hors ce module et database.py) dans la pile d'appel"""
+    cadre = sys._getframe(2)
+    while cadre is not None:
+        fichier = cadre.f_code.co_filename
+        if (fichier.startswith(_RACINE) and "site-packages" not in fichier
+                and not fichier.endswith(("instrumentation.py", "database.py"))):
+            module = os.path.relpath(fichier, _RACINE)[:-3].replace(os.sep, ".")
+            return f"{module}.{cadre.f_code.co_name}:{cadre.f_lineno}"
+        cadre = cadre.f_back
+    return "?"
+
+
+class _StatRequete:
+    __slots__ = ("nombre", "total", "max", "lignes", "histogramme", "appelants")
+
+    def __init__(self):
+        self.nombre = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lignes = 0
+        self.histogramme = [0] * (len(HISTOGRAMME_MS) + 1)
+        self.appelants = Counter()
+
+
+class QueryStats:
+    """Statistiques des requêtes d'un ou plusieurs moteurs"""
+
+    def __init__(self, seuil_lent_ms: float = 100, seuil_n_plus_1: int = 10):
+        self.seuil_lent_ms = seuil_lent_ms
+        self.seuil_n_plus_1 = seuil_n_plus_1
+        self._lock = threading.Lock()
+        self._engines = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requetes = {}  # forme -> _StatRequete
+            self.n_plus_1 = {}  # forme -> {"max_repetitions", "transactions", "appelant"}
+            self.lentes = 0
+
+    # ------------------------------------------------------------------
+    # Branchement sur le moteur
+    # ------------------------------------------------------------------
+    def attach(self, engine):
+        event.listen(engine, "before_cursor_execute", self._avant)
+        event.listen(engine, "after_cursor_execute", self._apres)
+        event.listen(engine, "commit", self._fin_transaction)
+        event.listen(engine, "rollback", self._fin_transaction)
+        self._engines.append(engine)
+        return self
+
+    def detach(self, engine=None):
+        for moteur in ([engine] if engine is not None else list(self._engines)):
+            event.remove(moteur, "before_cursor_execute", self._avant)
+            event.remove(moteur, "after_cursor_execute", self._apres)
+            event.remove(moteur, "commit", self._fin_transaction)
+            event.remove(moteur, "rollback", self._fin_transaction)
+            self._engines.remove(moteur)
+
+    def _avant(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("stats_debut", []).append(time.perf_counter())
+
+    def _apres(self, conn, cursor, statement, parameters, context, executemany):
+        duree = time.perf_counter() - conn.info["stats_debut"].pop()
+        forme = forme_requete(statement)
+        appelant = _appelant()
+        select = forme.split(" ", 1)[0].upper() in ("SELECT", "WITH", "PRAGMA")
+
+        with self._lock:
+            stat = self.requetes.get(forme)
+            if stat is None:
+                stat = self.requetes[forme] = _StatRequete()
+            stat.nombre += 1
+            stat.total += duree
+            stat.max = max(stat.max, duree)
+            stat.histogramme[next((i for i, borne in enumerate(HISTOGRAMME_MS) if duree * 1000 <= borne),
+                                  len(HISTOGRAMME_MS))] += 1
+            stat.appelants[appelant] += 1
+            if not select and cursor.rowcount > 0:
+                stat.lignes += cursor.rowcount
+
+        if select:
+            # Lignes lues : comptées au fil de la lecture du curseur
+            cursor.row_factory = lambda curseur, ligne: self._ligne_lue(stat, ligne)
+
+            # N+1 : répétitions de la même requête dans la transaction en cours
+            repetitions = conn.info.setdefault("stats_transaction", Counter())
+            repetitions[forme] += 1
+            if repetitions[forme] >= self.seuil_n_plus_1:
+                conn.info.setdefault("stats_n_plus_1", {})[forme] = (repetitions[forme], appelant)
+
+        if duree * 1000 >= self.seuil_lent_ms:
+            with self._lock:
+                self.lentes += 1
+            logger.warning("Requête lente (%.1f ms) depuis %s : %s | paramètres : %.200r",
+                           duree * 1000, appelant, forme, parameters)
+
+    def _ligne_lue(self, stat, ligne):
+        stat.lignes += 1  # incrément non verrouillé : approximation acceptable entre threads
+        return ligne
+
+    def _fin_transaction(self, conn):
+        conn.info.pop("stats_transaction", None)
+        suspects = conn.info.pop("stats_n_plus_1", None)
+        if not suspects:
+            return
+        with self._lock:
+            for forme, (repetitions, appelant) in suspects.items():
+                suspect = self.n_plus_1.setdefault(forme, {"max_repetitions": 0, "transactions": 0, "appelant": appelant})
+                suspect["max_repetitions"] = max(suspect["max_repetitions"], repetitions)
+                suspect["transactions"] += 1
+        for forme, (repetitions, appelant) in suspects.items():
+            logger.warning("N+1 probable : %d exécutions dans une transaction depuis %s : %s",
+                           repetitions, appelant, forme)
+
+    # ------------------------------------------------------------------
+    # Rapport
+    # ------------------------------------------------------------------
+    def report(self, tri: str = "total_ms", limite: int = 20) -> dict:
+        """
+        Rapport des requêtes, triées par `tri` (total_ms, nombre, max_ms,
+        lignes) : {"requetes": [...], "n_plus_1": [...], "lentes": n}
+        """
+        with self._lock:
+            requetes = [{
+                "requete": forme,
+                "nombre": stat.nombre,
+                "total_ms": round(stat.total * 1000, 3),
+                "moyenne_ms": round(stat.total / stat.nombre * 1000, 3),
+                "max_ms": round(stat.max * 1000, 3),
+                "lignes": stat.lignes,
+                "histogramme": dict(zip([f"<={borne}ms" for borne in HISTOGRAMME_MS] + [f">{HISTOGRAMME_MS[-1]}ms"],
+                                        stat.histogramme)),
+                "appelants": dict(stat.appelants.most_common(5))
+            } for forme, stat in self.requetes.items()]
+            n_plus_1 = [dict(suspect, requete=forme) for forme, suspect in self.n_plus_1.items()]
+            lentes = self.lentes
+
+        requetes.sort(key=lambda requete: requete[tri], reverse=True)
+        n_plus_1.sort(key=lambda suspect: suspect["max_repetitions"], reverse=True)
+        return {"requetes": requetes[:limite], "n_plus_1": n_plus_1, "lentes": lentes}
+
+    def format_report(self, tri: str = "total_ms", limite: int = 20) -> str:
+        rapport = self.report(tri, limite)
+        lignes = [f"=== Requêtes SQL (tri : {tri}, {rapport['lentes']} lente(s)) ===",
+                  f"{'nombre':>8}{'total ms':>12}{'moy. ms':>10}{'max ms':>10}{'lignes':>10}  requête / appelant principal"]
+        for requete in rapport["requetes"]:
+            appelant = next(iter(requete["appelants"]), "?")
+            lignes.append(f"{requete['nombre']:>8}{requete['total_ms']:>12.1f}{requete['moyenne_ms']:>10.2f}"
+                          f"{requete['max_ms']:>10.1f}{requete['lignes']:>10}  {requete['requete'][:100]}")
+            lignes.append(f"{'':>50}  <- {appelant}")
+        if rapport["n_plus_1"]:
+            lignes.append("=== N+1 probables ===")
+            for suspect in rapport["n_plus_1"]:
+                lignes.append(f"{suspect['max_repetitions']:>8} fois ({suspect['transactions']} transaction(s)) "
+                              f"depuis {suspect['appelant']} : {suspect['requete'][:100]}")
+        return "\n".join(lignes)
+
+
+_stats = None
+
+
+def enable(engine=None, seuil_lent_ms: float = 100, seuil_n_plus_1: int = 10) -> QueryStats:
+    """Active l'instrumentation sur `engine` (database.engine par défaut) ; idempotent"""
+    global _stats
+    if engine is None:
+        from database import engine
+    if _stats is None:
+        _stats = QueryStats(seuil_lent_ms, seuil_n_plus_1)
+    if engine not in _stats._engines:
+        _stats.attach(engine)
+    return _stats
+
+
+def get_stats():
+    """Statistiques actives, ou None si l'instrumentation n'est pas activée"""
+    return _stats
@@ -1,5 +1,6 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, Date, DateTime, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, Date, DateTime, Numeric, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import DDL, event
 from sqlalchemy.orm import relationship, backref
 from database import Base
 from datetime import datetime
@@ -183,6 +184,12 @@ class LigneFacture(Base):
 
 class JournalQuotidien(Base):
     __tablename__ = "journal_quotidien"
+    __table_args__ = (
+        Index("ix_journal_type_date", "type_journal", "date_operation"),
+        Index("ix_journal_produit_type_date", "produit_id", "type_journal", "date_operation"),
+        Index("ix_journal_client_type_facture", "client_id", "type_journal", "facture_id", "date_operation"),
+        Index("ix_journal_date_id", "date_operation", "id"),  # pagination par clé
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     date_operation = Column(DateTime, default=datetime.now)
@@ -227,8 +234,53 @@ class JournalQuotidien(Base):
         return f"<JournalQuotidien(type={self.type_journal}, piece={self.numero_piece}, montant={self.montant_ttc})>"
 
 
+# Index plein texte du journal (SQLite FTS5), tenu à jour par triggers.
+# rowid = journal_quotidien.id ; tiers et produit sont dénormalisés.
+_JOURNAL_FTS_VALEURS = """
+    new.id, new.numero_piece, new.libelle,
+    COALESCE((SELECT nom FROM clients WHERE id = new.client_id),
+             (SELECT nom FROM fournisseurs WHERE id = new.fournisseur_id), ''),
+    COALESCE((SELECT designation FROM produits WHERE id = new.produit_id), '')
+"""
+
+JOURNAL_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS journal_fts USING fts5(
+        numero_piece, libelle, tiers, produit,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS journal_fts_ai AFTER INSERT ON journal_quotidien BEGIN
+        INSERT INTO journal_fts(rowid, numero_piece, libelle, tiers, produit) VALUES ({_JOURNAL_FTS_VALEURS});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS journal_fts_au
+    AFTER UPDATE OF numero_piece, libelle, client_id, fournisseur_id, produit_id ON journal_quotidien BEGIN
+        DELETE FROM journal_fts WHERE rowid = old.id;
+        INSERT INTO journal_fts(rowid, numero_piece, libelle, tiers, produit) VALUES ({_JOURNAL_FTS_VALEURS});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS journal_fts_ad AFTER DELETE ON journal_quotidien BEGIN
+        DELETE FROM journal_fts WHERE rowid = old.id;
+    END""",
+]
+
+for _ddl in JOURNAL_FTS_DDL:
+    event.listen(JournalQuotidien.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
+
+
+def _classe_compte(colonne):
+    """Défaut calculé à l'insertion : classe (premier chiffre) du compte"""
+    def _defaut(context):
+        compte = context.get_current_parameters().get(colonne)
+        return compte[:1] if compte else None
+    return _defaut
+
+
 class EcritureComptable(Base):
     __tablename__ = "ecritures_comptables"
+    __table_args__ = (
+        Index("ix_ecritures_date", "date_comptable"),
+        Index("ix_ecritures_debit_date", "compte_debit", "date_comptable"),
+        Index("ix_ecritures_credit_date", "compte_credit", "date_comptable"),
+        Index("ix_ecritures_classes_date", "classe_debit", "classe_credit", "date_comptable"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     journal_id = Column(Integer, ForeignKey("journal_quotidien.id"), nullable=True)
@@ -238,14 +290,16 @@ class EcritureComptable(Base):
     libelle = Column(String(255), nullable=False)
     compte_debit = Column(String(10), ForeignKey("plan_comptable.compte"), nullable=False)
     compte_credit = Column(String(10), ForeignKey("plan_comptable.compte"), nullable=False)
+    classe_debit = Column(String(1), default=_classe_compte("compte_debit"))  # 5 = trésorerie, 4 = tiers...
+    classe_credit = Column(String(1), default=_classe_compte("compte_credit"))
     montant = Column(Numeric(15, 2), nullable=False)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=True)
     fournisseur_id = Column(Integer, ForeignKey("fournisseurs.id"), nullable=True)
     numero_facture = Column(String(50))
     date_creation = Column(DateTime, default=datetime.now)
 
-    # Relations
-    journal = relationship("JournalQuotidien")
+    # Relations (journal est le code du journal comptable, colonne ci-dessus)
+    journal_quotidien = relationship("JournalQuotidien")
     client = relationship("Client", back_populates="ecritures")
     fournisseur = relationship("Fournisseur", back_populates="ecritures")
     compte_debit_rel = relationship("PlanComptable", foreign_keys=[compte_debit])
@@ -257,6 +311,9 @@ class EcritureComptable(Base):
 
 class Tresorerie(Base):
     __tablename__ = "tresorerie"
+    __table_args__ = (
+        Index("ix_tresorerie_date", "date_operation"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     date_operation = Column(Date, nullable=False)
@@ -274,6 +331,16 @@ class Tresorerie(Base):
     fournisseur = relationship("Fournisseur")
 
 
+class SoldeTresorerie(Base):
+    """Cumuls par compte de trésorerie (classe 5), tenus à jour à la comptabilisation"""
+    __tablename__ = "soldes_tresorerie"
+
+    compte = Column(String(10), ForeignKey("plan_comptable.compte"), primary_key=True)
+    encaissements = Column(Numeric(15, 2), default=0)  # Débit 5 / Crédit 4
+    decaissements = Column(Numeric(15, 2), default=0)  # Débit 4 / Crédit 5
+    date_maj = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 class Production(Base):
     __tablename__ = "production"
 
@@ -314,14 +381,21 @@ class Reglement(Base):
 
 class Sequence(Base):
     __tablename__ = "sequences"
+    __table_args__ = (
+        UniqueConstraint("type_document", "annee", name="uq_sequences_type_annee"),
+    )
 
     id = Column(Integer, primary_key=True)
-    annee = Column(Integer, unique=True, nullable=False)
+    type_document = Column(String(20), nullable=False, default="FACTURE")  # FACTURE, AVOIR, BL
+    annee = Column(Integer, nullable=False)
     dernier_numero = Column(Integer, default=0)
 
 
 class Stock(Base):
     __tablename__ = "stocks"
+    __table_args__ = (
+        Index("ix_stocks_produit_unite", "produit_id", "unite_production"),
+    )
 
     id = Column(Integer, primary_key=True)
     produit_id = Column(Integer, ForeignKey("produits.id"))
@@ -333,3 +407,171 @@ class Stock(Base):
 
     # Relations
     produit = relationship("Produit", back_populates="stocks")
+
+
+class MouvementStock(Base):
+    """
+    Mouvement de stock, en ajout seul : la somme des mouvements d'un produit
+    dans une unité redonne sa ligne de stocks (quantité et valeur)
+    """
+    __tablename__ = "mouvements_stock"
+    __table_args__ = (
+        Index("ix_mouvements_stock_produit_unite_date", "produit_id", "unite_production", "date_mouvement"),
+        Index("ix_mouvements_stock_date", "date_mouvement"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    date_mouvement = Column(DateTime, nullable=False, default=datetime.now)
+    produit_id = Column(Integer, ForeignKey("produits.id"), nullable=False)
+    unite_production = Column(String(50), nullable=False)
+    type_mouvement = Column(String(20), nullable=False)  # INITIAL, ACHAT, VENTE, PRODUCTION, CONSOMMATION, AJUSTEMENT
+    quantite = Column(Float, nullable=False)  # signée : positive en entrée, négative en sortie
+    cout_unitaire = Column(Numeric(15, 2))  # coût d'entrée ; vide pour une sortie (valorisée au CMP)
+    valeur = Column(Numeric(15, 2), nullable=False)  # signée, comme la quantité
+    journal_id = Column(Integer, ForeignKey("journal_quotidien.id"))
+
+    # Relations
+    produit = relationship("Produit")
+
+
+class InstantaneStock(Base):
+    """Arrêté de stock : quantité et valeur d'un produit dans une unité à la fin de date_arrete"""
+    __tablename__ = "stocks_instantanes"
+    __table_args__ = (
+        UniqueConstraint("date_arrete", "produit_id", "unite_production", name="uq_stocks_instantanes"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    date_arrete = Column(Date, nullable=False)
+    produit_id = Column(Integer, ForeignKey("produits.id"), nullable=False)
+    unite_production = Column(String(50), nullable=False)
+    quantite = Column(Float, nullable=False)
+    valeur_stock = Column(Numeric(15, 2), nullable=False)
+
+
+class MetriqueJournaliere(Base):
+    """Agrégats quotidiens par unité de production et famille, tenus à jour à la comptabilisation"""
+    __tablename__ = "metriques_journalieres"
+    __table_args__ = (
+        UniqueConstraint("date", "unite_production", "famille", name="uq_metriques_journalieres"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False, index=True)
+    unite_production = Column(String(50), nullable=False)
+    famille = Column(String(10), nullable=False, default="")  # "" si l'opération n'a pas de produit
+    quantite_consommee = Column(Float, default=0.0)
+    cout_consommation = Column(Numeric(15, 2), default=0)
+    quantite_produite = Column(Float, default=0.0)
+    cout_production = Column(Numeric(15, 2), default=0)
+    nombre_operations = Column(Integer, default=0)
+
+
+class SoldeCompte(Base):
+    """Cumuls débit / crédit par compte et par mois (AAAA-MM), tenus à jour à la comptabilisation"""
+    __tablename__ = "soldes_comptes"
+    __table_args__ = (
+        UniqueConstraint("compte", "periode", name="uq_soldes_comptes"),
+        Index("ix_soldes_comptes_periode_classe", "periode", "classe"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    compte = Column(String(10), ForeignKey("plan_comptable.compte"), nullable=False)
+    periode = Column(String(7), nullable=False)  # AAAA-MM
+    classe = Column(String(1), nullable=False)
+    total_debit = Column(Numeric(15, 2), default=0)
+    total_credit = Column(Numeric(15, 2), default=0)
+    nombre_ecritures = Column(Integer, default=0)
+
+
+class Recette(Base):
+    """Nomenclature d'un produit fabriqué : composants consommés pour quantite_produite unités"""
+    __tablename__ = "recettes"
+
+    id = Column(Integer, primary_key=True)
+    produit_id = Column(Integer, ForeignKey("produits.id"), unique=True, nullable=False)
+    quantite_produite = Column(Float, nullable=False, default=1.0)
+    taux_charges = Column(Numeric(5, 2), default=20.0)  # charges indirectes, en % du coût des composants
+    actif = Column(Boolean, default=True)
+    date_maj = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Relations
+    produit = relationship("Produit", foreign_keys=[produit_id])
+    lignes = relationship("LigneRecette", back_populates="recette", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<Recette(produit_id={self.produit_id}, lignes={len(self.lignes)})>"
+
+
+class LigneRecette(Base):
+    """Composant d'une recette : MP, ou SF lui-même fabriqué selon sa propre recette"""
+    __tablename__ = "lignes_recette"
+    __table_args__ = (
+        UniqueConstraint("recette_id", "composant_id", name="uq_lignes_recette"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    recette_id = Column(Integer, ForeignKey("recettes.id"), nullable=False)
+    composant_id = Column(Integer, ForeignKey("produits.id"), nullable=False)
+    quantite = Column(Float, nullable=False)
+
+    # Relations
+    recette = relationship("Recette", back_populates="lignes")
+    composant = relationship("Produit", foreign_keys=[composant_id])
+
+
+class Operation(Base):
+    """
+    Opération analytique, une par entrée comptabilisée du journal (hors caisse) ;
+    famille du produit et unité recopiées pour les agrégats de production
+    """
+    __tablename__ = "operations"
+    __table_args__ = (
+        Index("ix_operations_date_unite", "date_comptable", "unite_production"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    journal_id = Column(Integer, ForeignKey("journal_quotidien.id"), nullable=False, unique=True)
+    date_comptable = Column(DateTime, nullable=False)
+    unite_production = Column(String(50), nullable=False)  # "GENERAL" pour une entrée sans unité
+    type_operation = Column(String(20), nullable=False)  # achat, vente, production, consommation, charge
+    produit_id = Column(Integer, ForeignKey("produits.id"))
+    famille = Column(String(10))  # famille du produit à la comptabilisation
+    client_id = Column(Integer, ForeignKey("clients.id"))
+    fournisseur_id = Column(Integer, ForeignKey("fournisseurs.id"))
+    quantite = Column(Float, default=0.0)
+    cout_unitaire = Column(Numeric(15, 2))
+    montant = Column(Numeric(15, 2), default=0)
+    libelle = Column(String(255))
+    validee = Column(Boolean, default=True)
+
+    # Relations
+    journal = relationship("JournalQuotidien")
+    produit = relationship("Produit")
+
+
+class VersionReferentiel(Base):
+    """
+    Numéro de version d'une table de référence, incrémenté par trigger à chaque
+    insertion, modification ou suppression, quelle que soit la connexion
+    (voir referentiel_cache)
+    """
+    __tablename__ = "versions_referentiel"
+
+    nom_table = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+TABLES_REFERENTIEL = ("produits", "clients", "fournisseurs", "parametres")
+
+VERSIONS_REFERENTIEL_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {table_}_version_{suffixe} AFTER {operation} ON {table_} BEGIN
+        INSERT INTO versions_referentiel (nom_table, version) VALUES ('{table_}', 1)
+        ON CONFLICT (nom_table) DO UPDATE SET version = version + 1;
+    END"""
+    for table_ in TABLES_REFERENTIEL
+    for suffixe, operation in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+]
+
+for _ddl in VERSIONS_REFERENTIEL_DDL:
+    event.listen(VersionReferentiel.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite"))
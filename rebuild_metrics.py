@@ -0,0 +1,42 @@
+# rebuild_metrics.py
+"""
+Recalcule la table metriques_journalieres sur une période, à partir des
+opérations analytiques (table operations). Avec --verifier, affiche
+seulement les écarts entre les deux tables.
+
+Usage : python rebuild_metrics.py 2025-01-01 2025-12-31 [--verifier]
+"""
+import argparse
+from datetime import datetime
+from database import SessionLocal, engine
+import models
+import services.accounting as accounting
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcule les métriques journalières du tableau de bord")
+    parser.add_argument("date_debut", help="Date de début (YYYY-MM-DD)")
+    parser.add_argument("date_fin", help="Date de fin (YYYY-MM-DD)")
+    parser.add_argument("--verifier", action="store_true", help="Affiche les écarts sans rien recalculer")
+    args = parser.parse_args()
+
+    date_debut = datetime.strptime(args.date_debut, "%Y-%m-%d").date()
+    date_fin = datetime.strptime(args.date_fin, "%Y-%m-%d").date()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.verifier:
+            ecarts = accounting.verifier_metriques_journalieres(db, date_debut, date_fin)
+            for ecart in ecarts:
+                print(f"{ecart['cle']} : attendu {ecart['attendu']}, enregistré {ecart['enregistre']}")
+            print(f"{len(ecarts)} écart(s) du {date_debut} au {date_fin}.")
+            return
+        accounting.rebuild_metriques_journalieres(db, date_debut, date_fin)
+        print(f"✅ Métriques journalières recalculées du {date_debut} au {date_fin}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# referentiel_cache.py
+"""
+Cache en lecture des tables de référence (produits, clients, fournisseurs,
+paramètres), partagé par toutes les sessions du processus.
+
+crud.get_produit, get_client, get_fournisseur, get_parametres_by_type et les
+listes (get_produits, get_clients, get_fournisseurs) passent par ce cache :
+la première lecture interroge la base et garde une copie détachée des
+colonnes ; les suivantes la rattachent à la session (Session.merge sans
+chargement, aucune requête). Une instance déjà présente dans la session est
+rendue telle quelle.
+
+- Chaque table a un numéro de version, incrémenté (et son cache vidé) à
+  toute insertion, modification ou suppression passant par l'ORM
+  (crud.create_* / update_* / delete_*), aux UPDATE/DELETE en masse
+  (Query.update/delete) et aux chargements de crud.upsert_rows. Une lecture
+  commencée avant un changement de version n'est pas gardée.
+- Tant qu'une session a des modifications non validées d'une table, ses
+  lectures de cette table ne remplissent pas le cache ; la version est
+  incrémentée de nouveau à la validation ou à l'annulation.
+- Les modifications faites par d'autres processus (ou en SQL direct) sont
+  comptées en base, par trigger, dans versions_referentiel. Au premier accès
+  au cache de chaque transaction d'une session, ces versions sont relues
+  (une requête) et le cache des tables qui ont changé est vidé.
+- Taille bornée : au plus TAILLE_MAX entrées par table (les moins
+  récemment lues sont écartées).
+
+Désactivation : variable d'environnement BOIS_M_REF_CACHE=0, ou activer(False).
+"""
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import Produit, Client, Fournisseur, Parametres
+
+MODELES = (Produit, Client, Fournisseur, Parametres)
+TAILLE_MAX = 1000  # entrées par table (une liste compte pour une entrée)
+
+_actif = os.environ.get("BOIS_M_REF_CACHE", "1").lower() not in ("0", "off", "non", "false")
+_lock = threading.Lock()
+_entrees = {modele: OrderedDict() for modele in MODELES}  # clé -> copie ou liste de copies
+_versions = {modele: 0 for modele in MODELES}
+_stats = {modele: {"hits": 0, "misses": 0, "ecartees": 0} for modele in MODELES}
+_versions_base = {}  # modèle -> dernière version lue dans versions_referentiel
+
+_LIRE_VERSIONS = text("SELECT nom_table, version FROM versions_referentiel")
+
+
+def actif() -> bool:
+    return _actif
+
+
+def activer(actif: bool = True, taille_max: int = None):
+    """Active ou désactive le cache (vidé dans les deux cas)"""
+    global _actif, TAILLE_MAX
+    _actif = actif
+    if taille_max is not None:
+        TAILLE_MAX = taille_max
+    invalider()
+
+
+def invalider(modele=None, db: Session = None):
+    """
+    Vide le cache d'une table (ou de toutes) et incrémente sa version. Avec
+    db, la table est marquée modifiée dans la session jusqu'à la fin de sa
+    transaction. Sans effet pour un modèle hors référentiel.
+    """
+    if modele is not None and modele not in _versions:
+        return
+    modeles = MODELES if modele is None else (modele,)
+    with _lock:
+        for m in modeles:
+            _versions[m] += 1
+            _entrees[m].clear()
+    if db is not None:
+        db.info.setdefault("referentiel_modifie", set()).update(modeles)
+
+
+def stats_cache() -> dict:
+    """Par table : hits, misses, entrées écartées, entrées présentes et version"""
+    with _lock:
+        return {modele.__tablename__: dict(_stats[modele], entrees=len(_entrees[modele]), version=_versions[modele])
+                for modele in MODELES}
+
+
+# ========================
+# LECTURE
+# ========================
+def _copie(instance):
+    """Copie détachée des colonnes d'une instance (sans relation chargée)"""
+    etat = inspect(instance)
+    copie = etat.mapper.class_manager.new_instance()
+    dictionnaire = inspect(copie).dict
+    for colonne in etat.mapper.column_attrs:
+        dictionnaire[colonne.key] = etat.dict.get(colonne.key)
+    make_transient_to_detached(copie)
+    return copie
+
+
+def _rattacher(db: Session, copie):
+    """Instance de la session pour une copie du cache, sans requête"""
+    instance = db.identity_map.get(inspect(copie).key)
+    if instance is not None:
+        return instance
+    return db.merge(copie, load=False)
+
+
+def _verifier_base(db: Session):
+    """Vide le cache des tables modifiées en base depuis la dernière vérification
+    (une fois par transaction de la session)"""
+    if db.info.get("referentiel_verifie"):
+        return
+    db.info["referentiel_verifie"] = True
+    versions = dict(db.execute(_LIRE_VERSIONS).fetchall())
+    for modele in MODELES:
+        version = versions.get(modele.__tablename__)
+        with _lock:
+            changee = modele not in _versions_base or _versions_base[modele] != version
+            _versions_base[modele] = version
+        if changee:
+            invalider(modele)
+
+
+def _lire(modele, cle):
+    """(version au début de la lecture, valeur en cache ou None)"""
+    with _lock:
+        entrees = _entrees[modele]
+        valeur = entrees.get(cle)
+        if valeur is not None:
+            entrees.move_to_end(cle)
+            _stats[modele]["hits"] += 1
+        else:
+            _stats[modele]["misses"] += 1
+        return _versions[modele], valeur
+
+
+def _garder(db: Session, modele, cle, version, valeur):
+    if modele in db.info.get("referentiel_modifie", ()):
+        return  # lecture de modifications non validées
+    with _lock:
+        if version != _versions[modele]:
+            return
+        entrees = _entrees[modele]
+        entrees[cle] = valeur
+        entrees.move_to_end(cle)
+        while len(entrees) > TAILLE_MAX:
+            entrees.popitem(last=False)
+            _stats[modele]["ecartees"] += 1
+
+
+def get(db: Session, modele, id_: int):
+    """Instance d'id `id_` (None si absente)"""
+    if id_ is None:
+        return None
+    if not _actif:
+        return db.query(modele).filter(modele.id == id_).first()
+    _verifier_base(db)
+    version, copie = _lire(modele, id_)
+    if copie is not None:
+        return _rattacher(db, copie)
+    instance = db.query(modele).filter(modele.id == id_).first()
+    if instance is not None:
+        _garder(db, modele, id_, version, _copie(instance))
+    return instance
+
+
+def liste(db: Session, modele, cle: tuple, requete):
+    """Résultat de requete() (liste d'instances de `modele`), gardé sous la clé `cle`"""
+    if not _actif:
+        return requete()
+    _verifier_base(db)
+    version, copies = _lire(modele, cle)
+    if copies is not None:
+        return [_rattacher(db, copie) for copie in copies]
+    instances = requete()
+    _garder(db, modele, cle, version, [_copie(instance) for instance in instances])
+    return instances
+
+
+# ========================
+# INVALIDATION
+# ========================
+def _modification(mapper, connection, cible):
+    session = Session.object_session(cible)
+    invalider(mapper.class_, session)
+
+
+for _modele in MODELES:
+    for _evenement in ("after_insert", "after_update", "after_delete"):
+        event.listen(_modele, _evenement, _modification)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _modification_en_masse(contexte):
+    invalider(contexte.mapper.class_, contexte.session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _fin_transaction(session, transaction):
+    # Validée ou annulée : les lectures faites par d'autres sessions pendant
+    # la transaction sont écartées (nouvelle version)
+    if transaction.parent is None:
+        session.info.pop("referentiel_verifie", None)
+        for modele in session.info.pop("referentiel_modifie", ()):
+            invalider(modele)
@@ -0,0 +1,113 @@
+# schemas.py
+from datetime import date, datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+TypeJournal = Literal["ACHAT", "VENTE", "CAISSE", "PRODUCTION", "CONSOMMATION", "CHARGES"]
+
+
+# ========================
+# JOURNAL QUOTIDIEN
+# ========================
+class JournalEntryCreate(BaseModel):
+    date_operation: Optional[datetime] = None
+    type_journal: TypeJournal
+    type_document: Optional[str] = None  # BL, FACTURE, AVOIR
+    numero_piece: str
+    libelle: str
+    produit_id: Optional[int] = None
+    client_id: Optional[int] = None
+    fournisseur_id: Optional[int] = None
+    unite_production: Optional[str] = None
+    quantite: float = 0.0
+    prix_unitaire: float = 0.0
+    montant_ht: float = 0.0
+    taux_tva: float = 19.0
+    montant_tva: float = 0.0
+    montant_ttc: float = 0.0
+    tva_applicable: bool = True
+    dt_applicable: bool = True
+    droit_timbre: float = 0.0
+    adresse_livraison: Optional[str] = None
+    matricule_camion: Optional[str] = None
+    type_charge: Optional[str] = None
+    centre_production: Optional[str] = None
+
+
+class JournalBatch(BaseModel):
+    entries: List[JournalEntryCreate] = Field(..., min_items=1)
+    comptabiliser: bool = False
+
+
+class PostingRequest(BaseModel):
+    ids: List[int] = Field(..., min_items=1)
+
+
+class PostingResult(BaseModel):
+    journal_id: Optional[int]
+    status: str
+    message: str
+    nombre_ecritures: int = 0
+
+
+class JournalBatchResult(BaseModel):
+    ids: List[int]
+    comptabilisation: List[PostingResult] = []
+
+
+class JournalLine(BaseModel):
+    id: int
+    date_operation: Optional[datetime]
+    type_journal: str
+    numero_piece: Optional[str]
+    libelle: Optional[str]
+    quantite: Optional[float]
+    montant_ttc: Optional[float]
+    tiers: str = ""
+    produit: str = ""
+
+
+class JournalPage(BaseModel):
+    items: List[JournalLine]
+    next_cursor: Optional[str] = None  # à repasser en `after` pour la page suivante
+
+
+# ========================
+# FACTURES
+# ========================
+class FactureOut(BaseModel):
+    id: int
+    numero_facture: str
+    client_id: Optional[int]
+    date_facture: date
+    montant_ht: float
+    montant_tva: float
+    montant_ttc: float
+    droit_timbre: float
+    montant_net_payer: float
+    date_echeance: Optional[date]
+    statut: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
+class FacturePage(BaseModel):
+    items: List[FactureOut]
+    page: int
+    page_size: int
+    has_more: bool
+
+
+class FacturationPeriode(BaseModel):
+    date_debut: date
+    date_fin: date
+    client_ids: Optional[List[int]] = None
+
+
+class FactureGeneree(BaseModel):
+    facture_id: int
+    numero_facture: str
+    client_id: int
+    nombre_bl: int
+    montant_net_payer: float
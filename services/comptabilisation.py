@@ -0,0 +1,392 @@
+# services/comptabilisation.py
+"""
+Règles de comptabilisation des entrées du journal quotidien.
+
+Chaque type de journal est décrit par une règle (REGLES) :
+- "journal" : journal comptable des écritures ;
+- "requis" : références obligatoires parmi "produit", "client", "fournisseur" ;
+- "valorisation" : "recette" (coût de production, services.recettes) ou
+  "cmp" (quantité au coût moyen du stock, prix d'achat à défaut) ; le coût
+  remplace montant_ht et montant_ttc de l'entrée ;
+- "champs" : colonnes de l'écriture copiées d'un champ de l'entrée ;
+- "lignes" : écritures, chacune avec
+    "debit", "credit" : compte (voir ci-dessous),
+    "montant" : champ de l'entrée, ou "cout" (valorisation) ; "abs" : valeur absolue,
+    "libelle" : modèle str.format ({journal.x}, {produit.x}),
+    "si" : champ booléen de l'entrée (ligne émise s'il est vrai et le
+           montant positif) ou (champ, opérateur, valeur) ;
+- "stock" : mouvement de stock (type, sens 1 ou -1, coût unitaire d'une
+  entrée : champ de l'entrée ou "cout" rapporté à la quantité) ;
+- "operation" : opération analytique (models.Operation) enregistrée avec
+  l'entrée : type et champ du montant.
+
+Comptes :
+- "530000" : compte fixe ;
+- ("produit", attribut, défaut) : compte du produit, défaut s'il est vide ;
+- ("client", défaut) / ("fournisseur", défaut) : compte du tiers, défaut sans tiers ;
+- ("famille", {famille: compte}, autre compte) : selon la famille du produit ;
+- ("champ", nom, {valeur: compte}, défaut) : selon un champ de l'entrée.
+
+Les règles sont compilées une fois, à l'import (champs vérifiés, fonctions
+de résolution construites) : comptabiliser une entrée se réduit à une
+recherche dans un dictionnaire et à l'application de sa règle. Un nouveau
+type de journal s'ajoute par une règle, sans code.
+"""
+import operator
+from sqlalchemy import case, func, literal, select, text
+from sqlalchemy.orm import Session
+from models import EcritureComptable, JournalQuotidien, Operation, Produit
+from crud import get_produit, get_client, get_fournisseur, get_stock_courant, update_stock
+from services import recettes
+
+REGLES = {
+    "ACHAT": {
+        "journal": "ACHATS",
+        "requis": ("produit", "fournisseur"),
+        "champs": {"fournisseur_id": "fournisseur_id", "numero_facture": "numero_piece"},
+        "lignes": [
+            {"debit": ("famille", {"PF": "351000", "SF": "351001"}, ("produit", "compte_stock", "311000")),
+             "credit": ("fournisseur", None),
+             "montant": "montant_ht",
+             "libelle": "Achat {journal.quantite} {produit.unite_mesure} {produit.designation} - {journal.libelle}"},
+            {"debit": "4456",  # TVA déductible
+             "credit": ("fournisseur", None),
+             "montant": "montant_tva",
+             "libelle": "TVA déductible {journal.taux_tva}% - {journal.libelle}",
+             "si": "tva_applicable"},
+        ],
+        "stock": {"type": "ACHAT", "sens": 1, "cout": "prix_unitaire"},
+        "operation": {"type": "achat", "montant": "montant_ttc"},
+    },
+    "VENTE": {
+        "journal": "VENTES",
+        "requis": ("produit", "client"),
+        "champs": {"client_id": "client_id", "numero_facture": "numero_piece"},
+        "lignes": [
+            {"debit": ("client", None),
+             "credit": ("produit", "compte_vente", "701000"),
+             "montant": "montant_ht",
+             "libelle": "Vente {journal.quantite} {produit.unite_mesure} {produit.designation} - {journal.libelle}"},
+            {"debit": ("client", None),
+             "credit": "4457",  # TVA collectée
+             "montant": "montant_tva",
+             "libelle": "TVA collectée {journal.taux_tva}% - {journal.libelle}",
+             "si": "tva_applicable"},
+            {"debit": ("client", None),
+             "credit": "4458",  # Droit de timbre
+             "montant": "droit_timbre",
+             "libelle": "Droit de timbre - {journal.libelle}",
+             "si": "dt_applicable"},
+        ],
+        "stock": {"type": "VENTE", "sens": -1},
+        "operation": {"type": "vente", "montant": "montant_ttc"},
+    },
+    "CAISSE": {
+        # Recette si le montant est positif, dépense s'il est négatif, rien à zéro
+        "journal": "CAISSE",
+        "requis": (),
+        "champs": {"client_id": "client_id", "fournisseur_id": "fournisseur_id", "numero_facture": "numero_piece"},
+        "lignes": [
+            {"debit": "530000",
+             "credit": ("client", "758000"),  # Produits divers sans client
+             "montant": "montant_ttc", "abs": True,
+             "libelle": "{journal.libelle}",
+             "si": ("montant_ttc", ">", 0)},
+            {"debit": ("fournisseur", "658000"),  # Charges diverses sans fournisseur
+             "credit": "530000",
+             "montant": "montant_ttc", "abs": True,
+             "libelle": "{journal.libelle}",
+             "si": ("montant_ttc", "<", 0)},
+        ],
+    },
+    "PRODUCTION": {
+        "journal": "PRODUCTION",
+        "requis": ("produit",),
+        "valorisation": "recette",
+        "lignes": [
+            {"debit": ("produit", "compte_stock", "311000"),
+             "credit": ("famille", {"déchet": "701003", "SF": "701004"}, "713000"),
+             "montant": "cout",
+             "libelle": "Production {journal.quantite} {produit.unite_mesure} {produit.designation} - {journal.libelle}"},
+        ],
+        "stock": {"type": "PRODUCTION", "sens": 1, "cout": "cout"},
+        "operation": {"type": "production", "montant": "montant_ht"},
+    },
+    "CONSOMMATION": {
+        "journal": "PRODUCTION",
+        "requis": ("produit",),
+        "valorisation": "cmp",
+        "lignes": [
+            {"debit": ("produit", "compte_achat", "601000"),
+             "credit": ("produit", "compte_stock", "311000"),
+             "montant": "cout",
+             "libelle": "Consommation {journal.quantite} {produit.unite_mesure} {produit.designation} - {journal.libelle}"},
+        ],
+        "stock": {"type": "CONSOMMATION", "sens": -1},
+        "operation": {"type": "consommation", "montant": "montant_ht"},
+    },
+    "CHARGES": {
+        "journal": "CHARGES",
+        "requis": (),
+        "lignes": [
+            {"debit": ("champ", "type_charge", {"MO": "641000", "ELEC": "606100", "AMORT": "681100"}, "611000"),
+             "credit": "401000",
+             "montant": "montant_ttc",
+             "libelle": "Charge de production - {journal.libelle}"},
+        ],
+        "operation": {"type": "charge", "montant": "montant_ttc"},
+    },
+}
+
+_REFERENCES = {"produit": get_produit, "client": get_client, "fournisseur": get_fournisseur}
+_OPERATEURS = {"==": operator.eq, "!=": operator.ne, ">": operator.gt, ">=": operator.ge,
+               "<": operator.lt, "<=": operator.le}
+
+
+# ========================
+# COMPILATION
+# ========================
+def _champ(nom: str) -> str:
+    if not hasattr(JournalQuotidien, nom):
+        raise ValueError(f"Règles de comptabilisation : champ inconnu {nom!r}")
+    return nom
+
+
+def _compiler_compte(spec, references: set):
+    """Fonction (journal, refs) -> compte ; ajoute à references les tiers utilisés"""
+    if isinstance(spec, str):
+        return lambda journal, refs: spec
+    nature = spec[0]
+    if nature == "produit":
+        _, attribut, defaut = spec
+        references.add("produit")
+        return lambda journal, refs: getattr(refs["produit"], attribut) or defaut
+    if nature in ("client", "fournisseur"):
+        defaut = spec[1]
+        references.add(nature)
+        return lambda journal, refs: refs[nature].compte_comptable if refs[nature] is not None else defaut
+    if nature == "famille":
+        _, comptes, autre = spec
+        references.add("produit")
+        autre = _compiler_compte(autre, references)
+        return lambda journal, refs: comptes.get(refs["produit"].famille) or autre(journal, refs)
+    if nature == "champ":
+        _, nom, comptes, defaut = spec
+        nom = _champ(nom)
+        return lambda journal, refs: comptes.get(getattr(journal, nom), defaut)
+    raise ValueError(f"Règles de comptabilisation : compte inconnu {spec!r}")
+
+
+def _compiler_condition(si):
+    """Fonction (journal, montant) -> bool, ou None pour une ligne toujours émise"""
+    if si is None:
+        return None
+    if isinstance(si, str):
+        nom = _champ(si)
+        return lambda journal, montant: bool(getattr(journal, nom)) and (montant or 0) > 0
+    nom, operateur, valeur = si
+    nom, comparer = _champ(nom), _OPERATEURS[operateur]
+    return lambda journal, montant: comparer(getattr(journal, nom) or 0, valeur)
+
+
+def _compiler_montant(spec: str, absolu: bool):
+    if spec == "cout":
+        montant = lambda journal, cout: cout
+    else:
+        nom = _champ(spec)
+        montant = lambda journal, cout: getattr(journal, nom)
+    if absolu:
+        return lambda journal, cout: abs(montant(journal, cout))
+    return montant
+
+
+class _Regle:
+    """Règle compilée d'un type de journal"""
+    __slots__ = ("journal", "references", "requis", "message", "valorisation", "champs", "lignes", "stock",
+                 "operation")
+
+    def __init__(self, regle: dict):
+        self.journal = regle["journal"]
+        self.valorisation = regle.get("valorisation")
+        if self.valorisation not in (None, "recette", "cmp"):
+            raise ValueError(f"Règles de comptabilisation : valorisation inconnue {self.valorisation!r}")
+        self.champs = tuple((colonne, _champ(nom)) for colonne, nom in regle.get("champs", {}).items())
+
+        references = set(regle.get("requis", ()))
+        self.lignes = []
+        for ligne in regle["lignes"]:
+            if "{produit." in ligne["libelle"]:
+                references.add("produit")
+            self.lignes.append((
+                _compiler_compte(ligne["debit"], references),
+                _compiler_compte(ligne["credit"], references),
+                _compiler_montant(ligne["montant"], ligne.get("abs", False)),
+                ligne["libelle"],
+                _compiler_condition(ligne.get("si"))
+            ))
+        if self.valorisation:
+            references.add("produit")
+        self.references = tuple((nom, _REFERENCES[nom], nom + "_id") for nom in sorted(references))
+        self.requis = tuple(regle.get("requis", ()))
+        self.message = " ou ".join(self.requis).capitalize() + " introuvable" if self.requis else None
+
+        stock = regle.get("stock")
+        if stock:
+            cout = stock.get("cout")
+            if cout not in (None, "cout"):
+                _champ(cout)
+            self.stock = (stock["type"], stock["sens"], cout)
+        else:
+            self.stock = None
+        operation = regle.get("operation")
+        self.operation = (operation["type"], _champ(operation["montant"])) if operation else None
+
+    def appliquer(self, db: Session, journal: JournalQuotidien) -> list:
+        refs = {nom: lire(db, getattr(journal, champ)) for nom, lire, champ in self.references}
+        if any(refs[nom] is None for nom in self.requis):
+            raise ValueError(self.message)
+        produit = refs.get("produit")
+        unite = journal.unite_production or "GENERAL"
+
+        cout = None
+        if self.valorisation == "recette":
+            cout = recettes.cout_production(db, journal.produit_id, journal.quantite, journal.unite_production)
+        elif self.valorisation == "cmp":
+            stock = get_stock_courant(db, journal.produit_id, unite)
+            cout = journal.quantite * (stock[1] if stock else float(produit.prix_achat or 0))
+        if cout is not None:
+            journal.montant_ht = cout
+            journal.montant_ttc = cout
+
+        base = {"journal_id": journal.id, "date_comptable": journal.date_operation, "journal": self.journal}
+        for colonne, nom in self.champs:
+            base[colonne] = getattr(journal, nom)
+        ecritures = []
+        for debit, credit, montant, libelle, condition in self.lignes:
+            valeur = montant(journal, cout)
+            if condition is not None and not condition(journal, valeur):
+                continue
+            ecritures.append(dict(base, libelle=libelle.format(journal=journal, **refs),
+                                  compte_debit=debit(journal, refs), compte_credit=credit(journal, refs),
+                                  montant=valeur))
+
+        if self.stock:
+            type_mouvement, sens, cout_stock = self.stock
+            if cout_stock == "cout":
+                cout_unitaire = cout / journal.quantite if journal.quantite > 0 else 0
+            else:
+                cout_unitaire = getattr(journal, cout_stock) if cout_stock else None
+            update_stock(db, journal.produit_id, unite, sens * journal.quantite, cout_unitaire, commit=False,
+                         type_mouvement=type_mouvement, date_mouvement=journal.date_operation, journal_id=journal.id)
+        return ecritures
+
+    def operation_analytique(self, db: Session, journal: JournalQuotidien):
+        """Ligne de models.Operation de l'entrée (dictionnaire), ou None"""
+        if self.operation is None:
+            return None
+        type_operation, montant = self.operation
+        produit = get_produit(db, journal.produit_id)
+        montant = getattr(journal, montant)
+        return {
+            "journal_id": journal.id,
+            "date_comptable": journal.date_operation,
+            "unite_production": journal.unite_production or "GENERAL",
+            "type_operation": type_operation,
+            "produit_id": journal.produit_id,
+            "famille": produit.famille if produit else None,
+            "client_id": journal.client_id,
+            "fournisseur_id": journal.fournisseur_id,
+            "quantite": journal.quantite,
+            "cout_unitaire": float(montant or 0) / journal.quantite if journal.quantite else journal.prix_unitaire,
+            "montant": montant,
+            "libelle": journal.libelle,
+            "validee": True
+        }
+
+
+_REGLES = {type_journal: _Regle(regle) for type_journal, regle in REGLES.items()}
+
+
+# ========================
+# APPLICATION
+# ========================
+def generer_ecritures(db: Session, journal: JournalQuotidien) -> list:
+    """
+    Construit les écritures (dictionnaires) d'une entrée du journal et applique
+    ses mouvements de stock, sans valider la transaction.
+    """
+    regle = _REGLES.get(journal.type_journal)
+    if regle is None:
+        raise ValueError(f"Type de journal inconnu : {journal.type_journal}")
+    return regle.appliquer(db, journal)
+
+
+def generer_operation(db: Session, journal: JournalQuotidien):
+    """Opération analytique d'une entrée comptabilisée (dictionnaire), ou None pour ce type de journal"""
+    regle = _REGLES.get(journal.type_journal)
+    return regle.operation_analytique(db, journal) if regle is not None else None
+
+
+def ensure_operations(db: Session) -> int:
+    """
+    Opérations analytiques des entrées déjà comptabilisées qui n'en ont pas
+    (bases antérieures à la table operations), en un INSERT ... SELECT dont
+    le type et le montant suivent les règles ; retourne leur nombre
+    """
+    regles = {type_journal: regle.operation for type_journal, regle in _REGLES.items() if regle.operation}
+    if not regles:
+        return 0
+    type_operation = case({type_journal: type_op for type_journal, (type_op, _) in regles.items()},
+                          value=JournalQuotidien.type_journal)
+    montant = case({type_journal: getattr(JournalQuotidien, champ) for type_journal, (_, champ) in regles.items()},
+                   value=JournalQuotidien.type_journal)
+    selection = select(
+        JournalQuotidien.id,
+        JournalQuotidien.date_operation,
+        func.coalesce(func.nullif(JournalQuotidien.unite_production, ""), "GENERAL"),
+        type_operation,
+        JournalQuotidien.produit_id,
+        Produit.famille,
+        JournalQuotidien.client_id,
+        JournalQuotidien.fournisseur_id,
+        JournalQuotidien.quantite,
+        case((JournalQuotidien.quantite != 0, montant / JournalQuotidien.quantite),
+             else_=JournalQuotidien.prix_unitaire),
+        montant,
+        JournalQuotidien.libelle,
+        literal(True)
+    ).outerjoin(
+        Produit, Produit.id == JournalQuotidien.produit_id
+    ).where(
+        JournalQuotidien.comptabilisee == True,
+        JournalQuotidien.type_journal.in_(list(regles)),
+        ~select(Operation.id).where(Operation.journal_id == JournalQuotidien.id).exists()
+    )
+    resultat = db.execute(Operation.__table__.insert().from_select(
+        ["journal_id", "date_comptable", "unite_production", "type_operation", "produit_id", "famille",
+         "client_id", "fournisseur_id", "quantite", "cout_unitaire", "montant", "libelle", "validee"],
+        selection
+    ))
+    db.commit()
+    return resultat.rowcount
+
+
+def ensure_journal_ecritures(db: Session) -> bool:
+    """
+    Migration des bases existantes : ajoute la colonne journal (code du
+    journal comptable) à ecritures_comptables et la renseigne d'après la
+    règle du type de l'entrée d'origine ("OD" sans entrée d'origine)
+    """
+    colonnes = {ligne[1] for ligne in db.execute(text("PRAGMA table_info(ecritures_comptables)"))}
+    if "journal" in colonnes:
+        return False
+    db.execute(text("ALTER TABLE ecritures_comptables ADD COLUMN journal VARCHAR(50)"))
+    type_journal = select(JournalQuotidien.type_journal).where(
+        JournalQuotidien.id == EcritureComptable.journal_id
+    ).scalar_subquery()
+    db.execute(EcritureComptable.__table__.update().values(journal=func.coalesce(
+        case({type_journal_: regle.journal for type_journal_, regle in _REGLES.items()}, value=type_journal),
+        "OD"
+    )))
+    db.commit()
+    return True
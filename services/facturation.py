@@ -0,0 +1,103 @@
+# services/facturation.py
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+from models import *
+from crud import *
+
+
+def facturer_periode(db: Session, date_debut: date, date_fin: date, client_ids: list = None, date_facture: date = None):
+    """
+    Facture en une passe les BL (ventes non facturées) de la période, une
+    facture par client.
+
+    Une requête pour tous les BL, un bloc de numéros réservé d'un coup,
+    insertion en masse des factures et des lignes, rattachement des BL par un
+    UPDATE groupé, le tout dans une seule transaction.
+
+    Retourne une entrée par facture créée :
+    {"facture_id", "numero_facture", "client_id", "nombre_bl", "montant_net_payer"}
+    """
+    date_facture = date_facture or date.today()
+    query = db.query(
+        JournalQuotidien.id,
+        JournalQuotidien.client_id,
+        JournalQuotidien.produit_id,
+        JournalQuotidien.quantite,
+        JournalQuotidien.prix_unitaire,
+        JournalQuotidien.montant_ht,
+        JournalQuotidien.taux_tva,
+        JournalQuotidien.montant_tva,
+        JournalQuotidien.montant_ttc
+    ).filter(
+        JournalQuotidien.type_journal == "VENTE",
+        JournalQuotidien.facture_id.is_(None),
+        JournalQuotidien.client_id.isnot(None),
+        JournalQuotidien.date_operation >= datetime.combine(date_debut, datetime.min.time()),
+        JournalQuotidien.date_operation <= datetime.combine(date_fin, datetime.max.time())
+    )
+    if client_ids is not None:
+        query = query.filter(JournalQuotidien.client_id.in_(client_ids))
+
+    bls_par_client = {}
+    for bl in query.order_by(JournalQuotidien.client_id, JournalQuotidien.date_operation, JournalQuotidien.id):
+        bls_par_client.setdefault(bl.client_id, []).append(bl)
+    if not bls_par_client:
+        return []
+
+    try:
+        numeros = reserver_numeros(db, len(bls_par_client), "FACTURE", date_facture.year)
+
+        factures = []
+        for numero, (client_id, bls) in zip(numeros, bls_par_client.items()):
+            montant_ht = sum(float(bl.montant_ht or 0) for bl in bls)
+            montant_tva = sum(float(bl.montant_tva or 0) for bl in bls)
+            montant_ttc = sum(float(bl.montant_ttc or 0) for bl in bls)
+            droit_timbre = calcul_droit_timbre(montant_ttc)
+            factures.append({
+                "numero_facture": numero,
+                "client_id": client_id,
+                "date_facture": date_facture,
+                "montant_ht": montant_ht,
+                "montant_tva": montant_tva,
+                "montant_ttc": montant_ttc,
+                "droit_timbre": droit_timbre,
+                "montant_net_payer": montant_ttc + droit_timbre,
+                "date_echeance": date_facture + timedelta(days=30),
+                "statut": "EN_ATTENTE"
+            })
+        db.bulk_insert_mappings(Facture, factures)
+
+        # Identifiants des factures insérées, relus par numéro (unique)
+        ids = dict(db.query(Facture.numero_facture, Facture.id).filter(
+            Facture.numero_facture.in_(numeros)
+        ).all())
+
+        lignes, rattachements = [], []
+        for facture in factures:
+            facture_id = ids[facture["numero_facture"]]
+            facture["facture_id"] = facture_id
+            for bl in bls_par_client[facture["client_id"]]:
+                lignes.append({
+                    "facture_id": facture_id,
+                    "produit_id": bl.produit_id,
+                    "quantite": bl.quantite,
+                    "prix_unitaire": bl.prix_unitaire,
+                    "montant_ht": bl.montant_ht,
+                    "taux_tva": bl.taux_tva,
+                    "montant_tva": bl.montant_tva
+                })
+                rattachements.append({"id": bl.id, "facture_id": facture_id})
+        db.bulk_insert_mappings(LigneFacture, lignes)
+        db.bulk_update_mappings(JournalQuotidien, rattachements)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return [{
+        "facture_id": facture["facture_id"],
+        "numero_facture": facture["numero_facture"],
+        "client_id": facture["client_id"],
+        "nombre_bl": len(bls_par_client[facture["client_id"]]),
+        "montant_net_payer": facture["montant_net_payer"]
+    } for facture in factures]
@@ -0,0 +1,233 @@
+# services/ledger.py
+"""
+Balance générale et grand-livre.
+
+Les cumuls débit / crédit par compte et par mois sont tenus dans
+soldes_comptes au moment de la comptabilisation : la balance d'un exercice se
+lit dans ces agrégats, sans reparcourir ecritures_comptables.
+"""
+from datetime import date
+from sqlalchemy import and_, or_, case, func, literal, union_all, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from models import *
+
+
+def appliquer_soldes_comptes(db: Session, ecritures: list):
+    """Reporte des écritures (dictionnaires) dans soldes_comptes, sans valider"""
+    deltas = {}
+    for ecriture in ecritures:
+        periode = ecriture["date_comptable"].strftime("%Y-%m")
+        montant = float(ecriture["montant"] or 0)
+        for compte, sens in ((ecriture["compte_debit"], 0), (ecriture["compte_credit"], 1)):
+            delta = deltas.setdefault((compte, periode), [0.0, 0.0, 0])
+            delta[sens] += montant
+            delta[2] += 1
+
+    table_ = SoldeCompte.__table__
+    for (compte, periode), (debit, credit, nombre) in deltas.items():
+        stmt = sqlite_insert(table_).values(
+            compte=compte, periode=periode, classe=compte[:1],
+            total_debit=debit, total_credit=credit, nombre_ecritures=nombre
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["compte", "periode"],
+            set_={col: table_.c[col] + stmt.excluded[col]
+                  for col in ("total_debit", "total_credit", "nombre_ecritures")}
+        ))
+
+
+def rebuild_soldes_comptes(db: Session):
+    """Recalcule entièrement soldes_comptes à partir des écritures"""
+    periode = func.strftime("%Y-%m", EcritureComptable.date_comptable)
+    mouvements = union_all(
+        select(
+            EcritureComptable.compte_debit.label("compte"),
+            periode.label("periode"),
+            EcritureComptable.montant.label("debit"),
+            literal(0).label("credit")
+        ),
+        select(
+            EcritureComptable.compte_credit,
+            periode,
+            literal(0),
+            EcritureComptable.montant
+        )
+    ).subquery()
+    agregats = select(
+        mouvements.c.compte,
+        mouvements.c.periode,
+        func.substr(mouvements.c.compte, 1, 1),
+        func.sum(mouvements.c.debit),
+        func.sum(mouvements.c.credit),
+        func.count()
+    ).group_by(mouvements.c.compte, mouvements.c.periode)
+
+    try:
+        db.query(SoldeCompte).delete(synchronize_session=False)
+        db.execute(SoldeCompte.__table__.insert().from_select(
+            ["compte", "periode", "classe", "total_debit", "total_credit", "nombre_ecritures"],
+            agregats
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def ensure_soldes_comptes(db: Session):
+    """Alimente soldes_comptes sur une base existante dont la table est vide"""
+    if db.query(SoldeCompte.id).first() or not db.query(EcritureComptable.id).first():
+        return False
+    rebuild_soldes_comptes(db)
+    return True
+
+
+# Comptes de bilan : leurs cumuls sont reportés d'un exercice à l'autre ; les
+# autres (6 charges, 7 produits) repartent de zéro à l'ouverture de l'exercice
+CLASSES_BILAN = ("1", "2", "3", "4", "5")
+# Compte qui reçoit dans la balance le résultat (classes 6 et 7) des exercices antérieurs
+COMPTE_REPORT_RESULTAT = "12"
+
+
+def _bornes_periode(periode: str):
+    """'2025' (exercice) ou '2025-03' (mois) -> (premier mois, dernier mois) au format AAAA-MM"""
+    if len(periode) == 4:
+        return f"{periode}-01", f"{periode}-12"
+    return periode, periode
+
+
+def get_balance_generale(db: Session, periode: str, classe: int = None):
+    """
+    Balance générale d'un exercice ('2025') ou d'un mois ('2025-03').
+
+    Pour chaque compte : report à nouveau (cumuls antérieurs à la période,
+    depuis l'ouverture de l'exercice pour les classes 6 et 7), mouvements
+    débit / crédit de la période et solde final débiteur ou créditeur. Le
+    résultat des exercices antérieurs (cumuls des classes 6 et 7 avant
+    l'ouverture) est reporté sur COMPTE_REPORT_RESULTAT, en classe 1 : les
+    totaux restent équilibrés d'un exercice à l'autre. Une seule requête
+    groupée sur soldes_comptes.
+    """
+    debut, fin = _bornes_periode(periode)
+    anterieur = SoldeCompte.periode < debut
+    ouverture_exercice = f"{periode[:4]}-01"
+    resultat_anterieur = and_(SoldeCompte.classe.notin_(CLASSES_BILAN), SoldeCompte.periode < ouverture_exercice)
+    compte_balance = case((resultat_anterieur, COMPTE_REPORT_RESULTAT), else_=SoldeCompte.compte)
+    classe_balance = case((resultat_anterieur, COMPTE_REPORT_RESULTAT[:1]), else_=SoldeCompte.classe)
+
+    def _somme(condition, colonne):
+        return func.coalesce(func.sum(case((condition, colonne), else_=0)), 0)
+
+    query = db.query(
+        compte_balance,
+        PlanComptable.libelle,
+        _somme(anterieur, SoldeCompte.total_debit - SoldeCompte.total_credit),
+        _somme(~anterieur, SoldeCompte.total_debit),
+        _somme(~anterieur, SoldeCompte.total_credit)
+    ).outerjoin(
+        PlanComptable, PlanComptable.compte == compte_balance
+    ).filter(
+        SoldeCompte.periode <= fin
+    )
+    if classe is not None:
+        query = query.filter(classe_balance == str(classe))
+
+    lignes = []
+    totaux = {"report": 0.0, "debit": 0.0, "credit": 0.0, "solde_debiteur": 0.0, "solde_crediteur": 0.0}
+    for compte, libelle, report, debit, credit in query.group_by(compte_balance).order_by(compte_balance):
+        report, debit, credit = float(report), float(debit), float(credit)
+        solde = report + debit - credit
+        ligne = {
+            "compte": compte,
+            "libelle": libelle or "",
+            "report": report,
+            "debit": debit,
+            "credit": credit,
+            "solde_debiteur": solde if solde > 0 else 0.0,
+            "solde_crediteur": -solde if solde < 0 else 0.0
+        }
+        lignes.append(ligne)
+        for cle in totaux:
+            totaux[cle] += ligne[cle]
+
+    return {"periode": periode, "lignes": lignes, "totaux": totaux}
+
+
+def _solde_ouverture(db: Session, compte: str, start: date):
+    """Solde d'un compte à la veille de start : mois clos lus dans soldes_comptes
+    (depuis l'ouverture de l'exercice pour les classes 6 et 7), jours du mois
+    en cours lus dans les écritures"""
+    debut_mois = start.replace(day=1)
+    query = db.query(
+        func.coalesce(func.sum(SoldeCompte.total_debit - SoldeCompte.total_credit), 0)
+    ).filter(
+        SoldeCompte.compte == compte,
+        SoldeCompte.periode < debut_mois.strftime("%Y-%m")
+    )
+    if compte[:1] not in CLASSES_BILAN:
+        query = query.filter(SoldeCompte.periode >= f"{start.year}-01")
+    cumul = query.scalar()
+
+    if start > debut_mois:
+        cumul += db.query(func.coalesce(func.sum(case(
+            (EcritureComptable.compte_debit == compte, EcritureComptable.montant),
+            else_=-EcritureComptable.montant
+        )), 0)).filter(
+            or_(EcritureComptable.compte_debit == compte, EcritureComptable.compte_credit == compte),
+            EcritureComptable.date_comptable >= debut_mois,
+            EcritureComptable.date_comptable < start
+        ).scalar()
+
+    return float(cumul)
+
+
+def iter_grand_livre(db: Session, compte: str, start: date, end: date, batch_size: int = 500):
+    """
+    Grand-livre d'un compte entre deux dates, ligne par ligne (générateur).
+
+    Commence par le solde d'ouverture, puis produit chaque écriture avec le
+    solde progressif. Les écritures sont lues par lots de batch_size sans
+    charger la période entière en mémoire.
+    """
+    solde = _solde_ouverture(db, compte, start)
+    yield {
+        "date_comptable": start,
+        "journal": None,
+        "reference": None,
+        "libelle": "Solde d'ouverture",
+        "contrepartie": None,
+        "debit": solde if solde > 0 else 0.0,
+        "credit": -solde if solde < 0 else 0.0,
+        "solde": solde
+    }
+
+    query = db.query(
+        EcritureComptable.date_comptable,
+        EcritureComptable.journal,
+        EcritureComptable.numero_facture,
+        EcritureComptable.libelle,
+        EcritureComptable.compte_debit,
+        EcritureComptable.compte_credit,
+        EcritureComptable.montant
+    ).filter(
+        or_(EcritureComptable.compte_debit == compte, EcritureComptable.compte_credit == compte),
+        EcritureComptable.date_comptable >= start,
+        EcritureComptable.date_comptable <= end
+    ).order_by(EcritureComptable.date_comptable, EcritureComptable.id).yield_per(batch_size)
+
+    for date_comptable, journal, reference, libelle, compte_debit, compte_credit, montant in query:
+        montant = float(montant)
+        debit = montant if compte_debit == compte else 0.0
+        credit = montant if compte_credit == compte else 0.0
+        solde += debit - credit
+        yield {
+            "date_comptable": date_comptable,
+            "journal": journal,
+            "reference": reference,
+            "libelle": libelle,
+            "contrepartie": compte_credit if compte_debit == compte else compte_debit,
+            "debit": debit,
+            "credit": credit,
+            "solde": solde
+        }
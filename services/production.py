@@ -3,7 +3,6 @@ from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
 from models import *
 from crud import *
-from decimal import Decimal
 
 
 def init_parameters(db: Session):
@@ -37,160 +36,53 @@ def init_parameters(db: Session):
         ("type_operation", "charge", "Charge de production"),
     ]
 
-    # Créer les paramètres s'ils n'existent pas
-    for type_param, valeur, description in unites_production + familles_produit + types_operation:
-        if not db.query(Parametres).filter(
-            Parametres.type_param == type_param,
-            Parametres.valeur == valeur
-        ).first():
-            create_parametre(db, {
-                "type_param": type_param,
-                "valeur": valeur,
-                "description": description
-            })
-
-
-def _calculate_production_cost(db: Session, journal: JournalQuotidien) -> float:
-    """
-    Calcule le coût de production d'un produit fini ou semi-fini.
-    Basé sur :
-    1. Le coût des matières premières consommées (CUMP)
-    2. Une répartition des charges de production (simplifiée ici à 20% du coût MP)
-    """
-    # Exemple de recette (à terme, cette donnée devrait être dans une table "Recette")
-    recette = {
-        "PF001": {"MP001": 2.5},  # 2.5 m³ de Bois de Chêne pour 1 Table en Chêne
-        "SF001": {"MP001": 1.2},  # 1.2 m³ pour 1 lot de Planches sciées
-        "PF002": {"MP002": 0.8},  # 0.8 m³ de Bois de Pin pour 1 Chaise
-    }
-
-    produit = get_produit(db, journal.produit_id)
-    if not produit or produit.code not in recette:
-        # Si pas de recette, utiliser le prix d'achat comme coût unitaire
-        return float(journal.quantite * (produit.prix_achat or 0))
-
-    cout_total = Decimal('0.0')
-    for code_mp, quantite_mp in recette[produit.code].items():
-        mp = db.query(Produit).filter(Produit.code == code_mp).first()
-        if mp:
-            # Récupérer le coût unitaire moyen du stock dans l'unité de production
-            stock_mp = get_stock_actuel(db, mp.id, journal.unite_production or "GENERAL")
-            cout_unitaire_mp = stock_mp.cout_unitaire_moyen if stock_mp else mp.prix_achat or 0
-            cout_total += Decimal(str(quantite_mp)) * Decimal(str(cout_unitaire_mp)) * Decimal(str(journal.quantite))
-
-    # Ajouter les charges de production (ex: 20% du coût des matières)
-    # À terme, cette valeur devrait être calculée à partir des écritures de charges
-    cout_total *= Decimal('1.2')
-
-    return float(cout_total)
-
-
-def _update_stock_production(db: Session, journal: JournalQuotidien, produit: Produit):
-    """
-    Met à jour le stock lors d'une production (ajout de PF ou SF).
-    Utilise le CMP (coût moyen pondéré) pour valoriser le stock.
-    """
-    stock_actuel = get_stock_actuel(db, produit.id, journal.unite_production or "GENERAL")
-    cout_production = _calculate_production_cost(db, journal)
-    cout_unitaire = cout_production / journal.quantite if journal.quantite > 0 else 0
-
-    if stock_actuel:
-        # CMP : (stock_actuel * prix_actuel + quantite_nouvelle * prix_nouveau) / total
-        ancienne_valeur = stock_actuel.quantite * stock_actuel.cout_unitaire_moyen
-        nouvelle_valeur = journal.quantite * cout_unitaire
-        nouvelle_quantite = stock_actuel.quantite + journal.quantite
-        if nouvelle_quantite > 0:
-            stock_actuel.cout_unitaire_moyen = (ancienne_valeur + nouvelle_valeur) / nouvelle_quantite
-        stock_actuel.quantite = nouvelle_quantite
-        stock_actuel.valeur_stock = stock_actuel.quantite * stock_actuel.cout_unitaire_moyen
-    else:
-        # Créer un nouveau stock
-        stock_actuel = Stock(
-            produit_id=produit.id,
-            unite_production=journal.unite_production or "GENERAL",
-            quantite=journal.quantite,
-            cout_unitaire_moyen=cout_unitaire,
-            valeur_stock=journal.quantite * cout_unitaire,
-            date_derniere_operation=datetime.now()
-        )
-        db.add(stock_actuel)
-
-    stock_actuel.date_derniere_operation = datetime.now()
-    db.commit()
-    db.refresh(stock_actuel)
-
-
-def _update_stock_consommation(db: Session, journal: JournalQuotidien, produit: Produit):
-    """
-    Met à jour le stock lors d'une consommation (sortie de MP).
-    Utilise le CUMP du stock pour valoriser la sortie.
-    """
-    stock_actuel = get_stock_actuel(db, produit.id, journal.unite_production or "GENERAL")
-    if not stock_actuel or stock_actuel.quantite < journal.quantite:
-        raise ValueError(f"Stock insuffisant pour {produit.designation} dans {journal.unite_production}")
-
-    # Valorisation au CUMP
-    cout_sortie = journal.quantite * stock_actuel.cout_unitaire_moyen
-
-    # Diminuer la quantité
-    stock_actuel.quantite -= journal.quantite
-    stock_actuel.valeur_stock -= cout_sortie
-
-    # Le coût unitaire moyen reste inchangé pour les sorties
-    if stock_actuel.quantite <= 0:
-        stock_actuel.quantite = 0
-        stock_actuel.valeur_stock = 0
-        stock_actuel.cout_unitaire_moyen = 0
-
-    stock_actuel.date_derniere_operation = datetime.now()
+    # Créer en une fois les paramètres qui n'existent pas
+    upsert_rows(db, Parametres, [
+        {"type_param": type_param, "valeur": valeur, "description": description}
+        for type_param, valeur, description in unites_production + familles_produit + types_operation
+    ], ("type_param", "valeur"), mise_a_jour=False)
     db.commit()
-    db.refresh(stock_actuel)
 
 
-def _create_operation_from_journal(db: Session, journal: JournalQuotidien, op_type: str):
+def _agregats_operations(db: Session, date_ref: date):
     """
-    Crée une entrée dans la table Operations à partir d'une entrée de JournalQuotidien.
-    Cette table est utilisée pour le calcul des métriques du tableau de bord.
+    Requête groupée par unité de production sur les opérations analytiques
+    de la journée : quantités et coûts de consommation de MP et de production
     """
-    operation_data = {
-        "journal_id": journal.id,
-        "date_comptable": journal.date_operation,
-        "unite_production": journal.unite_production or "GENERAL",
-        "type_operation": op_type,
-        "produit_id": journal.produit_id,
-        "client_id": journal.client_id,
-        "fournisseur_id": journal.fournisseur_id,
-        "quantite": journal.quantite,
-        "cout_unitaire": journal.prix_unitaire,
-        "montant": journal.montant_ttc,
-        "libelle": journal.libelle,
-        "validee": True
-    }
-    db_operation = Operation(**operation_data)
-    db.add(db_operation)
-    db.commit()
-    db.refresh(db_operation)
-    return db_operation
+    from sqlalchemy import case, func
+
+    def _somme(type_operation, colonne, condition):
+        return func.coalesce(func.sum(case(
+            ((Operation.type_operation == type_operation) & condition, colonne),
+            else_=0
+        )), 0)
+
+    familles_produites = Operation.famille.in_(["PF", "SF", "déchet"])
+    return db.query(
+        Operation.unite_production.label("unite"),
+        func.count(Operation.id).label("nombre"),
+        _somme("consommation", Operation.quantite, Operation.famille == "MP").label("bois_consomme"),
+        _somme("consommation", Operation.montant, Operation.famille == "MP").label("cout_consommation"),
+        _somme("production", Operation.quantite, Operation.famille == "PF").label("produits_finis"),
+        _somme("production", Operation.quantite, Operation.famille == "SF").label("semi_finis"),
+        _somme("production", Operation.quantite, Operation.famille == "déchet").label("dechets"),
+        _somme("production", Operation.montant, Operation.produit_id.isnot(None)).label("cout_production"),
+        _somme("production", Operation.montant, familles_produites).label("valeur_production")
+    ).filter(
+        Operation.date_comptable >= datetime.combine(date_ref, datetime.min.time()),
+        Operation.date_comptable <= datetime.combine(date_ref, datetime.max.time())
+    ).group_by(Operation.unite_production).order_by(Operation.unite_production)
 
 
 def calculate_daily_metrics(db: Session, date_ref: date = None):
     """
     Calcule les métriques quotidiennes pour le tableau de bord.
     Retourne un dictionnaire avec les données de production, consommation, rendement, etc.
+    Une requête groupée par unité sur les opérations analytiques (models.Operation).
     """
     if not date_ref:
         date_ref = date.today()
 
-    start_date = datetime.combine(date_ref, datetime.min.time())
-    end_date = datetime.combine(date_ref, datetime.max.time())
-
-    # Récupérer toutes les opérations du jour
-    operations = db.query(Operation).filter(
-        Operation.date_comptable >= start_date,
-        Operation.date_comptable <= end_date
-    ).all()
-
-    # Initialiser les métriques
     metrics = {
         "date": date_ref,
         "bois_consomme": 0.0,
@@ -200,56 +92,35 @@ def calculate_daily_metrics(db: Session, date_ref: date = None):
         "cout_total_consommation": 0.0,
         "cout_total_production": 0.0,
         "rendement_moyen": 0.0,
-        "total_operations": len(operations),
+        "total_operations": 0,
         "details_unites": {}
     }
 
-    # Initialiser les unités de production
-    unites = get_parametres_by_type(db, "unite_production")
-    for unit in unites:
-        metrics["details_unites"][unit.valeur] = {
-            "bois_consomme": 0.0,
-            "produits_finis": 0.0,
-            "semi_finis": 0.0,
-            "dechets": 0.0,
-            "cout_consommation": 0.0,
-            "cout_production": 0.0,
+    def _unite_vide():
+        return {
+            "bois_consomme": 0.0, "produits_finis": 0.0, "semi_finis": 0.0,
+            "dechets": 0.0, "cout_consommation": 0.0, "cout_production": 0.0,
             "rendement": 0.0
         }
 
-    # Calculer les métriques
-    for op in operations:
-        unit_name = op.unite_production or "GENERAL"
-        if unit_name not in metrics["details_unites"]:
-            metrics["details_unites"][unit_name] = {
-                "bois_consomme": 0.0, "produits_finis": 0.0, "semi_finis": 0.0,
-                "dechets": 0.0, "cout_consommation": 0.0, "cout_production": 0.0,
-                "rendement": 0.0
-            }
-
-        unit_data = metrics["details_unites"][unit_name]
-
-        # Consommation de matières premières (MP)
-        if op.type_operation == "consommation" and op.produit and op.produit.famille == "MP":
-            metrics["bois_consomme"] += op.quantite
-            unit_data["bois_consomme"] += op.quantite
-            metrics["cout_total_consommation"] += op.montant
-            unit_data["cout_consommation"] += op.montant
-
-        # Production de produits
-        elif op.type_operation == "production" and op.produit:
-            metrics["cout_total_production"] += op.montant
-            unit_data["cout_production"] += op.montant
-
-            if op.produit.famille == "PF":
-                metrics["produits_finis"] += op.quantite
-                unit_data["produits_finis"] += op.quantite
-            elif op.produit.famille == "SF":
-                metrics["semi_finis"] += op.quantite
-                unit_data["semi_finis"] += op.quantite
-            elif op.produit.famille == "déchet":
-                metrics["dechets"] += op.quantite
-                unit_data["dechets"] += op.quantite
+    # Unités de production paramétrées, puis celles rencontrées dans la journée
+    for unit in get_parametres_by_type(db, "unite_production"):
+        metrics["details_unites"][unit.valeur] = _unite_vide()
+
+    for row in _agregats_operations(db, date_ref):
+        unit_data = metrics["details_unites"].setdefault(row.unite, _unite_vide())
+        for cle, valeur in (("bois_consomme", row.bois_consomme), ("produits_finis", row.produits_finis),
+                            ("semi_finis", row.semi_finis), ("dechets", row.dechets),
+                            ("cout_consommation", row.cout_consommation),
+                            ("cout_production", row.cout_production)):
+            unit_data[cle] = float(valeur)
+        metrics["total_operations"] += row.nombre
+        metrics["bois_consomme"] += unit_data["bois_consomme"]
+        metrics["produits_finis"] += unit_data["produits_finis"]
+        metrics["semi_finis"] += unit_data["semi_finis"]
+        metrics["dechets"] += unit_data["dechets"]
+        metrics["cout_total_consommation"] += unit_data["cout_consommation"]
+        metrics["cout_total_production"] += unit_data["cout_production"]
 
     # Calcul du rendement global
     total_output = metrics["produits_finis"] + metrics["semi_finis"] + metrics["dechets"]
@@ -257,7 +128,7 @@ def calculate_daily_metrics(db: Session, date_ref: date = None):
         metrics["rendement_moyen"] = (total_output / metrics["bois_consomme"]) * 100
 
     # Calcul du rendement par unité
-    for unit_name, unit_data in metrics["details_unites"].items():
+    for unit_data in metrics["details_unites"].values():
         total_output_unit = unit_data["produits_finis"] + unit_data["semi_finis"] + unit_data["dechets"]
         if unit_data["bois_consomme"] > 0:
             unit_data["rendement"] = (total_output_unit / unit_data["bois_consomme"]) * 100
@@ -267,43 +138,23 @@ def calculate_daily_metrics(db: Session, date_ref: date = None):
 
 def calculate_production_costs(db: Session, date_ref: date = None):
     """
-    Calcule les coûts de production détaillés par unité de production.
+    Calcule les coûts de production détaillés par unité de production
+    (une requête groupée sur les opérations analytiques de la journée).
     """
     if not date_ref:
         date_ref = date.today()
 
-    start_date = datetime.combine(date_ref, datetime.min.time())
-    end_date = datetime.combine(date_ref, datetime.max.time())
-
-    unites = get_parametres_by_type(db, "unite_production")
+    agregats = {row.unite: row for row in _agregats_operations(db, date_ref)}
     report = []
 
-    for unit_param in unites:
+    for unit_param in get_parametres_by_type(db, "unite_production"):
         unit_name = unit_param.valeur
+        row = agregats.get(unit_name)
 
-        # Récupérer les opérations de la journée pour cette unité
-        operations = db.query(Operation).filter(
-            Operation.date_comptable >= start_date,
-            Operation.date_comptable <= end_date,
-            Operation.unite_production == unit_name
-        ).all()
-
-        total_wood_consumed = sum(
-            op.quantite for op in operations
-            if op.type_operation == "consommation" and op.produit and op.produit.famille == "MP"
-        )
-        total_consumption_cost = sum(
-            op.montant for op in operations
-            if op.type_operation == "consommation" and op.produit and op.produit.famille == "MP"
-        )
-        total_produced_quantity = sum(
-            op.quantite for op in operations
-            if op.type_operation == "production" and op.produit and op.produit.famille in ["PF", "SF", "déchet"]
-        )
-        total_production_value = sum(
-            op.montant for op in operations
-            if op.type_operation == "production" and op.produit and op.produit.famille in ["PF", "SF", "déchet"]
-        )
+        total_wood_consumed = float(row.bois_consomme) if row else 0.0
+        total_consumption_cost = float(row.cout_consommation) if row else 0.0
+        total_produced_quantity = float(row.produits_finis + row.semi_finis + row.dechets) if row else 0.0
+        total_production_value = float(row.valeur_production) if row else 0.0
 
         cost_per_unit = total_production_value / total_produced_quantity if total_produced_quantity > 0 else 0
         rendement = (total_produced_quantity / total_wood_consumed) * 100 if total_wood_consumed > 0 else 0
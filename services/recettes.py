@@ -0,0 +1,246 @@
+# services/recettes.py
+"""
+Nomenclatures (recettes) et coût de revient des produits fabriqués.
+
+Une recette décrit les composants consommés pour `quantite_produite` unités
+d'un produit ; un composant peut lui-même être fabriqué (SF entrant dans un
+PF), sa valeur est alors remontée depuis sa propre recette.
+
+Les coûts unitaires de tous les produits à recette d'une unité de
+production sont calculés en une passe (une requête sur les stocks de
+l'unité) et gardés en cache :
+- le cache d'une unité est invalidé dès qu'un CMP de cette unité change
+  (événement sur Stock.cout_unitaire_moyen, ou notification de stock_cache),
+  et à l'annulation d'une transaction qui en avait modifié ;
+- la structure des recettes et les prix d'achat (coût de repli) sont gardés
+  à part, invalidés à toute modification d'une recette ou d'un prix d'achat.
+"""
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+from models import *
+import stock_cache
+
+_lock = threading.Lock()
+_generation = 0
+_structure = None  # {"recettes": {produit_id: (quantite_produite, taux, [(composant_id, quantite)])}, "prix_achat": {...}}
+_couts = {}  # unite_production -> {produit_id: coût unitaire}
+_stats = {"calculs": 0, "hits": 0}
+
+
+# ========================
+# CACHE ET INVALIDATION
+# ========================
+def invalider(unite_production: str = None):
+    """Vide le cache d'une unité (ou tout le cache, structure des recettes comprise)"""
+    global _generation, _structure
+    with _lock:
+        _generation += 1
+        if unite_production is None:
+            _structure = None
+            _couts.clear()
+        else:
+            _couts.pop(unite_production, None)
+
+
+def stats_cache() -> dict:
+    with _lock:
+        return dict(_stats, unites=len(_couts))
+
+
+@event.listens_for(Stock.cout_unitaire_moyen, "set")
+def _cmp_modifie(stock, valeur, ancienne, initiateur):
+    try:
+        if float(valeur or 0) == float(ancienne or 0):
+            return
+    except (TypeError, ValueError):
+        pass  # ancienne valeur non chargée : invalider par prudence
+    invalider(stock.unite_production)
+    session = Session.object_session(stock)
+    if session is not None:
+        session.info["recettes_cmp_modifie"] = True
+
+
+@event.listens_for(Produit.prix_achat, "set")
+def _prix_achat_modifie(produit, valeur, ancienne, initiateur):
+    try:
+        if float(valeur or 0) == float(ancienne or 0):
+            return
+    except (TypeError, ValueError):
+        pass
+    invalider()
+    session = Session.object_session(produit)
+    if session is not None:
+        session.info["recettes_cmp_modifie"] = True
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _apres_annulation(session, transaction_precedente):
+    # Les coûts calculés sur des CMP annulés ne sont plus valables
+    if session.info.get("recettes_cmp_modifie"):
+        invalider()
+        if not session.in_transaction():
+            session.info.pop("recettes_cmp_modifie", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _apres_validation(session):
+    if not session.in_nested_transaction():
+        session.info.pop("recettes_cmp_modifie", None)
+
+
+# CMP modifiés en mémoire par le cache des stocks (écriture différée)
+stock_cache.abonner(invalider)
+
+for _modele in (Recette, LigneRecette):
+    for _evenement in ("after_insert", "after_update", "after_delete"):
+        event.listen(_modele, _evenement, lambda mapper, connection, cible: invalider())
+
+
+# ========================
+# CALCUL DES COÛTS
+# ========================
+def _charger_structure(db: Session) -> dict:
+    """Recettes actives et prix d'achat des produits concernés (deux requêtes)"""
+    recettes = {}
+    for recette in db.query(Recette).options(selectinload(Recette.lignes)).filter(Recette.actif == True):
+        recettes[recette.produit_id] = (
+            float(recette.quantite_produite or 1.0),
+            float(recette.taux_charges or 0),
+            [(ligne.composant_id, float(ligne.quantite)) for ligne in recette.lignes]
+        )
+    ids = set(recettes) | {composant_id for _, _, lignes in recettes.values() for composant_id, _ in lignes}
+    prix_achat = {produit_id: float(prix or 0) for produit_id, prix in db.query(
+        Produit.id, Produit.prix_achat).filter(Produit.id.in_(ids))} if ids else {}
+    return {"recettes": recettes, "prix_achat": prix_achat}
+
+
+def _deroule(recettes: dict, produit_id: int, chemin: list):
+    """Vérifie l'absence de cycle sous produit_id (ValueError sinon)"""
+    if produit_id in chemin:
+        raise ValueError(f"Recette cyclique : {' -> '.join(str(p) for p in chemin + [produit_id])}")
+    if produit_id in recettes:
+        for composant_id, _ in recettes[produit_id][2]:
+            _deroule(recettes, composant_id, chemin + [produit_id])
+
+
+def calculer_couts_unitaires(db: Session, unite_production: str = "GENERAL") -> dict:
+    """
+    Coût unitaire de chaque produit à recette dans l'unité de production :
+    somme des composants (CMP du stock de l'unité s'il est positif, sinon
+    coût remonté de sa propre recette, sinon prix d'achat) rapportée à la
+    quantité produite, majorée du taux de charges indirectes.
+    Retourne {produit_id: coût unitaire}, servi depuis le cache si possible.
+
+    Les CMP modifiés par la transaction en cours (lignes pas encore écrites
+    du cache des stocks, ou lignes ORM modifiées) entrent dans le calcul ; ils
+    ne sont pas validés, le résultat n'est alors ni lu ni gardé dans le cache
+    partagé.
+    """
+    global _structure
+    with _lock:
+        couts = _couts.get(unite_production)
+        generation = _generation
+        structure = _structure
+
+    if structure is None:
+        structure = _charger_structure(db)
+    recettes, prix_achat = structure["recettes"], structure["prix_achat"]
+    en_attente = {produit_id: cout for (produit_id, unite), (_, cout) in stock_cache.lignes_en_attente(db).items()
+                  if unite == unite_production and produit_id in prix_achat}
+    non_valide = bool(en_attente) or db.info.get("recettes_cmp_modifie", False)
+
+    if couts is not None and not non_valide:
+        with _lock:
+            _stats["hits"] += 1
+        return couts
+
+    cmp = {}
+    if recettes:
+        for produit_id, cout in db.query(Stock.produit_id, Stock.cout_unitaire_moyen).filter(
+            Stock.unite_production == unite_production,
+            Stock.produit_id.in_(prix_achat)
+        ):
+            cmp[produit_id] = float(cout or 0)
+        cmp.update(en_attente)
+
+    couts = {}
+
+    def cout_recette(produit_id, chemin):
+        if produit_id not in couts:
+            if produit_id in chemin:
+                raise ValueError(f"Recette cyclique : {' -> '.join(str(p) for p in chemin + (produit_id,))}")
+            quantite_produite, taux, lignes = recettes[produit_id]
+            total = sum(quantite * cout_composant(composant_id, chemin + (produit_id,))
+                        for composant_id, quantite in lignes)
+            couts[produit_id] = total / (quantite_produite or 1.0) * (1 + taux / 100)
+        return couts[produit_id]
+
+    def cout_composant(composant_id, chemin):
+        if cmp.get(composant_id, 0) > 0:
+            return cmp[composant_id]
+        if composant_id in recettes:
+            return cout_recette(composant_id, chemin)
+        return prix_achat.get(composant_id, 0.0)
+
+    for produit_id in recettes:
+        cout_recette(produit_id, ())
+
+    with _lock:
+        _stats["calculs"] += 1
+        if generation == _generation:
+            _structure = structure
+            if not non_valide:
+                _couts[unite_production] = couts
+    return couts
+
+
+def cout_production(db: Session, produit_id: int, quantite: float, unite_production: str = None) -> float:
+    """
+    Coût de production de `quantite` unités d'un produit. Sans recette,
+    le prix d'achat du produit sert de coût unitaire.
+    """
+    couts = calculer_couts_unitaires(db, unite_production or "GENERAL")
+    if produit_id in couts:
+        return quantite * couts[produit_id]
+    produit = db.get(Produit, produit_id)
+    return quantite * float(produit.prix_achat or 0) if produit else 0.0
+
+
+# ========================
+# SAISIE DES RECETTES
+# ========================
+def get_recette(db: Session, produit_id: int):
+    return db.query(Recette).filter(Recette.produit_id == produit_id).first()
+
+
+def enregistrer_recette(db: Session, produit_id: int, composants: dict, quantite_produite: float = 1.0,
+                        taux_charges: float = 20.0, commit: bool = True):
+    """
+    Crée ou remplace la recette d'un produit ; composants : {composant_id: quantité}.
+    Refuse une recette qui introduirait un cycle.
+    """
+    recettes = _charger_structure(db)["recettes"]
+    recettes[produit_id] = (quantite_produite, taux_charges, list(composants.items()))
+    _deroule(recettes, produit_id, [])
+
+    recette = get_recette(db, produit_id)
+    if recette is None:
+        recette = Recette(produit_id=produit_id)
+        db.add(recette)
+    recette.quantite_produite = quantite_produite
+    recette.taux_charges = taux_charges
+    recette.actif = True
+    # Lignes mises à jour en place (contrainte d'unicité recette / composant)
+    lignes = {ligne.composant_id: ligne for ligne in recette.lignes}
+    for composant_id, quantite in composants.items():
+        if composant_id in lignes:
+            lignes.pop(composant_id).quantite = quantite
+        else:
+            recette.lignes.append(LigneRecette(composant_id=composant_id, quantite=quantite))
+    for ligne in lignes.values():
+        recette.lignes.remove(ligne)
+    if commit:
+        db.commit()
+        db.refresh(recette)
+    return recette
@@ -0,0 +1,207 @@
+# services/stocks.py
+"""
+Historique des stocks : mouvements_stock (en ajout seul, écrit par
+crud.update_stock) et arrêtés de fin de mois (stocks_instantanes).
+
+Le stock à une date se lit par crud.get_stock_a_date : dernier arrêté plus
+les mouvements postérieurs. Un mouvement antidaté supprime les arrêtés
+qu'il rend faux ; ensure_instantanes_stock les recrée, rejouer_cmp recalcule
+le CMP d'un produit après une correction antidatée.
+
+Usage : python -m services.stocks instantanes
+        python -m services.stocks rejouer --produit MP001 --depuis 2024-01-15 [--unite Scierie]
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from models import *
+import stock_cache
+from crud import appliquer_mouvement, get_stock_a_date, get_stock_actuel
+
+
+def ensure_mouvements_stock(db: Session) -> int:
+    """
+    Mouvement INITIAL pour chaque ligne de stocks sans historique (bases
+    antérieures aux mouvements, stocks de démonstration) ; retourne leur nombre
+    """
+    resultat = db.execute(text("""
+        INSERT INTO mouvements_stock (date_mouvement, produit_id, unite_production, type_mouvement,
+                                      quantite, cout_unitaire, valeur)
+        SELECT COALESCE(s.date_derniere_operation, :maintenant), s.produit_id, s.unite_production, 'INITIAL',
+               s.quantite, s.cout_unitaire_moyen, COALESCE(s.valeur_stock, s.quantite * s.cout_unitaire_moyen)
+        FROM stocks s
+        WHERE s.quantite != 0 AND NOT EXISTS (
+            SELECT 1 FROM mouvements_stock m
+            WHERE m.produit_id = s.produit_id AND m.unite_production = s.unite_production
+        )
+    """), {"maintenant": datetime.now()})
+    db.commit()
+    return resultat.rowcount
+
+
+def _fin_de_journee(jour: date) -> datetime:
+    """Borne (exclue) des mouvements couverts par l'arrêté du jour"""
+    return datetime.combine(jour + timedelta(days=1), datetime.min.time())
+
+
+def creer_instantane_stock(db: Session, date_arrete: date) -> int:
+    """Arrêté de tous les stocks à la fin de date_arrete (remplace l'existant) ; sans valider"""
+    db.query(InstantaneStock).filter(InstantaneStock.date_arrete == date_arrete).delete(synchronize_session=False)
+    lignes = [{
+        "date_arrete": date_arrete,
+        "produit_id": produit_id,
+        "unite_production": unite,
+        "quantite": quantite,
+        "valeur_stock": valeur
+    } for (produit_id, unite), (quantite, valeur) in get_stock_a_date(db, _fin_de_journee(date_arrete)).items()
+        if quantite or valeur]
+    if lignes:
+        db.bulk_insert_mappings(InstantaneStock, lignes)
+    return len(lignes)
+
+
+def ensure_instantanes_stock(db: Session = None) -> int:
+    """
+    Crée les arrêtés de fin de mois manquants, du dernier arrêté (ou du
+    premier mouvement) au dernier mois clos. Retourne le nombre d'arrêtés créés.
+    Sans session, en ouvre une (appel en arrière-plan au démarrage).
+    """
+    if db is None:
+        from database import SessionLocal
+        db = SessionLocal()
+        try:
+            return ensure_instantanes_stock(db)
+        finally:
+            db.close()
+
+    dernier = db.query(func.max(InstantaneStock.date_arrete)).scalar()
+    if dernier is None:
+        premier = db.query(func.min(MouvementStock.date_mouvement)).scalar()
+        if premier is None:
+            return 0
+        dernier = premier.date().replace(day=1) - timedelta(days=1)
+
+    crees = 0
+    fin_mois = (dernier + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    while fin_mois < date.today().replace(day=1):
+        creer_instantane_stock(db, fin_mois)
+        crees += 1
+        fin_mois = (fin_mois + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    db.commit()
+    return crees
+
+
+def rejouer_cmp(db: Session, produit_id: int, depuis: datetime, unite_production: str = None, commit: bool = True):
+    """
+    Recalcule, après une correction antidatée, la valorisation des mouvements
+    d'un produit à partir de `depuis` : entrées à leur coût, sorties au CMP
+    recalculé. Les arrêtés postérieurs du produit et sa ligne de stocks sont
+    remis à jour.
+
+    Retourne, par unité, le nombre de mouvements revalorisés, le stock final
+    et les journal_id des sorties dont la valeur a changé (leurs écritures
+    restent à corriger).
+    """
+    stock_cache.ecrire(db)  # mouvements de la transaction en cours d'abord
+    unites = [unite_production] if unite_production else [u for (u,) in db.query(
+        MouvementStock.unite_production).filter(
+        MouvementStock.produit_id == produit_id,
+        MouvementStock.date_mouvement >= depuis
+    ).distinct()]
+
+    resultats = {}
+    for unite in unites:
+        quantite, valeur = get_stock_a_date(db, depuis, produit_id, unite).get((produit_id, unite), (0.0, 0.0))
+        cmp = valeur / quantite if quantite > 0 else 0.0
+
+        arretes = [jour for (jour,) in db.query(InstantaneStock.date_arrete).filter(
+            InstantaneStock.date_arrete >= depuis.date()
+        ).distinct().order_by(InstantaneStock.date_arrete)]
+        db.query(InstantaneStock).filter(
+            InstantaneStock.produit_id == produit_id,
+            InstantaneStock.unite_production == unite,
+            InstantaneStock.date_arrete >= depuis.date()
+        ).delete(synchronize_session=False)
+        nouveaux_arretes = []
+
+        revalorises = 0
+        journaux = set()
+        for mouvement in db.query(MouvementStock).filter(
+            MouvementStock.produit_id == produit_id,
+            MouvementStock.unite_production == unite,
+            MouvementStock.date_mouvement >= depuis
+        ).order_by(MouvementStock.date_mouvement, MouvementStock.id):
+            while arretes and _fin_de_journee(arretes[0]) <= mouvement.date_mouvement:
+                nouveaux_arretes.append((arretes.pop(0), quantite, quantite * cmp))
+
+            cout = mouvement.cout_unitaire if mouvement.quantite > 0 else None
+            quantite, cmp, delta, valeur = appliquer_mouvement(quantite, cmp, mouvement.quantite,
+                                                               None if cout is None else float(cout))
+            if round(valeur, 2) != round(float(mouvement.valeur), 2) or delta != mouvement.quantite:
+                revalorises += 1
+                if mouvement.quantite < 0 and mouvement.journal_id:
+                    journaux.add(mouvement.journal_id)
+                mouvement.quantite = delta
+                mouvement.valeur = valeur
+        nouveaux_arretes.extend((jour, quantite, quantite * cmp) for jour in arretes)
+
+        db.bulk_insert_mappings(InstantaneStock, [{
+            "date_arrete": jour,
+            "produit_id": produit_id,
+            "unite_production": unite,
+            "quantite": q,
+            "valeur_stock": v
+        } for jour, q, v in nouveaux_arretes if q or v])
+
+        stock = get_stock_actuel(db, produit_id, unite)
+        if stock:
+            stock.quantite = quantite
+            stock.cout_unitaire_moyen = cmp
+            stock.valeur_stock = quantite * cmp
+        stock_cache.invalider((produit_id, unite), db)
+
+        resultats[unite] = {
+            "mouvements_revalorises": revalorises,
+            "quantite": quantite,
+            "cout_unitaire_moyen": cmp,
+            "journaux_a_revoir": sorted(journaux)
+        }
+
+    if commit:
+        db.commit()
+    return resultats
+
+
+def main():
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Historique des stocks")
+    commandes = parser.add_subparsers(dest="commande", required=True)
+    commandes.add_parser("instantanes", help="crée les arrêtés de fin de mois manquants")
+    rejouer = commandes.add_parser("rejouer", help="recalcule le CMP d'un produit depuis une date")
+    rejouer.add_argument("--produit", required=True, help="code du produit")
+    rejouer.add_argument("--depuis", required=True, type=date.fromisoformat, help="AAAA-MM-JJ")
+    rejouer.add_argument("--unite", help="unité de production (toutes par défaut)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.commande == "instantanes":
+            print(f"{ensure_instantanes_stock(db)} arrêté(s) créé(s)")
+        else:
+            produit = db.query(Produit).filter(Produit.code == args.produit).first()
+            if not produit:
+                parser.error(f"produit inconnu : {args.produit}")
+            depuis = datetime.combine(args.depuis, datetime.min.time())
+            for unite, resultat in rejouer_cmp(db, produit.id, depuis, args.unite).items():
+                print(f"{unite} : {resultat['mouvements_revalorises']} mouvement(s) revalorisé(s), "
+                      f"stock {resultat['quantite']:.2f} à {resultat['cout_unitaire_moyen']:.2f}")
+                if resultat["journaux_a_revoir"]:
+                    print(f"  écritures à revoir (journal_id) : {resultat['journaux_a_revoir']}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
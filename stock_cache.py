@@ -0,0 +1,296 @@
+# stock_cache.py
+"""
+Cache des stocks en écriture différée, clé (produit_id, unite_production).
+
+crud.update_stock lit la quantité et le CMP dans ce cache (une requête au
+premier accès à une clé), applique le mouvement en mémoire et garde la
+nouvelle valeur dans l'état de la session. Rien n'est écrit avant la
+validation de la transaction : juste avant le COMMIT, les lignes de stocks
+modifiées sont mises à jour en un seul UPDATE groupé et les mouvements
+(mouvements_stock) insérés en un seul INSERT, dans la même transaction que
+les écritures comptables. Un arrêt brutal avant le COMMIT ne laisse donc
+rien de partiel ; après, le cache partagé reprend les valeurs validées.
+
+- Un SAVEPOINT annulé (comptabilisation par lot) défait les mouvements
+  faits depuis son ouverture ; une transaction annulée oublie tout.
+- crud.update_stock prend le verrou d'écriture (BEGIN IMMEDIATE) avant de
+  lire : aucune autre connexion ne peut modifier la base jusqu'à la
+  validation. Le cache partagé, lui, peut être périmé par un autre processus
+  (ou une ligne corrigée hors de ce cache) : sous ce verrou, chaque clé est
+  relue en base au premier mouvement de la transaction (lire(relire=True)),
+  puis gardée dans l'état de la session. L'UPDATE vérifie encore que chaque
+  ligne a la quantité et le CMP lus, sinon la validation échoue
+  (StaleDataError).
+- Les fonctions qui lisent les stocks en SQL dans la transaction en cours
+  (crud.get_stock_a_date, services.recettes) complètent leur résultat avec
+  lignes_en_attente() et mouvements_en_attente().
+
+Désactivation : variable d'environnement BOIS_M_STOCK_CACHE=0, ou activer(False) ;
+crud.update_stock revient alors à la mise à jour immédiate de la ligne ORM.
+"""
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import bindparam, event, text, DateTime
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from models import MouvementStock, InstantaneStock
+
+_actif = os.environ.get("BOIS_M_STOCK_CACHE", "1").lower() not in ("0", "off", "non", "false")
+_lock = threading.Lock()
+_partage = {}  # (produit_id, unite_production) -> (quantite, cmp) validés en base, ou état en cours d'écriture
+_abonnes = []  # fonctions appelées avec l'unité dont un CMP change (None : toutes)
+
+_LIRE = text("""
+    SELECT IFNULL(quantite, 0), CAST(IFNULL(cout_unitaire_moyen, 0) AS REAL) FROM stocks
+    WHERE produit_id = :produit_id AND unite_production = :unite_production
+    ORDER BY id LIMIT 1
+""")
+_METTRE_A_JOUR = text("""
+    UPDATE stocks SET quantite = :quantite, cout_unitaire_moyen = :cmp, valeur_stock = :valeur,
+                      date_derniere_operation = :maintenant
+    WHERE id = (SELECT MIN(id) FROM stocks WHERE produit_id = :produit_id AND unite_production = :unite_production)
+      AND IFNULL(quantite, 0) = :quantite_lue AND IFNULL(cout_unitaire_moyen, 0) = :cmp_lu
+""").bindparams(bindparam("maintenant", type_=DateTime))
+_CREER = text("""
+    INSERT INTO stocks (produit_id, unite_production, quantite, cout_unitaire_moyen, valeur_stock,
+                        date_derniere_operation)
+    SELECT :produit_id, :unite_production, :quantite, :cmp, :valeur, :maintenant
+    WHERE NOT EXISTS (SELECT 1 FROM stocks WHERE produit_id = :produit_id AND unite_production = :unite_production)
+""").bindparams(bindparam("maintenant", type_=DateTime))
+
+
+class _EtatSession:
+    """Modifications de stock de la transaction en cours d'une session"""
+    __slots__ = ("lignes", "annulations", "mouvements", "antidate")
+
+    def __init__(self):
+        self.lignes = {}  # clé -> [lu (quantite, cmp) ou None si nouvelle ligne, quantite, cmp]
+        self.annulations = []  # (clé, ligne précédente ou None) pour défaire un SAVEPOINT
+        self.mouvements = []  # lignes de mouvements_stock à insérer
+        self.antidate = None  # plus ancienne date de mouvement antidaté
+
+
+def actif() -> bool:
+    return _actif
+
+
+def activer(actif: bool = True):
+    """Active ou désactive le cache (le cache partagé est vidé)"""
+    global _actif
+    _actif = actif
+    invalider()
+
+
+def invalider(cle: tuple = None, db: Session = None):
+    """
+    Oublie une clé (ou tout le cache partagé) : relue en base au prochain
+    accès. Avec db, la clé est aussi retirée des modifications déjà écrites
+    de la session (ligne de stocks corrigée directement, voir services.stocks).
+    """
+    etat = _etat(db) if db is not None else None
+    if etat is not None and cle is not None:
+        etat.lignes.pop(cle, None)
+    with _lock:
+        if cle is None:
+            _partage.clear()
+        else:
+            _partage.pop(cle, None)
+    _notifier(None if cle is None else cle[1])
+
+
+def abonner(fonction):
+    """fonction(unite_production) sera appelée à chaque changement de CMP"""
+    _abonnes.append(fonction)
+
+
+def _notifier(unite_production):
+    for fonction in _abonnes:
+        fonction(unite_production)
+
+
+def _etat(db: Session, creer: bool = False):
+    etat = db.info.get("stock_cache")
+    if etat is None and creer:
+        etat = db.info["stock_cache"] = _EtatSession()
+    return etat
+
+
+# ========================
+# LECTURE ET MOUVEMENTS
+# ========================
+def lire(db: Session, produit_id: int, unite_production: str, relire: bool = False):
+    """
+    (quantite, cmp) courants, modifications de la transaction comprises ; None
+    sans stock. Avec relire (sous le verrou d'écriture), une clé pas encore
+    modifiée dans la transaction est lue en base et non dans le cache partagé,
+    qui reprend la valeur lue.
+    """
+    cle = (produit_id, unite_production)
+    etat = _etat(db)
+    if etat is not None and cle in etat.lignes:
+        _, quantite, cmp = etat.lignes[cle]
+        return quantite, cmp
+    if not relire:
+        with _lock:
+            if isinstance(_partage.get(cle), tuple):
+                return _partage[cle]
+    ligne = db.execute(_LIRE, {"produit_id": produit_id, "unite_production": unite_production}).first()
+    if ligne is None:
+        if relire:
+            with _lock:
+                if isinstance(_partage.get(cle), tuple):
+                    del _partage[cle]
+        return None
+    valeurs = (float(ligne[0] or 0), float(ligne[1] or 0))
+    with _lock:
+        if relire and not isinstance(_partage.get(cle), _EtatSession):
+            _partage[cle] = valeurs
+        else:
+            _partage.setdefault(cle, valeurs)
+    return valeurs
+
+
+def enregistrer(db: Session, produit_id: int, unite_production: str, quantite: float, cmp: float, mouvement: dict):
+    """Nouvel état d'une ligne de stocks et son mouvement, écrits à la validation"""
+    cle = (produit_id, unite_production)
+    etat = _etat(db, creer=True)
+    precedente = etat.lignes.get(cle)
+    if precedente is not None:
+        lu, cmp_avant = precedente[0], precedente[2]
+    else:
+        lu = lire(db, produit_id, unite_production)
+        cmp_avant = lu[1] if lu else None
+    etat.annulations.append((cle, list(precedente) if precedente else None))
+    etat.lignes[cle] = [lu, quantite, cmp]
+    etat.mouvements.append(mouvement)
+    if mouvement["date_mouvement"].date() < datetime.now().date():
+        etat.antidate = min(etat.antidate or mouvement["date_mouvement"], mouvement["date_mouvement"])
+    if cmp != cmp_avant:
+        _notifier(unite_production)
+
+
+def lignes_en_attente(db: Session) -> dict:
+    """{(produit_id, unite_production): (quantite, cmp)} modifiés et pas encore écrits"""
+    etat = _etat(db)
+    return {cle: (quantite, cmp) for cle, (_, quantite, cmp) in etat.lignes.items()} if etat else {}
+
+
+def mouvements_en_attente(db: Session) -> list:
+    etat = _etat(db)
+    return list(etat.mouvements) if etat else []
+
+
+# ========================
+# ÉCRITURE À LA VALIDATION
+# ========================
+def ecrire(db: Session):
+    """Écrit les lignes modifiées et les mouvements de la session (sans valider)"""
+    etat = _etat(db)
+    if etat is None or not etat.lignes:
+        return
+    maintenant = datetime.now()
+    mises_a_jour, creations = [], []
+    for (produit_id, unite), (lu, quantite, cmp) in etat.lignes.items():
+        ligne = {"produit_id": produit_id, "unite_production": unite, "quantite": quantite, "cmp": cmp,
+                 "valeur": quantite * cmp, "maintenant": maintenant}
+        if lu is None:
+            creations.append(ligne)
+        else:
+            mises_a_jour.append(dict(ligne, quantite_lue=lu[0], cmp_lu=lu[1]))
+
+    modifiees = 0
+    if mises_a_jour:
+        modifiees += db.execute(_METTRE_A_JOUR, mises_a_jour).rowcount
+    if creations:
+        modifiees += db.execute(_CREER, creations).rowcount
+    if modifiees != len(mises_a_jour) + len(creations):
+        for cle in etat.lignes:
+            invalider(cle)
+        raise StaleDataError("Stocks modifiés par ailleurs pendant la transaction : "
+                             f"{len(mises_a_jour) + len(creations) - modifiees} ligne(s) en conflit")
+    # Lignes marquées en cours d'écriture jusqu'à _apres_validation : les autres
+    # sessions les relisent en base (un écrivain qui obtient le verrou après ce
+    # COMMIT y lit les valeurs validées) sans les garder, et seule la dernière
+    # session à les avoir écrites remet ses valeurs dans le cache partagé
+    with _lock:
+        for cle in etat.lignes:
+            _partage[cle] = etat
+
+    if etat.mouvements:
+        db.execute(MouvementStock.__table__.insert(), etat.mouvements)
+    if etat.antidate is not None:
+        # Mouvements antidatés : les arrêtés postérieurs sont à refaire
+        db.query(InstantaneStock).filter(
+            InstantaneStock.date_arrete >= etat.antidate.date()
+        ).delete(synchronize_session=False)
+    etat.mouvements = []
+    etat.annulations = []
+    etat.antidate = None
+    for ligne in etat.lignes.values():
+        ligne[0] = (ligne[1], ligne[2])
+
+
+@event.listens_for(Session, "before_commit")
+def _avant_validation(session):
+    if not session.in_nested_transaction():
+        ecrire(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _apres_validation(session):
+    if session.in_nested_transaction():
+        # SAVEPOINT validé : ses modifications restent à écrire avec la transaction
+        session.info.get("stock_cache_marques", {}).pop(session.get_nested_transaction(), None)
+        return
+    etat = session.info.pop("stock_cache", None)
+    session.info.pop("stock_cache_marques", None)
+    if etat is not None:
+        with _lock:
+            for cle, (_, quantite, cmp) in etat.lignes.items():
+                if _partage.get(cle) is etat:
+                    _partage[cle] = (quantite, cmp)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _ouverture(session, transaction):
+    if transaction.nested:
+        etat = _etat(session)
+        session.info.setdefault("stock_cache_marques", {})[transaction] = (
+            (len(etat.annulations), len(etat.mouvements)) if etat else (0, 0))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _annulation(session, transaction_precedente):
+    if not transaction_precedente.nested:
+        return
+    marque = session.info.get("stock_cache_marques", {}).pop(transaction_precedente, None)
+    etat = _etat(session)
+    if marque is None or etat is None:
+        return
+    unites = set()
+    while len(etat.annulations) > marque[0]:
+        cle, precedente = etat.annulations.pop()
+        if precedente is None:
+            etat.lignes.pop(cle, None)
+        else:
+            etat.lignes[cle] = precedente
+        unites.add(cle[1])
+    del etat.mouvements[marque[1]:]
+    for unite in unites:
+        _notifier(unite)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _fin_transaction(session, transaction):
+    # (la marque d'un SAVEPOINT est retirée à sa validation ou à son annulation)
+    if transaction.parent is None:
+        # Transaction annulée ou session fermée sans validation : tout est oublié
+        session.info.pop("stock_cache_marques", None)
+        etat = session.info.pop("stock_cache", None)
+        if etat is not None and etat.lignes:
+            with _lock:
+                for cle in etat.lignes:
+                    if _partage.get(cle) is etat:
+                        del _partage[cle]
+            _notifier(None)
@@ -0,0 +1,71 @@
+# tests/conftest.py
+"""
+Fixtures communes : une base SQLite temporaire par test (même moteur et mêmes
+PRAGMA que l'application), le plan comptable et les paramètres par défaut, et
+un jeu de données synthétique de benchmarks.generate_data.
+
+Les caches du processus (stock_cache, referentiel_cache, recettes) sont vidés
+entre deux tests : les identifiants se répètent d'une base temporaire à l'autre.
+"""
+import random
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import referentiel_cache
+import stock_cache
+from init_db import seed_database
+from services import recettes
+from benchmarks.generate_data import generer_referentiel, generer_journal, iter_lignes
+
+
+@pytest.fixture(autouse=True)
+def caches_vides():
+    stock_cache.invalider()
+    referentiel_cache.invalider()
+    recettes.invalider()
+    yield
+    stock_cache.invalider()
+    referentiel_cache.invalider()
+    recettes.invalider()
+
+
+@pytest.fixture
+def chemin_base(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture
+def Session(chemin_base):
+    """Fabrique de sessions sur une base temporaire initialisée (plan comptable, paramètres)"""
+    engine = database.create_db_engine(f"sqlite:///{chemin_base}")
+    models.Base.metadata.create_all(bind=engine)
+    fabrique = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = fabrique()
+    try:
+        seed_database(db)
+    finally:
+        db.close()
+    yield fabrique
+    engine.dispose()
+
+
+@pytest.fixture
+def db(Session):
+    session = Session()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def donnees(Session):
+    """Référentiel et journal synthétiques (300 lignes sur 30 jours, non comptabilisées)"""
+    db = Session()
+    try:
+        aleatoire = random.Random(42)
+        clients, fournisseurs, produits = generer_referentiel(db, 10, 5, 20, aleatoire)
+        generer_journal(db, iter_lignes(300, 30, clients, fournisseurs, produits, aleatoire))
+    finally:
+        db.close()
+    return {"clients": clients, "fournisseurs": fournisseurs, "produits": produits, "lignes": 300, "jours": 30}
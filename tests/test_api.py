@@ -0,0 +1,151 @@
+# tests/test_api.py
+"""
+API HTTP (api.py) avec le client de test FastAPI, sans réseau ni serveur : la
+dépendance get_db est remplacée par des sessions sur la base temporaire.
+"""
+from datetime import date, datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from api import app, get_db
+import models
+
+TAILLE_PAGE = 40
+
+
+@pytest.fixture
+def client(Session, donnees):
+    def get_db_test():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_db_test
+    try:
+        yield TestClient(app)  # sans « with » : pas d'init_database au démarrage
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+def _pages(client, url, params, cle="items"):
+    """Toutes les lignes d'une liste paginée par curseur, et le nombre de pages"""
+    lignes, pages, curseur = [], 0, None
+    while True:
+        reponse = client.get(url, params=dict(params, **({"after": curseur} if curseur else {})))
+        reponse.raise_for_status()
+        corps = reponse.json()
+        lignes.extend(corps[cle])
+        pages += 1
+        curseur = corps["next_cursor"]
+        if curseur is None:
+            return lignes, pages
+
+
+def _entree(donnees, **valeurs):
+    return dict({
+        "date_operation": datetime.now().isoformat(),
+        "type_journal": "ACHAT",
+        "libelle": "Achat saisi par l'API",
+        "produit_id": donnees["produits"][0][0],
+        "fournisseur_id": donnees["fournisseurs"][0],
+        "unite_production": "Scierie",
+        "quantite": 4,
+        "prix_unitaire": 250,
+        "montant_ht": 1000,
+        "montant_tva": 190,
+        "montant_ttc": 1190
+    }, **valeurs)
+
+
+def test_journal_pagine(client, donnees):
+    total = donnees["lignes"]
+    lignes, pages = _pages(client, "/journal", {"limit": TAILLE_PAGE})
+    ids = [ligne["id"] for ligne in lignes]
+    assert len(ids) == total and len(set(ids)) == total
+    assert pages == total // TAILLE_PAGE + 1
+    cles = [(ligne["date_operation"], ligne["id"]) for ligne in lignes]
+    assert cles == sorted(cles, reverse=True)
+
+    ventes, _ = _pages(client, "/journal", {"limit": TAILLE_PAGE, "type_journal": "VENTE"})
+    assert ventes and all(ligne["type_journal"] == "VENTE" for ligne in ventes)
+    assert client.get("/journal", params={"after": "pas-un-curseur"}).status_code == 400
+
+
+def test_journal_recherche(client):
+    premiere = client.get("/journal", params={"limit": 1}).json()
+    trouves = client.get("/journal", params={"q": premiere["items"][0]["numero_piece"]}).json()["items"]
+    assert [ligne["id"] for ligne in trouves] == [premiere["items"][0]["id"]]
+    assert client.get("/journal", params={"q": "Produit", "after": premiere["next_cursor"]}).status_code == 400
+
+
+def test_operations_tresorerie_paginees(client, Session):
+    db = Session()
+    db.add_all(models.Tresorerie(
+        date_operation=date.today() - timedelta(days=i // 3), type_operation="ENCAISSEMENT",
+        libelle=f"Règlement {i}", montant=100 + i, mode_paiement="ESPECES") for i in range(50))
+    db.commit()
+    db.close()
+
+    lignes, pages = _pages(client, "/tresorerie/operations", {"limit": 7})
+    cles = [(ligne["date_operation"], ligne["id"]) for ligne in lignes]
+    assert len(set(cles)) == 50 and pages == 8
+    assert cles == sorted(cles, reverse=True)
+    debut = (date.today() - timedelta(days=5)).isoformat()
+    periode, _ = _pages(client, "/tresorerie/operations", {"limit": 7, "date_debut": debut})
+    assert [l["id"] for l in periode] == [l["id"] for l in lignes if l["date_operation"] >= debut]
+    assert client.get("/tresorerie/operations", params={"after": "pas-un-curseur"}).status_code == 400
+
+
+def test_saisie_et_comptabilisation(client, donnees):
+    reponse = client.post("/journal", json={"entries": [_entree(donnees, numero_piece="API-001"),
+                                                        _entree(donnees, numero_piece="API-002")]})
+    assert reponse.status_code == 201 and not reponse.json()["comptabilisation"]
+    ids = reponse.json()["ids"]
+    assert len(ids) == 2
+
+    resultats = client.post("/journal/comptabiliser", json={"ids": ids + [ids[0], 10 ** 9]}).json()
+    assert [(r["journal_id"], r["status"]) for r in resultats] == [
+        (ids[0], "success"), (ids[1], "success"), (10 ** 9, "error")]
+    assert all(r["nombre_ecritures"] > 0 for r in resultats[:2])
+    deja = client.post("/journal/comptabiliser", json={"ids": ids[:1]}).json()
+    assert deja[0]["status"] == "error" and deja[0]["nombre_ecritures"] == 0
+
+    reponse = client.post("/journal", json={"entries": [_entree(donnees, numero_piece="API-003")],
+                                            "comptabiliser": True})
+    assert reponse.status_code == 201
+    assert [r["status"] for r in reponse.json()["comptabilisation"]] == ["success"]
+    assert client.post("/journal", json={"entries": [
+        _entree(donnees, type_journal="INCONNU", numero_piece="X")]}).status_code == 422
+
+
+@pytest.fixture
+def comptabilise(client):
+    ids = [ligne["id"] for ligne in _pages(client, "/journal", {"limit": 1000})[0]]
+    resultats = [r for debut in range(0, len(ids), 200)
+                 for r in client.post("/journal/comptabiliser", json={"ids": ids[debut:debut + 200]}).json()]
+    assert all(r["status"] == "success" for r in resultats)
+    return client
+
+
+def test_mouvements_stock_pagines(comptabilise, donnees):
+    params = {"start_date": (date.today() - timedelta(days=donnees["jours"])).isoformat(),
+              "end_date": date.today().isoformat()}
+    complet = comptabilise.get("/stocks/mouvements", params=params).json()
+    assert "next_cursor" not in complet and "suite" not in complet
+    assert any(l["production"] or l["consommation"] or l["vente"] for l in complet["lignes"])
+    lignes, pages = _pages(comptabilise, "/stocks/mouvements", dict(params, limit=TAILLE_PAGE // 4), cle="lignes")
+    assert lignes == complet["lignes"] and pages > 1
+    premiere = comptabilise.get("/stocks/mouvements", params=dict(params, limit=TAILLE_PAGE // 4)).json()
+    assert len(premiere["lignes"]) == TAILLE_PAGE // 4
+    assert premiere["familles"] == complet["familles"] and premiere["total_general"] == complet["total_general"]
+    assert comptabilise.get("/stocks/mouvements", params=dict(params, after="sans-separateur")).status_code == 400
+
+
+def test_balance(comptabilise):
+    balance = comptabilise.get("/comptabilite/balance", params={"periode": str(date.today().year)}).json()
+    totaux = balance["totaux"]
+    assert balance["lignes"]
+    assert totaux["report"] + totaux["debit"] - totaux["credit"] == pytest.approx(0, abs=0.01)
+    assert totaux["solde_debiteur"] == pytest.approx(totaux["solde_crediteur"], abs=0.01)
+    assert comptabilise.get("/comptabilite/balance", params={"periode": "2025-3"}).status_code == 422
@@ -0,0 +1,84 @@
+# tests/test_concurrence.py
+"""
+Écritures concurrentes sur une même base, comme le pool de threads de l'API,
+les workers de l'interface et le thread des instantanés de stock : un moteur
+partagé, une session par thread et par transaction.
+"""
+import threading
+from datetime import datetime
+from sqlalchemy import text
+import models
+import crud
+import services.accounting as accounting
+
+SAISIES = 4
+ITERATIONS = 10
+COMPTABILISATIONS = 4
+LOT = 20
+
+
+def _saisie(Session, numero, produit_id, erreurs):
+    for i in range(ITERATIONS):
+        db = Session()
+        try:
+            crud.create_journal_entry(db, {
+                "date_operation": datetime.now(),
+                "type_journal": "ACHAT",
+                "numero_piece": f"CONC-{numero:02d}-{i:04d}",
+                "libelle": f"Saisie concurrente {numero} {i}",
+                "produit_id": produit_id,
+                "quantite": 1,
+                "prix_unitaire": 100,
+                "montant_ht": 100,
+                "montant_ttc": 100
+            })
+        except Exception as e:
+            db.rollback()
+            erreurs.append(f"saisie {numero} : {str(e).splitlines()[0]}")
+        finally:
+            db.close()
+
+
+def _comptabilisation(Session, ids, erreurs):
+    for debut in range(0, len(ids), LOT):
+        db = Session()
+        try:
+            journaux = db.query(models.JournalQuotidien).filter(
+                models.JournalQuotidien.id.in_(ids[debut:debut + LOT])
+            ).order_by(models.JournalQuotidien.id).all()
+            resultats = accounting.post_journal_entries(db, journaux)
+            erreurs.extend(f"journal {r['journal_id']} : {r['message']}"
+                           for r in resultats if r["status"] == "error")
+        except Exception as e:
+            db.rollback()
+            erreurs.append(f"lot {ids[debut]} : {str(e).splitlines()[0]}")
+        finally:
+            db.close()
+
+
+def test_saisies_et_comptabilisations_concurrentes(Session, db, donnees):
+    """Saisies (déclencheurs plein texte actifs) pendant la comptabilisation par lots :
+    aucune transaction en échec (« database is locked »), tout est comptabilisé et indexé"""
+    ids = [i for (i,) in db.query(models.JournalQuotidien.id).order_by(models.JournalQuotidien.id)]
+    db.close()
+    erreurs = []
+    threads = [
+        threading.Thread(target=_saisie, args=(Session, n, donnees["produits"][0][0], erreurs))
+        for n in range(SAISIES)
+    ] + [
+        threading.Thread(target=_comptabilisation, args=(Session, ids[n::COMPTABILISATIONS], erreurs))
+        for n in range(COMPTABILISATIONS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erreurs == []
+    assert db.query(models.JournalQuotidien).filter(
+        models.JournalQuotidien.numero_piece.like("CONC-%")).count() == SAISIES * ITERATIONS
+    assert db.query(models.JournalQuotidien).filter(
+        models.JournalQuotidien.id.in_(ids),
+        models.JournalQuotidien.comptabilisee.is_(False)
+    ).count() == 0
+    assert db.execute(text("SELECT COUNT(*) FROM journal_fts")).scalar() == db.query(models.JournalQuotidien).count()
@@ -0,0 +1,23 @@
+# tests/test_init_db.py
+"""Données de référence (init_db.seed_database)"""
+import models
+from init_db import seed_database
+
+
+def test_seed_conserve_les_modifications(db):
+    compte = db.query(models.PlanComptable).filter(models.PlanComptable.compte == "70").one()
+    compte.libelle = "Ventes de bois"
+    parametre = db.query(models.Parametres).filter(models.Parametres.type_param == "famille_produit",
+                                                   models.Parametres.valeur == "MP").one()
+    parametre.description = "Grumes"
+    db.query(models.PlanComptable).filter(models.PlanComptable.compte == "71").delete()
+    db.commit()
+
+    resultats = seed_database(db)
+    assert resultats["plan_comptable"] == {"inseres": 1, "mis_a_jour": 0}
+    assert resultats["parametres"] == {"inseres": 0, "mis_a_jour": 0}
+    db.expire_all()
+    assert db.query(models.PlanComptable.libelle).filter(models.PlanComptable.compte == "70").scalar() == "Ventes de bois"
+    assert db.query(models.Parametres.description).filter(models.Parametres.type_param == "famille_produit",
+                                                          models.Parametres.valeur == "MP").scalar() == "Grumes"
+    assert db.query(models.PlanComptable).filter(models.PlanComptable.compte == "71").count() == 1
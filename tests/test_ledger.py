@@ -0,0 +1,68 @@
+# tests/test_ledger.py
+"""Balance générale et grand-livre (services.ledger)"""
+from datetime import datetime, date
+import pytest
+import models
+from services import ledger
+
+
+def _ecritures(db, ecritures):
+    for ecriture in ecritures:
+        db.add(models.EcritureComptable(**ecriture))
+    ledger.appliquer_soldes_comptes(db, ecritures)
+    db.commit()
+
+
+def _ecriture(jour, debit, credit, montant, journal="ACH"):
+    return dict(date_comptable=jour, journal=journal, compte_debit=debit, compte_credit=credit,
+                montant=montant, libelle=f"{debit}/{credit}")
+
+
+@pytest.fixture
+def exercices(db):
+    """Achats et ventes sur deux exercices (2025 et 2026)"""
+    _ecritures(db, [
+        _ecriture(datetime(2025, 6, 1), "601000", "401000", 100),
+        _ecriture(datetime(2025, 9, 1), "411000", "701000", 250, "VTE"),
+        _ecriture(datetime(2026, 2, 1), "601000", "401000", 40),
+        _ecriture(datetime(2026, 4, 1), "601000", "401000", 7),
+        _ecriture(datetime(2026, 4, 2), "411000", "701000", 30, "VTE"),
+    ])
+    return db
+
+
+def _lignes(balance):
+    return {ligne["compte"]: ligne for ligne in balance["lignes"]}
+
+
+def test_classes_6_et_7_repartent_a_l_ouverture(exercices):
+    lignes = _lignes(ledger.get_balance_generale(exercices, "2026"))
+    assert (lignes["601000"]["report"], lignes["601000"]["debit"]) == (0, 47)
+    assert (lignes["701000"]["report"], lignes["701000"]["credit"]) == (0, 30)
+    assert lignes["401000"]["report"] == -100
+
+    lignes = _lignes(ledger.get_balance_generale(exercices, "2026-04"))
+    assert (lignes["601000"]["report"], lignes["601000"]["debit"]) == (40, 7)
+
+
+def test_resultat_anterieur_reporte_en_classe_1(exercices):
+    lignes = _lignes(ledger.get_balance_generale(exercices, "2026"))
+    resultat = lignes[ledger.COMPTE_REPORT_RESULTAT]
+    assert resultat["report"] == 100 - 250  # bénéfice 2025, créditeur
+    assert (resultat["debit"], resultat["credit"], resultat["solde_crediteur"]) == (0, 0, 150)
+    assert ledger.COMPTE_REPORT_RESULTAT in _lignes(ledger.get_balance_generale(exercices, "2026", classe=1))
+    assert ledger.COMPTE_REPORT_RESULTAT not in _lignes(ledger.get_balance_generale(exercices, "2025"))
+
+
+@pytest.mark.parametrize("periode", ["2025", "2026", "2026-01", "2026-04"])
+def test_totaux_equilibres(exercices, periode):
+    totaux = ledger.get_balance_generale(exercices, periode)["totaux"]
+    assert totaux["report"] + totaux["debit"] - totaux["credit"] == pytest.approx(0)
+    assert totaux["solde_debiteur"] == pytest.approx(totaux["solde_crediteur"])
+
+
+def test_grand_livre_solde_d_ouverture(exercices):
+    grand_livre = list(ledger.iter_grand_livre(exercices, "601000", date(2026, 3, 15), date(2026, 12, 31)))
+    assert grand_livre[0]["solde"] == 40 and grand_livre[1]["journal"] == "ACH"
+    grand_livre = list(ledger.iter_grand_livre(exercices, "401000", date(2026, 3, 15), date(2026, 12, 31)))
+    assert grand_livre[0]["solde"] == -140
@@ -0,0 +1,60 @@
+# tests/test_numerotation.py
+"""
+Numérotation des documents (crud.reserver_numeros) : plusieurs processus,
+chacun avec son moteur, réservent en parallèle des numéros (unitaires ou par
+blocs) sur une même base ; une partie des transactions est annulée.
+"""
+import random
+from multiprocessing import Pool
+from sqlalchemy.orm import sessionmaker
+import database
+import crud
+
+PROCESSUS = 4
+ITERATIONS = 50
+
+
+def _worker(args):
+    url, graine = args
+    engine = database.create_db_engine(url)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    aleatoire = random.Random(graine)
+    valides = []
+    try:
+        for _ in range(ITERATIONS):
+            type_document = aleatoire.choice(list(crud.PREFIXES_DOCUMENTS))
+            nombre = aleatoire.choice([1, 1, 1, 5, 20])
+            db = Session()
+            try:
+                numeros = crud.reserver_numeros(db, nombre, type_document)
+                if aleatoire.random() < 0.1:
+                    db.rollback()  # document abandonné : les numéros sont rendus
+                    continue
+                db.commit()
+                valides.extend(numeros)
+            finally:
+                db.close()
+    finally:
+        engine.dispose()
+    return valides
+
+
+def test_numeros_uniques_et_continus(Session, chemin_base):
+    with Pool(PROCESSUS) as pool:
+        lots = pool.map(_worker, [(f"sqlite:///{chemin_base}", graine) for graine in range(PROCESSUS)])
+
+    par_prefixe = {}
+    for numero in (numero for lot in lots for numero in lot):
+        prefixe, rang = numero.rsplit("/", 1)
+        par_prefixe.setdefault(prefixe, []).append(int(rang))
+    assert {prefixe.split("-")[0] for prefixe in par_prefixe} == set(crud.PREFIXES_DOCUMENTS.values())
+    for prefixe, rangs in par_prefixe.items():
+        assert sorted(rangs) == list(range(1, len(rangs) + 1)), prefixe
+
+
+def test_reservation_annulee_rendue(db):
+    premier = crud.reserver_numeros(db, 3, "FACTURE")
+    db.rollback()
+    assert crud.reserver_numeros(db, 3, "FACTURE") == premier
+    db.commit()
+    assert crud.reserver_numeros(db, 1, "FACTURE")[0] != premier[0]
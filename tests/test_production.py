@@ -0,0 +1,146 @@
+# tests/test_production.py
+"""
+Métriques de production (services.production) : requêtes groupées comparées,
+jour par jour, au calcul d'origine en Python sur toutes les opérations de la
+journée (montants au centime).
+"""
+import math
+from datetime import date, datetime, timedelta
+import pytest
+import models
+import crud
+import services.accounting as accounting
+import services.production as production
+
+
+# ========================
+# CALCUL DE RÉFÉRENCE (boucles Python)
+# ========================
+def _operations_du_jour(db, date_ref, unite=None):
+    query = db.query(models.Operation).filter(
+        models.Operation.date_comptable >= datetime.combine(date_ref, datetime.min.time()),
+        models.Operation.date_comptable <= datetime.combine(date_ref, datetime.max.time())
+    )
+    if unite is not None:
+        query = query.filter(models.Operation.unite_production == unite)
+    return query.all()
+
+
+def reference_daily_metrics(db, date_ref):
+    operations = _operations_du_jour(db, date_ref)
+    metrics = {
+        "date": date_ref, "bois_consomme": 0.0, "produits_finis": 0.0, "semi_finis": 0.0, "dechets": 0.0,
+        "cout_total_consommation": 0.0, "cout_total_production": 0.0, "rendement_moyen": 0.0,
+        "total_operations": len(operations), "details_unites": {}
+    }
+    vide = lambda: {"bois_consomme": 0.0, "produits_finis": 0.0, "semi_finis": 0.0, "dechets": 0.0,
+                    "cout_consommation": 0.0, "cout_production": 0.0, "rendement": 0.0}
+    for unit in crud.get_parametres_by_type(db, "unite_production"):
+        metrics["details_unites"][unit.valeur] = vide()
+
+    for op in operations:
+        unit_data = metrics["details_unites"].setdefault(op.unite_production or "GENERAL", vide())
+        montant = float(op.montant or 0)
+        if op.type_operation == "consommation" and op.produit and op.produit.famille == "MP":
+            metrics["bois_consomme"] += op.quantite
+            unit_data["bois_consomme"] += op.quantite
+            metrics["cout_total_consommation"] += montant
+            unit_data["cout_consommation"] += montant
+        elif op.type_operation == "production" and op.produit:
+            metrics["cout_total_production"] += montant
+            unit_data["cout_production"] += montant
+            cle = {"PF": "produits_finis", "SF": "semi_finis", "déchet": "dechets"}.get(op.produit.famille)
+            if cle:
+                metrics[cle] += op.quantite
+                unit_data[cle] += op.quantite
+
+    total = metrics["produits_finis"] + metrics["semi_finis"] + metrics["dechets"]
+    if metrics["bois_consomme"] > 0:
+        metrics["rendement_moyen"] = total / metrics["bois_consomme"] * 100
+    for unit_data in metrics["details_unites"].values():
+        total = unit_data["produits_finis"] + unit_data["semi_finis"] + unit_data["dechets"]
+        if unit_data["bois_consomme"] > 0:
+            unit_data["rendement"] = total / unit_data["bois_consomme"] * 100
+    return metrics
+
+
+def reference_production_costs(db, date_ref):
+    report = []
+    for unit_param in crud.get_parametres_by_type(db, "unite_production"):
+        operations = _operations_du_jour(db, date_ref, unit_param.valeur)
+        consommations = [op for op in operations
+                         if op.type_operation == "consommation" and op.produit and op.produit.famille == "MP"]
+        productions = [op for op in operations
+                       if op.type_operation == "production" and op.produit
+                       and op.produit.famille in ["PF", "SF", "déchet"]]
+        bois = sum(op.quantite for op in consommations)
+        quantite = sum(op.quantite for op in productions)
+        valeur = sum(float(op.montant or 0) for op in productions)
+        report.append({
+            "unite_production": unit_param.valeur,
+            "date": str(date_ref),
+            "bois_consomme": bois,
+            "cout_total_consommation": sum(float(op.montant or 0) for op in consommations),
+            "quantite_produite": quantite,
+            "valeur_production_totale": valeur,
+            "cout_unitaire_moyen": valeur / quantite if quantite > 0 else 0,
+            "rendement": quantite / bois * 100 if bois > 0 else 0
+        })
+    return report
+
+
+# ========================
+# COMPARAISON
+# ========================
+def _ecarts(attendu, obtenu, chemin=""):
+    """Liste des différences (valeurs numériques à 0,01 près : montants Numeric(15, 2))"""
+    if isinstance(attendu, dict):
+        if set(attendu) != set(obtenu):
+            return [f"{chemin} : clés {sorted(set(attendu) ^ set(obtenu))}"]
+        return [e for cle in attendu for e in _ecarts(attendu[cle], obtenu[cle], f"{chemin}.{cle}")]
+    if isinstance(attendu, list):
+        if len(attendu) != len(obtenu):
+            return [f"{chemin} : {len(attendu)} éléments attendus, {len(obtenu)} obtenus"]
+        return [e for i, (a, o) in enumerate(zip(attendu, obtenu)) for e in _ecarts(a, o, f"{chemin}[{i}]")]
+    if isinstance(attendu, (int, float)) and not isinstance(attendu, bool):
+        return [] if math.isclose(attendu, obtenu, rel_tol=1e-6, abs_tol=0.01) else [f"{chemin} : {attendu} != {obtenu}"]
+    return [] if attendu == obtenu else [f"{chemin} : {attendu!r} != {obtenu!r}"]
+
+
+@pytest.fixture
+def comptabilise(db, donnees):
+    accounting.post_journal_entries(db, db.query(models.JournalQuotidien).order_by(
+        models.JournalQuotidien.date_operation, models.JournalQuotidien.id).all())
+    assert db.query(models.Operation).count() > 0
+    return donnees
+
+
+@pytest.mark.parametrize("reference,groupee", [
+    (reference_daily_metrics, production.calculate_daily_metrics),
+    (reference_production_costs, production.calculate_production_costs)
+], ids=["calculate_daily_metrics", "calculate_production_costs"])
+def test_requetes_groupees_egales_aux_boucles(db, comptabilise, reference, groupee):
+    for n in range(comptabilise["jours"] + 1):
+        jour = date.today() - timedelta(days=n)
+        attendu = reference(db, jour)
+        db.expunge_all()
+        assert _ecarts(attendu, groupee(db, jour)) == [], jour
+
+
+def test_metriques_journalieres_concordent_avec_operations(db, comptabilise):
+    assert db.query(models.MetriqueJournaliere).count() > 0
+    assert accounting.verifier_metriques_journalieres(db) == []
+
+    ligne = db.query(models.MetriqueJournaliere).filter(models.MetriqueJournaliere.quantite_produite > 0).first()
+    ligne.quantite_produite += 1
+    db.add(models.MetriqueJournaliere(date=date.today() + timedelta(days=1), unite_production="GENERAL", famille="",
+                                      nombre_operations=1))
+    db.commit()
+    ecarts = accounting.verifier_metriques_journalieres(db)
+    assert [ecart["cle"] for ecart in ecarts] == sorted([
+        (ligne.date, ligne.unite_production, ligne.famille), (date.today() + timedelta(days=1), "GENERAL", "")])
+    assert ecarts[-1]["attendu"] is None
+
+    assert accounting.ensure_metriques_journalieres(db) == 2
+    assert accounting.verifier_metriques_journalieres(db) == []
+    assert accounting.ensure_metriques_journalieres(db) == 0
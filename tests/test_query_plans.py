@@ -0,0 +1,79 @@
+# tests/test_query_plans.py
+"""
+Les requêtes chaudes du journal, de la facturation, de la trésorerie, des
+stocks et des métriques de production utilisent les index déclarés dans
+models.py : requêtes capturées telles qu'émises par crud et les services,
+puis passées à EXPLAIN QUERY PLAN.
+"""
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import event
+import models
+import crud
+from services import ledger, production
+
+AUJOURD_HUI = date.today()
+DEBUT, FIN = AUJOURD_HUI - timedelta(days=30), AUJOURD_HUI
+
+CAS = [
+    ("journal par type", "ix_journal_type_date",
+     lambda s, r: crud.get_journal_page(s, type_journal="VENTE")),
+    ("journal paginé", "ix_journal_date_id",
+     lambda s, r: crud.get_journal_page(s)),
+    ("BL non facturés", "ix_journal_client_type_facture",
+     lambda s, r: crud.get_bls_non_factures(s, r["client"].id, DEBUT, FIN)),
+    ("balance trésorerie", "soldes_tresorerie",
+     lambda s, r: crud.get_balance_tresorerie(s)),
+    ("balance trésorerie datée", "ix_ecritures_classes_date",
+     lambda s, r: crud.get_balance_tresorerie(s, FIN)),
+    ("grand-livre", "ix_ecritures_debit_date",
+     lambda s, r: list(ledger.iter_grand_livre(s, r["client"].compte_comptable, DEBUT, FIN))),
+    ("opérations de trésorerie", "ix_tresorerie_date",
+     lambda s, r: crud.get_tresorerie_operations(s, DEBUT, FIN)),
+    ("opérations de trésorerie paginées", "ix_tresorerie_date",
+     lambda s, r: crud.get_tresorerie_operations(s, DEBUT, FIN, after=(FIN, 10 ** 9))),
+    ("stock actuel", "ix_stocks_produit_unite",
+     lambda s, r: crud.get_stock_actuel(s, r["produit"], "GENERAL")),
+    ("stock d'un produit à date", "ix_mouvements_stock_produit_unite_date",
+     lambda s, r: crud.get_stock_a_date(s, datetime.combine(DEBUT, datetime.min.time()), r["produit"], "GENERAL")),
+    ("mouvements de stock de la période", "ix_mouvements_stock_date",
+     lambda s, r: crud.get_stock_movements(s, DEBUT, FIN)),
+    ("métriques de production", "ix_operations_date_unite",
+     lambda s, r: production.calculate_production_costs(s, FIN)),
+]
+
+
+def _capturer(engine, db, appel):
+    """Exécute appel(db) et retourne les (requête, paramètres) de lecture émises"""
+    requetes = []
+
+    def _avant(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            requetes.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _avant)
+    try:
+        appel(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", _avant)
+    return requetes
+
+
+def _plan(db, statement, parameters):
+    connexion = db.connection().connection
+    return [ligne[-1] for ligne in connexion.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()]
+
+
+@pytest.fixture
+def references(db, donnees):
+    return {
+        "client": db.query(models.Client).filter(models.Client.id == donnees["clients"][0]).one(),
+        "produit": donnees["produits"][0][0]
+    }
+
+
+@pytest.mark.parametrize("libelle,index,appel", CAS, ids=[cas[0] for cas in CAS])
+def test_index_utilise(db, references, libelle, index, appel):
+    plans = [_plan(db, statement, parameters)
+             for statement, parameters in _capturer(db.get_bind(), db, lambda s: appel(s, references))]
+    assert any(index in detail for plan in plans for detail in plan), plans
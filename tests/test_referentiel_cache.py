@@ -0,0 +1,78 @@
+# tests/test_referentiel_cache.py
+"""Cache des tables de référence (referentiel_cache)"""
+import sqlite3
+from datetime import datetime
+from sqlalchemy import event
+import models
+import crud
+import referentiel_cache
+from services.accounting import post_journal_entries
+
+
+def _vente(db, produit_id, client_id, numero):
+    journal = models.JournalQuotidien(
+        date_operation=datetime.now(), type_journal="VENTE", numero_piece=numero, libelle="Vente",
+        produit_id=produit_id, client_id=client_id, unite_production="GENERAL", quantite=1,
+        prix_unitaire=1200, montant_ht=1200, montant_ttc=1200, tva_applicable=False, dt_applicable=False)
+    db.add(journal)
+    db.commit()
+    return journal
+
+
+def _comptes_credites(db, journal_id):
+    return {compte for (compte,) in db.query(models.EcritureComptable.compte_credit).filter(
+        models.EcritureComptable.journal_id == journal_id)}
+
+
+def test_lecture_en_cache_sans_requete(Session, db):
+    produit_id = db.query(models.Produit.id).filter(models.Produit.code == "PF001").scalar()
+    db.commit()
+    assert crud.get_produit(db, produit_id).code == "PF001"
+    db.close()
+
+    requetes = []
+    engine = db.get_bind()
+
+    def compter(connexion, curseur, requete, parametres, contexte, executemany):
+        if "FROM produits" in requete:
+            requetes.append(requete)
+
+    event.listen(engine, "before_cursor_execute", compter)
+    try:
+        autre = Session()
+        assert crud.get_produit(autre, produit_id).code == "PF001"
+        autre.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", compter)
+    assert requetes == []
+    assert referentiel_cache.stats_cache()["produits"]["hits"] >= 1
+
+
+def test_modification_par_une_autre_connexion(Session, db, chemin_base):
+    """compte_vente changé par un autre processus : la comptabilisation suivante
+    crédite le nouveau compte, pas celui gardé en cache"""
+    produit_id = db.query(models.Produit.id).filter(models.Produit.code == "PF001").scalar()
+    client_id = db.query(models.Client.id).order_by(models.Client.id).limit(1).scalar()
+    ancien = crud.get_produit(db, produit_id).compte_vente
+    premiere = _vente(db, produit_id, client_id, "V-1")
+    assert [r["status"] for r in post_journal_entries(db, [premiere])] == ["success"]
+    assert ancien in _comptes_credites(db, premiere.id)
+    db.close()
+
+    autre = sqlite3.connect(chemin_base)
+    try:
+        autre.execute("INSERT OR IGNORE INTO plan_comptable (compte, libelle, classe, type_compte, niveau) "
+                      "VALUES ('709999', 'Ventes diverses', 7, 'PRODUIT', 3)")
+        autre.execute("UPDATE produits SET compte_vente = '709999' WHERE id = ?", (produit_id,))
+        autre.commit()
+    finally:
+        autre.close()
+
+    db = Session()
+    try:
+        seconde = _vente(db, produit_id, client_id, "V-2")
+        assert [r["status"] for r in post_journal_entries(db, [seconde])] == ["success"]
+        comptes = _comptes_credites(db, seconde.id)
+        assert "709999" in comptes and ancien not in comptes
+    finally:
+        db.close()
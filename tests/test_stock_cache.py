@@ -0,0 +1,80 @@
+# tests/test_stock_cache.py
+"""Cache des stocks en écriture différée (stock_cache)"""
+import sqlite3
+from datetime import datetime
+from sqlalchemy import event
+import models
+import crud
+import stock_cache
+from services.accounting import post_journal_entries
+
+
+def _produit(db, code):
+    return db.query(models.Produit.id).filter(models.Produit.code == code).scalar()
+
+
+def _consommation(db, produit_id, quantite, numero="CONSO-1"):
+    journal = models.JournalQuotidien(
+        date_operation=datetime.now(), type_journal="CONSOMMATION", numero_piece=numero,
+        libelle="Consommation", produit_id=produit_id, unite_production="GENERAL", quantite=quantite,
+        prix_unitaire=100, montant_ht=quantite * 100, montant_ttc=quantite * 100,
+        tva_applicable=False, dt_applicable=False)
+    db.add(journal)
+    db.commit()
+    return journal
+
+
+def _quantite(db, produit_id):
+    db.expire_all()
+    return db.query(models.Stock).filter_by(produit_id=produit_id, unite_production="GENERAL").one().quantite
+
+
+def test_un_update_groupe_par_validation(Session, db):
+    mp = _produit(db, "MP001")
+    engine = db.get_bind()
+    updates = []
+
+    def compter(connexion, curseur, requete, parametres, contexte, executemany):
+        if requete.lstrip().startswith("UPDATE stocks"):
+            updates.append(requete)
+
+    crud.update_stock(db, mp, "GENERAL", 10, 100)
+    avant, mouvements = _quantite(db, mp), db.query(models.MouvementStock).count()
+    event.listen(engine, "before_cursor_execute", compter)
+    try:
+        for numero in range(5):
+            crud.update_stock(db, mp, "GENERAL", -1, commit=False)
+        assert db.query(models.MouvementStock).count() == mouvements  # rien d'écrit avant la validation
+        db.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", compter)
+    assert len(updates) == 1
+    assert _quantite(db, mp) == avant - 5
+    assert db.query(models.MouvementStock).count() == mouvements + 5
+
+
+def test_comptabilisation_apres_modification_par_une_autre_connexion(Session, db, chemin_base):
+    """Une ligne de stocks changée par un autre processus, alors que le cache partagé
+    en garde l'ancienne valeur, est relue sous le verrou : pas de StaleDataError"""
+    mp = _produit(db, "MP001")
+    crud.update_stock(db, mp, "GENERAL", 10, 100)
+    avant = _quantite(db, mp)
+    assert stock_cache.lire(db, mp, "GENERAL")[0] == avant  # valeur gardée dans le cache partagé
+    db.close()
+
+    autre = sqlite3.connect(chemin_base)
+    try:
+        autre.execute("UPDATE stocks SET quantite = quantite + 5 WHERE produit_id = ? AND unite_production = 'GENERAL'",
+                      (mp,))
+        autre.commit()
+    finally:
+        autre.close()
+
+    db = Session()
+    try:
+        resultats = post_journal_entries(db, [_consommation(db, mp, 3)])
+        assert [r["status"] for r in resultats] == ["success"], resultats
+        assert _quantite(db, mp) == avant + 5 - 3
+        assert crud.get_stock_courant(db, mp, "GENERAL")[0] == avant + 5 - 3
+    finally:
+        db.close()
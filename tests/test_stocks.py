@@ -0,0 +1,42 @@
+# tests/test_stocks.py
+"""Rapport des mouvements de stock (crud.get_stock_movements)"""
+from datetime import date, timedelta
+import pytest
+import models
+import crud
+from services.accounting import post_journal_entries
+
+COLONNES = ("stock_initial", "production", "consommation", "vente", "stock_final")
+
+
+@pytest.fixture
+def comptabilise(db, donnees):
+    post_journal_entries(db, db.query(models.JournalQuotidien).order_by(models.JournalQuotidien.id).all())
+    return donnees
+
+
+def test_sous_totaux_par_famille(db, comptabilise):
+    rapport = crud.get_stock_movements(db, date.today() - timedelta(days=10), date.today())
+    lignes = rapport["lignes"]
+    assert len(lignes) == db.query(models.Produit).count()
+    assert [(l["famille"] or "", l["code"]) for l in lignes] == sorted((l["famille"] or "", l["code"]) for l in lignes)
+    assert any(l["production"] or l["consommation"] or l["vente"] for l in lignes)
+    for famille, totaux in rapport["familles"].items():
+        du_groupe = [l for l in lignes if l["famille"] == famille]
+        for colonne in COLONNES:
+            assert totaux[colonne] == pytest.approx(sum(l[colonne] for l in du_groupe))
+        assert totaux["valeur"] == pytest.approx(sum(l["prix_vente"] * l["stock_final"] for l in du_groupe))
+    assert rapport["total_general"] == pytest.approx(sum(t["valeur"] for t in rapport["familles"].values()))
+
+
+def test_stock_final_de_la_veille_egal_au_stock_initial(db, comptabilise):
+    jour = date.today() - timedelta(days=10)
+    veille = {l["produit_id"]: l["stock_final"] for l in crud.get_stock_movements(
+        db, jour - timedelta(days=20), jour - timedelta(days=1))["lignes"]}
+    for ligne in crud.get_stock_movements(db, jour, date.today())["lignes"]:
+        assert ligne["stock_initial"] == pytest.approx(veille[ligne["produit_id"]])
+
+
+def test_filtre_familles(db, comptabilise):
+    rapport = crud.get_stock_movements(db, date.today() - timedelta(days=10), date.today(), ["MP", "PF"])
+    assert {l["famille"] for l in rapport["lignes"]} == set(rapport["familles"]) == {"MP", "PF"}
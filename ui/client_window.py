@@ -3,6 +3,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from database import SessionLocal
 import crud
+from ui.tasks import TaskRunner, LoadingIndicator
 
 class ClientWindow(tk.Frame):
     def __init__(self, parent):
@@ -19,6 +20,7 @@ class ClientWindow(tk.Frame):
         ttk.Button(action_frame, text="Modifier", command=self.edit_client).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Supprimer", command=self.delete_client).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Actualiser", command=self.load_data).pack(side=tk.RIGHT, padx=5)
+        self.tasks = TaskRunner(self, LoadingIndicator(action_frame))
         
         # Frame pour la recherche
         search_frame = ttk.Frame(self)
@@ -64,28 +66,26 @@ class ClientWindow(tk.Frame):
         self.tree.bind("<Double-1>", lambda event: self.edit_client())
     
     def load_data(self):
-        try:
-            db = SessionLocal()
-            self.clients = crud.get_clients(db)
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les nouvelles données
-            for client in self.clients:
-                self.tree.insert("", tk.END, values=(
-                    client.id,
-                    client.code,
-                    client.nom,
-                    client.telephone,
-                    client.email,
-                    client.nif
-                ))
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les clients: {str(e)}")
-        finally:
-            db.close()
+        self.tasks.submit("clients", lambda db: crud.get_clients(db), self.show_clients,
+                          lambda e: messagebox.showerror("Erreur", f"Impossible de charger les clients: {str(e)}"))
+    
+    def show_clients(self, clients):
+        self.clients = clients
+        
+        # Effacer les anciennes données
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        
+        # Ajouter les nouvelles données
+        for client in self.clients:
+            self.tree.insert("", tk.END, values=(
+                client.id,
+                client.code,
+                client.nom,
+                client.telephone,
+                client.email,
+                client.nif
+            ))
     
     def search_clients(self):
         search_term = self.search_var.get().lower()
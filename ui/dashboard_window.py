@@ -2,13 +2,19 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, date, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import crud
 import services.accounting as accounting
-from database import SessionLocal
+from ui.tasks import TaskRunner, LoadingIndicator
 import math
 
+# Période du graphique de rendement : (nombre de jours, granularité)
+TREND_RANGES = {
+    "7 jours": (7, "day"),
+    "30 jours": (30, "day"),
+    "90 jours": (90, "week"),
+    "365 jours": (365, "month"),
+}
+
 class DashboardWindow(tk.Frame):
     def __init__(self, parent):
         super().__init__(parent)
@@ -29,6 +35,17 @@ class DashboardWindow(tk.Frame):
         ttk.Button(date_frame, text="Hier", command=self.load_yesterday).pack(side=tk.LEFT, padx=5)
         ttk.Button(date_frame, text="Aujourd'hui", command=self.load_today).pack(side=tk.LEFT, padx=5)
         
+        # Période du graphique de rendement
+        ttk.Label(date_frame, text="Tendance:").pack(side=tk.LEFT, padx=(20, 5))
+        self.trend_range_var = tk.StringVar(value="7 jours")
+        trend_combobox = ttk.Combobox(date_frame, textvariable=self.trend_range_var, width=10, state="readonly")
+        trend_combobox["values"] = list(TREND_RANGES.keys())
+        trend_combobox.pack(side=tk.LEFT, padx=5)
+        trend_combobox.bind("<<ComboboxSelected>>", lambda event: self.update_trend_chart())
+        
+        # Chargements en arrière-plan
+        self.tasks = TaskRunner(self, LoadingIndicator(date_frame))
+        
         # Frame pour les métriques principales
         metrics_frame = ttk.Frame(self)
         metrics_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -108,9 +125,6 @@ class DashboardWindow(tk.Frame):
         self.charts_frame = ttk.Frame(parent)
         self.charts_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Créer les graphiques
-        self.fig, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(12, 5))
-        
         # Initialiser avec des données par défaut
         self.dashboard_metrics = {
             "today": {
@@ -120,21 +134,40 @@ class DashboardWindow(tk.Frame):
                 "rendement_moyen": 0
             }
         }
+        self.trend_series = None
+        
+        # matplotlib est long à importer : les graphiques ne sont créés qu'une
+        # fois l'onglet affiché, les données arrivées entre-temps sont rejouées
+        self.canvas = None
+        self.charts_placeholder = ttk.Label(self.charts_frame, text="Chargement des graphiques...", foreground="gray")
+        self.charts_placeholder.pack(pady=20)
+        self.charts_frame.bind("<Map>", lambda event: self.after_idle(self.build_charts))
+    
+    def build_charts(self):
+        if self.canvas is not None:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
         
-        # Initialiser les graphiques
+        # Créer les graphiques
+        self.fig, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(12, 5))
+        self.charts_placeholder.destroy()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.charts_frame)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        # Graphique 1 : répartition de la production
         self.update_production_pie_chart()
         
         # Graphique 2: Évolution du rendement
-        self.ax2.plot([], [])
-        self.ax2.set_title("Évolution du rendement")
-        self.ax2.set_xlabel("Date")
-        self.ax2.set_ylabel("Rendement (%)")
-        self.ax2.grid(True)
-        
-        # Intégrer les graphiques dans Tkinter
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.charts_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        if self.trend_series is not None:
+            self.show_trend_chart(self.trend_series)
+        else:
+            self.ax2.plot([], [])
+            self.ax2.set_title("Évolution du rendement")
+            self.ax2.set_xlabel("Date")
+            self.ax2.set_ylabel("Rendement (%)")
+            self.ax2.grid(True)
+            self.canvas.draw()
     
     def update_production_pie_chart(self):
         """Met à jour le graphique en camembert avec gestion des valeurs nulles"""
@@ -167,18 +200,23 @@ class DashboardWindow(tk.Frame):
         self.ax1.set_title("Répartition de la production")
     
     def load_data(self):
+        # Parser la date
+        try:
+            selected_date = datetime.strptime(self.date_var.get(), "%Y-%m-%d").date()
+        except ValueError:
+            selected_date = date.today()
+            self.date_var.set(selected_date.strftime("%Y-%m-%d"))
+        
+        # Charger les métriques et la trésorerie hors de la boucle Tk
+        def travail(db):
+            return accounting.get_dashboard_metrics(db, selected_date), crud.get_balance_tresorerie(db)
+        
+        self.tasks.submit("metriques", travail, self.show_data)
+        self.update_trend_chart()
+    
+    def show_data(self, resultat):
+        self.dashboard_metrics, balance_tresorerie = resultat
         try:
-            # Parser la date
-            try:
-                selected_date = datetime.strptime(self.date_var.get(), "%Y-%m-%d").date()
-            except ValueError:
-                selected_date = date.today()
-                self.date_var.set(selected_date.strftime("%Y-%m-%d"))
-            
-            # Charger les métriques
-            db = SessionLocal()
-            self.dashboard_metrics = accounting.get_dashboard_metrics(db, selected_date)
-            
             # Mettre à jour les métriques principales
             self.update_metric("ventes", self.dashboard_metrics["today"]["cout_total_production"], self.dashboard_metrics["variations"]["cout_total_production"])
             self.update_metric("achats", self.dashboard_metrics["today"]["cout_total_consommation"], self.dashboard_metrics["variations"]["cout_total_consommation"])
@@ -194,32 +232,37 @@ class DashboardWindow(tk.Frame):
             details_unites = self.dashboard_metrics["today"].get("details_unites", {})
             self.update_units_details(details_unites)
             
-            # Mettre à jour les graphiques
-            self.update_production_pie_chart()
-            self.update_trend_chart()
+            # Mettre à jour le graphique de production
+            if self.canvas is not None:
+                self.update_production_pie_chart()
+                self.canvas.draw_idle()
             
             # Mettre à jour la trésorerie
-            balance_tresorerie = crud.get_balance_tresorerie(db)
             self.update_metric("tresorerie", balance_tresorerie, 0)  # Pas de variation pour la trésorerie
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible de charger les données: {str(e)}")
-        finally:
-            db.close()
     
     def update_trend_chart(self):
         """Met à jour le graphique d'évolution du rendement"""
-        dates = [date.today() - timedelta(days=i) for i in range(7, 0, -1)]
-        rendements = []
-        
-        db = SessionLocal()
-        for d in dates:
-            try:
-                metrics = accounting.get_dashboard_metrics(db, d)
-                rendements.append(metrics["today"]["rendement_moyen"])
-            except:
-                rendements.append(0)
-        db.close()
+        nb_jours, granularity = TREND_RANGES.get(self.trend_range_var.get(), TREND_RANGES["7 jours"])
+        end = date.today()
+        start = end - timedelta(days=nb_jours - 1)
+        
+        self.tasks.submit(
+            "tendance",
+            lambda db: accounting.get_rendement_series(db, start, end, granularity),
+            self.show_trend_chart,
+            lambda erreur: self.show_trend_chart([])
+        )
+    
+    def show_trend_chart(self, series):
+        self.trend_series = series
+        if self.canvas is None:
+            return  # dessiné par build_charts
+        
+        dates = [point["periode"] for point in series]
+        rendements = [point["rendement"] for point in series]
         
         self.ax2.clear()
         
@@ -6,6 +6,11 @@ import math
 from database import SessionLocal
 import crud
 import services.accounting as accounting
+from services.facturation import facturer_periode
+from ui.tasks import TaskRunner, LoadingIndicator
+
+TOUS_LES_CLIENTS = "Tous les clients"
+
 
 class FacturationWindow(tk.Frame):
     def __init__(self, parent):
@@ -22,6 +27,7 @@ class FacturationWindow(tk.Frame):
         ttk.Button(action_frame, text="Enregistrer un règlement", command=self.add_reglement).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Exporter PDF", command=self.export_to_pdf).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Actualiser", command=self.load_data).pack(side=tk.RIGHT, padx=5)
+        self.tasks = TaskRunner(self, LoadingIndicator(action_frame))
         
         # Frame pour les filtres
         filter_frame = ttk.Frame(self)
@@ -84,39 +90,43 @@ class FacturationWindow(tk.Frame):
         self.tree.bind("<Double-1>", lambda event: self.view_invoice_details())
     
     def load_data(self):
-        try:
-            db = SessionLocal()
-            
+        def travail(db):
             # Charger les clients pour le filtre
             clients = crud.get_clients(db)
-            self.client_combobox["values"] = ["Tous"] + [c.nom for c in clients]
-            self.client_var.set("Tous")
             
-            # Charger les factures
-            self.invoices = crud.get_factures(db)
-            
-            db.close()
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les nouvelles données
-            for invoice in self.invoices:
-                self.tree.insert("", tk.END, values=(
-                    invoice.id,
-                    invoice.numero_facture,
-                    invoice.date_facture.strftime("%Y-%m-%d"),
-                    invoice.client.nom if invoice.client else "",
-                    f"{invoice.montant_ht:.2f}",
-                    f"{invoice.montant_tva:.2f}",
-                    f"{invoice.montant_ttc:.2f}",
-                    f"{invoice.droit_timbre:.2f}",
-                    f"{invoice.montant_net_payer:.2f}",
-                    invoice.statut.replace("_", " ")
-                ))
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les factures: {str(e)}")
+            # Charger les factures ; leur client est résolu ici, avant la
+            # fermeture de la session (carte d'identité, sans requête)
+            invoices = crud.get_factures(db)
+            for invoice in invoices:
+                invoice.client
+            return [c.nom for c in clients], invoices
+        
+        self.tasks.submit("factures", travail, self.show_invoices,
+                          lambda e: messagebox.showerror("Erreur", f"Impossible de charger les factures: {str(e)}"))
+    
+    def show_invoices(self, resultat):
+        noms_clients, self.invoices = resultat
+        self.client_combobox["values"] = ["Tous"] + noms_clients
+        self.client_var.set("Tous")
+        
+        # Effacer les anciennes données
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        
+        # Ajouter les nouvelles données
+        for invoice in self.invoices:
+            self.tree.insert("", tk.END, values=(
+                invoice.id,
+                invoice.numero_facture,
+                invoice.date_facture.strftime("%Y-%m-%d"),
+                invoice.client.nom if invoice.client else "",
+                f"{invoice.montant_ht:.2f}",
+                f"{invoice.montant_tva:.2f}",
+                f"{invoice.montant_ttc:.2f}",
+                f"{invoice.droit_timbre:.2f}",
+                f"{invoice.montant_net_payer:.2f}",
+                invoice.statut.replace("_", " ")
+            ))
     
     def filter_invoices(self):
         selected_client = self.client_var.get()
@@ -166,7 +176,7 @@ class FacturationWindow(tk.Frame):
         client_var = tk.StringVar()
         client_combobox = ttk.Combobox(form_frame, textvariable=client_var, width=30)
         clients = crud.get_clients(db)
-        client_combobox["values"] = [c.nom for c in clients]
+        client_combobox["values"] = [TOUS_LES_CLIENTS] + [c.nom for c in clients]
         client_combobox.grid(row=0, column=1, sticky=tk.W, pady=10)
         
         # Période
@@ -191,16 +201,17 @@ class FacturationWindow(tk.Frame):
                     messagebox.showwarning("Avertissement", "Veuillez sélectionner un client")
                     return
                 
-                # Trouver l'ID du client
+                # Trouver l'ID du client (None : facturation de tous les clients)
                 client_id = None
-                for client in clients:
-                    if client.nom == client_var.get():
-                        client_id = client.id
-                        break
-                
-                if not client_id:
-                    messagebox.showerror("Erreur", "Client introuvable")
-                    return
+                if client_var.get() != TOUS_LES_CLIENTS:
+                    for client in clients:
+                        if client.nom == client_var.get():
+                            client_id = client.id
+                            break
+                    
+                    if not client_id:
+                        messagebox.showerror("Erreur", "Client introuvable")
+                        return
                 
                 # Valider les dates
                 date_debut = datetime.strptime(date_debut_var.get(), "%Y-%m-%d").date()
@@ -210,12 +221,14 @@ class FacturationWindow(tk.Frame):
                     messagebox.showerror("Erreur", "La date de début ne peut pas être postérieure à la date de fin")
                     return
                 
-                # Générer la facture
-                self.create_invoice_from_bl(db, client_id, date_debut, date_fin)
+                # Générer la ou les factures
+                factures = self.create_invoice_from_bl(db, client_id, date_debut, date_fin)
+                if not factures:
+                    return
                 
                 form.destroy()
                 self.load_data()
-                messagebox.showinfo("Succès", "Facture générée avec succès")
+                messagebox.showinfo("Succès", f"{len(factures)} facture(s) générée(s) avec succès")
             except ValueError as e:
                 messagebox.showerror("Erreur", f"Format de date invalide: {str(e)}")
             except Exception as e:
@@ -227,60 +240,13 @@ class FacturationWindow(tk.Frame):
         ttk.Button(button_frame, text="Annuler", command=form.destroy).pack(side=tk.LEFT, padx=5)
     
     def create_invoice_from_bl(self, db, client_id, date_debut, date_fin):
-        """Génère une facture à partir des BL non facturés pour un client dans une période donnée"""
-        # Récupérer les BL non facturés pour ce client dans la période
-        bls = db.query(models.JournalQuotidien).filter(
-            models.JournalQuotidien.client_id == client_id,
-            models.JournalQuotidien.type_journal == "VENTE",
-            models.JournalQuotidien.date_operation >= date_debut,
-            models.JournalQuotidien.date_operation <= date_fin,
-            models.JournalQuotidien.facture_id == None
-        ).all()
-        
-        if not bls:
+        """Génère les factures des BL non facturés de la période (un client, ou tous si client_id est None)"""
+        factures = facturer_periode(db, date_debut, date_fin, None if client_id is None else [client_id])
+        
+        if not factures:
             messagebox.showinfo("Information", "Aucun BL éligible pour la facturation dans cette période")
-            return
         
-        # Calculer les montants
-        montant_ht = sum(bl.montant_ht for bl in bls)
-        montant_tva = sum(bl.montant_tva for bl in bls)
-        montant_ttc = sum(bl.montant_ttc for bl in bls)
-        droit_timbre = crud.calcul_droit_timbre(montant_ttc)
-        montant_net_payer = montant_ttc + droit_timbre
-        
-        # Créer la facture
-        invoice_data = {
-            "client_id": client_id,
-            "date_facture": date.today(),
-            "montant_ht": montant_ht,
-            "montant_tva": montant_tva,
-            "montant_ttc": montant_ttc,
-            "droit_timbre": droit_timbre,
-            "montant_net_payer": montant_net_payer,
-            "date_echeance": date.today() + timedelta(days=30),
-            "statut": "EN_ATTENTE"
-        }
-        
-        invoice = crud.create_facture(db, invoice_data)
-        
-        # Ajouter les lignes de facture
-        for bl in bls:
-            ligne_data = {
-                "facture_id": invoice.id,
-                "produit_id": bl.produit_id,
-                "quantite": bl.quantite,
-                "prix_unitaire": bl.prix_unitaire,
-                "montant_ht": bl.montant_ht,
-                "taux_tva": bl.taux_tva,
-                "montant_tva": bl.montant_tva
-            }
-            crud.add_ligne_facture(db, ligne_data)
-            
-            # Mettre à jour le BL pour indiquer qu'il est facturé
-            bl.facture_id = invoice.id
-            db.commit()
-        
-        return invoice
+        return factures
     
     def add_reglement(self):
         selected_item = self.tree.selection()
@@ -3,6 +3,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from database import SessionLocal
 import crud
+from ui.tasks import TaskRunner, LoadingIndicator
 
 class FournisseurWindow(tk.Frame):
     def __init__(self, parent):
@@ -19,6 +20,7 @@ class FournisseurWindow(tk.Frame):
         ttk.Button(action_frame, text="Modifier", command=self.edit_fournisseur).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Supprimer", command=self.delete_fournisseur).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Actualiser", command=self.load_data).pack(side=tk.RIGHT, padx=5)
+        self.tasks = TaskRunner(self, LoadingIndicator(action_frame))
         
         # Frame pour la recherche
         search_frame = ttk.Frame(self)
@@ -64,28 +66,26 @@ class FournisseurWindow(tk.Frame):
         self.tree.bind("<Double-1>", lambda event: self.edit_fournisseur())
     
     def load_data(self):
-        try:
-            db = SessionLocal()
-            self.fournisseurs = crud.get_fournisseurs(db)
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les nouvelles données
-            for fournisseur in self.fournisseurs:
-                self.tree.insert("", tk.END, values=(
-                    fournisseur.id,
-                    fournisseur.code,
-                    fournisseur.nom,
-                    fournisseur.telephone,
-                    fournisseur.email,
-                    fournisseur.nif
-                ))
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les fournisseurs: {str(e)}")
-        finally:
-            db.close()
+        self.tasks.submit("fournisseurs", lambda db: crud.get_fournisseurs(db), self.show_fournisseurs,
+                          lambda e: messagebox.showerror("Erreur", f"Impossible de charger les fournisseurs: {str(e)}"))
+    
+    def show_fournisseurs(self, fournisseurs):
+        self.fournisseurs = fournisseurs
+        
+        # Effacer les anciennes données
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        
+        # Ajouter les nouvelles données
+        for fournisseur in self.fournisseurs:
+            self.tree.insert("", tk.END, values=(
+                fournisseur.id,
+                fournisseur.code,
+                fournisseur.nom,
+                fournisseur.telephone,
+                fournisseur.email,
+                fournisseur.nif
+            ))
     
     def search_fournisseurs(self):
         search_term = self.search_var.get().lower()
@@ -7,6 +7,13 @@ import crud
 import services.accounting as accounting
 from models import JournalQuotidien
 from tkcalendar import DateEntry
+from ui.tasks import TaskRunner, LoadingIndicator
+
+# Nombre de lignes chargées par page dans le tableau du journal
+PAGE_SIZE = 200
+# Nombre maximum de résultats d'une recherche et délai avant de la lancer
+SEARCH_LIMIT = 500
+SEARCH_DELAY_MS = 250
 
 
 class JournalWindow(tk.Frame):
@@ -56,7 +63,11 @@ class JournalWindow(tk.Frame):
         self.search_var = tk.StringVar()
         self.search_entry = ttk.Entry(filter_frame, textvariable=self.search_var, width=40)
         self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        self.search_entry.bind("<KeyRelease>", lambda event: self.filter_operations())
+        self.search_entry.bind("<KeyRelease>", lambda event: self.schedule_search())
+        self.search_job = None
+        
+        # Chargements en arrière-plan
+        self.tasks = TaskRunner(self, LoadingIndicator(filter_frame))
         
         # Frame pour le tableau
         table_frame = ttk.Frame(self)
@@ -87,114 +98,89 @@ class JournalWindow(tk.Frame):
         self.tree.column("quantite", width=80, anchor=tk.E)
         self.tree.column("montant", width=100, anchor=tk.E)
         
-        # Ajouter une scrollbar
-        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Ajouter une scrollbar (chargement de la page suivante en fin de défilement)
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
         
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Événement de double-clic
         self.tree.bind("<Double-1>", lambda event: self.edit_operation())
     
     def load_data(self):
-        try:
-            db = SessionLocal()
-            self.operations = crud.get_journal_entries(db)
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les nouvelles données
-            for op in self.operations:
-                client_fournisseur = ""
-                if op.client_id:
-                    client_fournisseur = op.client.nom if op.client else ""
-                elif op.fournisseur_id:
-                    client_fournisseur = op.fournisseur.nom if op.fournisseur else ""
-                
-                produit = op.produit.designation if op.produit else ""
-                
-                self.tree.insert("", tk.END, values=(
-                    op.id,
-                    op.date_operation.strftime("%Y-%m-%d"),
-                    op.type_journal,
-                    op.numero_piece,
-                    op.libelle,
-                    client_fournisseur,
-                    produit,
-                    f"{op.quantite:.2f}",
-                    f"{op.montant_ttc:.2f}"
-                ))
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les opérations: {str(e)}")
-        finally:
-            db.close()
-    
-    def filter_operations(self):
-        search_term = self.search_var.get().lower()
-        
-        # Effacer les anciennes données
+        """Recharge le journal depuis la première page avec les filtres courants"""
+        self.tasks.cancel("page")  # une page en cours pour les anciens filtres est abandonnée
         for item in self.tree.get_children():
             self.tree.delete(item)
         
-        # Ajouter les données filtrées
-        for op in self.operations:
-            client_fournisseur = ""
-            if op.client_id:
-                client_fournisseur = op.client.nom if op.client else ""
-            elif op.fournisseur_id:
-                client_fournisseur = op.fournisseur.nom if op.fournisseur else ""
-            
-            produit = op.produit.designation if op.produit else ""
-            
-            if (search_term in op.numero_piece.lower() or
-                search_term in op.libelle.lower() or
-                search_term in client_fournisseur.lower() or
-                search_term in produit.lower()):
-                self.tree.insert("", tk.END, values=(
-                    op.id,
-                    op.date_operation.strftime("%Y-%m-%d"),
-                    op.type_journal,
-                    op.numero_piece,
-                    op.libelle,
-                    client_fournisseur,
-                    produit,
-                    f"{op.quantite:.2f}",
-                    f"{op.montant_ttc:.2f}"
-                ))
+        self.last_key = None  # (date_operation, id) de la dernière ligne affichée
+        self.all_loaded = False
+        self.load_next_page()
     
-    def filter_by_type(self, event=None):
-        """Filtre les opérations par type sélectionné"""
-        selected_type = self.type_var.get()
+    def load_next_page(self):
+        """Charge en arrière-plan la page suivante du journal"""
+        if self.all_loaded or self.tasks.is_running("page"):
+            return
         
-        # Effacer les anciennes données
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        search = self.search_var.get().strip()
+        type_journal = self.type_var.get() or None
+        last_key = self.last_key
+        
+        def travail(db):
+            if search:
+                # Recherche plein texte : résultats classés par pertinence, sans pagination
+                return crud.search_journal(db, search, type_journal=type_journal, limit=SEARCH_LIMIT)
+            return crud.get_journal_page(db, after=last_key, limit=PAGE_SIZE, type_journal=type_journal)
+        
+        def on_error(erreur):
+            messagebox.showerror("Erreur", f"Impossible de charger les opérations: {str(erreur)}")
+        
+        self.tasks.submit("page", travail, lambda rows: self.show_page(rows, bool(search)), on_error)
+    
+    def show_page(self, rows, search):
+        """Ajoute une page de résultats à la fin du tableau"""
+        if search:
+            self.all_loaded = True
+        
+        for row in rows:
+            self.tree.insert("", tk.END, values=(
+                row.id,
+                row.date_operation.strftime("%Y-%m-%d"),
+                row.type_journal,
+                row.numero_piece,
+                row.libelle,
+                row.tiers,
+                row.produit,
+                f"{row.quantite:.2f}",
+                f"{row.montant_ttc:.2f}"
+            ))
         
-        # Ajouter les données filtrées
-        for op in self.operations:
-            if selected_type == "" or op.type_journal == selected_type:
-                client_fournisseur = ""
-                if op.client_id:
-                    client_fournisseur = op.client.nom if op.client else ""
-                elif op.fournisseur_id:
-                    client_fournisseur = op.fournisseur.nom if op.fournisseur else ""
-                
-                produit = op.produit.designation if op.produit else ""
-                
-                self.tree.insert("", tk.END, values=(
-                    op.id,
-                    op.date_operation.strftime("%Y-%m-%d"),
-                    op.type_journal,
-                    op.numero_piece,
-                    op.libelle,
-                    client_fournisseur,
-                    produit,
-                    f"{op.quantite:.2f}",
-                    f"{op.montant_ttc:.2f}"
-                ))
+        if rows:
+            self.last_key = (rows[-1].date_operation, rows[-1].id)
+        if len(rows) < PAGE_SIZE:
+            self.all_loaded = True
+    
+    def on_tree_scroll(self, first, last):
+        """Met à jour la scrollbar et charge la page suivante à l'approche de la fin"""
+        self.scrollbar.set(first, last)
+        if float(last) >= 0.95 and not self.all_loaded:
+            self.after_idle(self.load_next_page)
+    
+    def schedule_search(self):
+        """Relance la recherche quand la saisie marque une pause"""
+        if self.search_job:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DELAY_MS, self.filter_operations)
+    
+    def filter_operations(self):
+        """Recherche plein texte sur pièce, libellé, tiers et produit"""
+        self.search_job = None
+        self.load_data()
+    
+    def filter_by_type(self, event=None):
+        """Filtre les opérations par type sélectionné"""
+        self.load_data()
     
     def add_operation(self):
         self.open_operation_form()
@@ -2,25 +2,37 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
+import time
+import importlib
+import logging
 from datetime import datetime
 from database import SessionLocal, engine
 import crud
 import services.accounting as accounting
 import services.production as production
-from ui.client_window import ClientWindow
-from ui.fournisseur_window import FournisseurWindow
-from ui.product_window import ProductWindow
-from ui.journal_window import JournalWindow
-from ui.facturation_window import FacturationWindow
-from ui.dashboard_window import DashboardWindow
-from ui.stock_window import StockWindow
-from ui.tresorerie_window import TresorerieWindow
+import ui.tasks as tasks
+
+logger = logging.getLogger("bois_m.ui")
+
+# Onglets : (attribut, libellé, module, classe). Le module n'est importé et
+# l'onglet construit (avec son premier chargement) qu'à sa première sélection.
+TABS = [
+    ("dashboard_tab", "Tableau de bord", "ui.dashboard_window", "DashboardWindow"),
+    ("clients_tab", "Clients", "ui.client_window", "ClientWindow"),
+    ("fournisseurs_tab", "Fournisseurs", "ui.fournisseur_window", "FournisseurWindow"),
+    ("products_tab", "Produits", "ui.product_window", "ProductWindow"),
+    ("journal_tab", "Journal de saisie", "ui.journal_window", "JournalWindow"),
+    ("facturation_tab", "Facturation", "ui.facturation_window", "FacturationWindow"),
+    ("stock_tab", "Stocks", "ui.stock_window", "StockWindow"),
+    ("tresorerie_tab", "Trésorerie", "ui.tresorerie_window", "TresorerieWindow"),
+]
 
 class MainWindow(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Gestion Comptable Bois_M - Application de Bureau")
         self.geometry("1200x800")
+        self.protocol("WM_DELETE_WINDOW", self.quit_app)
         
         # Configurer le style
         self.style = ttk.Style()
@@ -34,28 +46,19 @@ class MainWindow(tk.Tk):
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Créer les onglets
-        self.dashboard_tab = DashboardWindow(self.notebook)
-        self.clients_tab = ClientWindow(self.notebook)
-        self.fournisseurs_tab = FournisseurWindow(self.notebook)
-        self.products_tab = ProductWindow(self.notebook)
-        self.journal_tab = JournalWindow(self.notebook)
-        self.facturation_tab = FacturationWindow(self.notebook)
-        self.stock_tab = StockWindow(self.notebook)
-        self.tresorerie_tab = TresorerieWindow(self.notebook)
+        # Ajouter les onglets : un cadre vide par onglet, rempli à la première sélection
+        self.tab_frames = []
+        self.tab_timings = {}  # libellé -> durée de construction (s)
+        for attribut, libelle, _, _ in TABS:
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=libelle)
+            self.tab_frames.append(frame)
+            setattr(self, attribut, None)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
-        # Ajouter les onglets
-        self.notebook.add(self.dashboard_tab, text="Tableau de bord")
-        self.notebook.add(self.clients_tab, text="Clients")
-        self.notebook.add(self.fournisseurs_tab, text="Fournisseurs")
-        self.notebook.add(self.products_tab, text="Produits")
-        self.notebook.add(self.journal_tab, text="Journal de saisie")
-        self.notebook.add(self.facturation_tab, text="Facturation")
-        self.notebook.add(self.stock_tab, text="Stocks")
-        self.notebook.add(self.tresorerie_tab, text="Trésorerie")
-        
-        # Sélectionner l'onglet par défaut
-        self.notebook.select(self.dashboard_tab)
+        # Sélectionner l'onglet par défaut (construit au premier passage de la boucle Tk)
+        self.notebook.select(self.tab_frames[0])
+        self.after_idle(self.on_tab_changed)
         
         # Barre de statut
         self.status_var = tk.StringVar()
@@ -98,6 +101,25 @@ class MainWindow(tk.Tk):
         # Charger les données initiales si nécessaire
         pass
     
+    def on_tab_changed(self, event=None):
+        """Construit l'onglet sélectionné s'il ne l'a pas encore été"""
+        index = self.notebook.index("current")
+        attribut, libelle, module, classe = TABS[index]
+        if getattr(self, attribut) is not None:
+            return
+        
+        debut = time.perf_counter()
+        self.status_var.set(f"Chargement de l'onglet {libelle}...")
+        self.update_idletasks()
+        tab_class = getattr(importlib.import_module(module), classe)
+        tab = tab_class(self.tab_frames[index])
+        tab.pack(fill=tk.BOTH, expand=True)
+        setattr(self, attribut, tab)
+        
+        self.tab_timings[libelle] = time.perf_counter() - debut
+        self.status_var.set("Prêt")
+        logger.debug("Onglet %s construit en %.0f ms", libelle, self.tab_timings[libelle] * 1000)
+    
     # Méthodes du menu Fichier
     def new_file(self):
         pass
@@ -109,6 +131,7 @@ class MainWindow(tk.Tk):
         pass
     
     def quit_app(self):
+        tasks.shutdown()
         self.destroy()
     
     # Méthodes du menu Édition
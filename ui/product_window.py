@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from database import SessionLocal
 import crud
+from ui.tasks import TaskRunner, LoadingIndicator
 
 class ProductWindow(tk.Frame):
     def __init__(self, parent):
@@ -19,6 +20,7 @@ class ProductWindow(tk.Frame):
         ttk.Button(action_frame, text="Supprimer", command=self.delete_product).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Gérer Familles", command=self.manage_families).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Actualiser", command=self.load_data).pack(side=tk.RIGHT, padx=5)
+        self.tasks = TaskRunner(self, LoadingIndicator(action_frame))
         
         # Frame pour la recherche et filtre
         filter_frame = ttk.Frame(self)
@@ -63,29 +65,27 @@ class ProductWindow(tk.Frame):
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     
     def load_data(self):
-        try:
-            db = SessionLocal()
-            
-            # Charger les produits
-            self.products = crud.get_produits(db)
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les nouvelles données
-            for product in self.products:
-                self.tree.insert("", tk.END, values=(
-                    product.id,
-                    product.code,
-                    product.designation,
-                    product.famille,
-                    product.unite_mesure,
-                    f"{product.prix_achat:.2f}" if product.prix_achat else "",
-                    f"{product.prix_vente:.2f}" if product.prix_vente else ""
-                ))
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les produits: {str(e)}")
+        self.tasks.submit("produits", lambda db: crud.get_produits(db), self.show_products,
+                          lambda e: messagebox.showerror("Erreur", f"Impossible de charger les produits: {str(e)}"))
+    
+    def show_products(self, products):
+        self.products = products
+        
+        # Effacer les anciennes données
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        
+        # Ajouter les nouvelles données
+        for product in self.products:
+            self.tree.insert("", tk.END, values=(
+                product.id,
+                product.code,
+                product.designation,
+                product.famille,
+                product.unite_mesure,
+                f"{product.prix_achat:.2f}" if product.prix_achat else "",
+                f"{product.prix_vente:.2f}" if product.prix_vente else ""
+            ))
     
     def filter_products(self):
         search_term = self.search_var.get().lower()
@@ -1,9 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
-from database import SessionLocal
 import crud
 from tkcalendar import DateEntry  # Importer le widget DateEntry
+from ui.tasks import TaskRunner, LoadingIndicator
 
 class StockWindow(tk.Frame):
     def __init__(self, parent):
@@ -47,6 +47,9 @@ class StockWindow(tk.Frame):
         # Bouton de filtrage
         ttk.Button(period_frame, text="Filtrer", command=self.filter_stocks_by_period).pack(side=tk.LEFT, padx=5)
 
+        # Chargements en arrière-plan
+        self.tasks = TaskRunner(self, LoadingIndicator(period_frame))
+
         # Frame pour le filtre de famille
         family_frame = ttk.Frame(self)
         family_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -96,20 +99,20 @@ class StockWindow(tk.Frame):
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
     def load_families(self, frame):
-        try:
-            db = SessionLocal()
-            families = crud.get_familles_produit(db)
-
+        def show_families(designations):
             # Créer une case à cocher pour chaque famille
-            for family in families:
+            for designation in designations:
                 var = tk.BooleanVar()
-                self.family_vars[family.designation] = var
-                checkbox = ttk.Checkbutton(frame, text=family.designation, variable=var)
+                self.family_vars[designation] = var
+                checkbox = ttk.Checkbutton(frame, text=designation, variable=var)
                 checkbox.pack(side=tk.LEFT, padx=5)
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les familles: {str(e)}")
-        finally:
-            db.close()
+
+        self.tasks.submit(
+            "familles",
+            lambda db: [family.designation for family in crud.get_familles_produit(db)],
+            show_families,
+            lambda e: messagebox.showerror("Erreur", f"Impossible de charger les familles: {str(e)}")
+        )
 
     def load_data(self):
         # Cette méthode sera modifiée pour charger les données selon les spécifications
@@ -120,94 +123,62 @@ class StockWindow(tk.Frame):
         start_date_obj = self.start_date_entry.get_date()  # Utiliser get_date() pour obtenir un objet date
         end_date_obj = self.end_date_entry.get_date()  # Utiliser get_date() pour obtenir un objet date
 
+        family_selected = [family for family, var in self.family_vars.items() if var.get()]
+
+        # Une seule requête groupée pour tous les produits de la période, hors de la boucle Tk
+        self.tasks.submit(
+            "stocks",
+            lambda db: crud.get_stock_movements(db, start_date_obj, end_date_obj, family_selected or None),
+            self.show_stocks,
+            lambda e: messagebox.showerror("Erreur", f"Impossible de charger les stocks: {str(e)}")
+        )
+
+    def show_stocks(self, report):
         # Effacer les anciennes données
         for item in self.tree.get_children():
             self.tree.delete(item)
-        
+
         # Ajouter les données filtrées par période et par famille
-        try:
-            db = SessionLocal()
-            products = crud.get_produits(db)
-
-            family_selected = [family for family, var in self.family_vars.items() if var.get()]
-
-            family_totals = {}
-            for product in products:
-                # Vérifier si la famille correspond à la sélection
-                if family_selected and product.famille not in family_selected:
-                    continue
-                
-                # Récupérer les opérations de production, consommation et vente pour chaque produit
-                production = crud.get_production_for_product(db, product.id, start_date_obj, end_date_obj)
-                consumption = crud.get_consumption_for_product(db, product.id, start_date_obj, end_date_obj)
-                sales = crud.get_sales_for_product(db, product.id, start_date_obj, end_date_obj)
-                
-                # Calculer les quantités
-                stock_initial = crud.get_initial_stock_for_product(db, product.id, start_date_obj)
-                stock_final = stock_initial + production - consumption - sales
-                
-                # Regrouper par famille
-                family = product.famille
-                if family not in family_totals:
-                    family_totals[family] = {
-                        "sous_total": 0,
-                        "quantite_initiale": 0,
-                        "production": 0,
-                        "consommation": 0,
-                        "vente": 0
-                    }
-                
-                # Ajouter les valeurs au tableau
-                self.tree.insert("", tk.END, values=(
-                    "",  # Numérotation
-                    product.id,
-                    product.code,
-                    product.designation,
-                    f"{product.prix_vente:.2f}",  # Prix U
-                    f"{stock_initial:.2f}",  # Stock Initial
-                    f"{production:.2f}",  # Production
-                    f"{consumption:.2f}",  # Consommation
-                    f"{sales:.2f}",  # Vente
-                    f"{stock_final:.2f}"  # Stock Fin
-                ))
-                
-                # Mettre à jour les totaux
-                family_totals[family]["quantite_initiale"] += stock_initial
-                family_totals[family]["production"] += production
-                family_totals[family]["consommation"] += consumption
-                family_totals[family]["vente"] += sales
-                family_totals[family]["sous_total"] += product.prix_vente * stock_final
-            
-            # Afficher les sous-totaux par famille
-            for family, totals in family_totals.items():
-                self.tree.insert("", tk.END, values=(
-                    "",  # ID vide pour le sous-total
-                    "",  # Code vide pour le sous-total
-                    family,  # Famille
-                    "",  # Désignation vide pour le sous-total
-                    "",  # Prix U vide pour le sous-total
-                    f"{totals['quantite_initiale']:.2f}",  # Quantité initiale
-                    f"{totals['production']:.2f}",  # Production
-                    f"{totals['consommation']:.2f}",  # Consommation
-                    f"{totals['vente']:.2f}",  # Vente
-                    f"{totals['sous_total']:.2f}"  # Sous-total
-                ))
-            
-            # Calculer le total général
-            total_general = sum(totals["sous_total"] for totals in family_totals.values())
+        for ligne in report["lignes"]:
+            self.tree.insert("", tk.END, values=(
+                "",  # Numérotation
+                ligne["produit_id"],
+                ligne["code"],
+                ligne["designation"],
+                f"{ligne['prix_vente']:.2f}",  # Prix U
+                f"{ligne['stock_initial']:.2f}",  # Stock Initial
+                f"{ligne['production']:.2f}",  # Production
+                f"{ligne['consommation']:.2f}",  # Consommation
+                f"{ligne['vente']:.2f}",  # Vente
+                f"{ligne['stock_final']:.2f}"  # Stock Fin
+            ))
+
+        # Afficher les sous-totaux par famille
+        for family, totals in report["familles"].items():
             self.tree.insert("", tk.END, values=(
-                "",  # ID vide pour le total général
-                "",  # Code vide pour le total général
-                "Total Général",  # Label pour le total général
-                "",  # Désignation vide pour le total général
-                "",  # Prix U vide pour le total général
-                "",  # Quantité vide pour le total général
-                "",  # Production vide pour le total général
-                "",  # Consommation vide pour le total général
-                "",  # Vente vide pour le total général
-                f"{total_general:.2f}"  # Total général
+                "",  # ID vide pour le sous-total
+                "",  # Code vide pour le sous-total
+                family,  # Famille
+                "",  # Désignation vide pour le sous-total
+                "",  # Prix U vide pour le sous-total
+                f"{totals['stock_initial']:.2f}",  # Quantité initiale
+                f"{totals['production']:.2f}",  # Production
+                f"{totals['consommation']:.2f}",  # Consommation
+                f"{totals['vente']:.2f}",  # Vente
+                f"{totals['valeur']:.2f}"  # Sous-total
             ))
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les stocks: {str(e)}")
-        finally:
-            db.close()
+        
+        # Total général
+        total_general = report["total_general"]
+        self.tree.insert("", tk.END, values=(
+            "",  # ID vide pour le total général
+            "",  # Code vide pour le total général
+            "Total Général",  # Label pour le total général
+            "",  # Désignation vide pour le total général
+            "",  # Prix U vide pour le total général
+            "",  # Quantité vide pour le total général
+            "",  # Production vide pour le total général
+            "",  # Consommation vide pour le total général
+            "",  # Vente vide pour le total général
+            f"{total_general:.2f}"  # Total général
+        ))
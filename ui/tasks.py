@@ -0,0 +1,142 @@
+# ui/tasks.py
+"""
+Chargements en arrière-plan pour les onglets Tkinter.
+
+Les requêtes s'exécutent dans un pool de threads, chacune avec sa propre
+session ; les résultats reviennent dans la boucle Tk par une file relevée
+avec after() (Tk ne doit être manipulé que depuis son propre thread).
+Les tâches doivent donc renvoyer des données simples (tuples, dictionnaires),
+pas des objets ORM dont les relations seraient chargées après la fermeture
+de la session.
+"""
+import queue
+import tkinter as tk
+from tkinter import ttk, messagebox
+from concurrent.futures import ThreadPoolExecutor
+from database import SessionLocal
+
+MAX_WORKERS = 4
+POLL_MS = 30
+
+_executor = None
+
+
+def get_executor():
+    """Pool partagé par tous les onglets, créé au premier usage"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="bois_m-ui")
+    return _executor
+
+
+def shutdown():
+    """Arrête le pool sans attendre les tâches en cours (fermeture de l'application)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class LoadingIndicator:
+    """Barre de progression indéterminée, visible pendant les chargements"""
+
+    def __init__(self, parent, side=tk.RIGHT):
+        self.side = side
+        self.bar = ttk.Progressbar(parent, mode="indeterminate", length=80)
+        self.visible = False
+
+    def start(self):
+        if not self.visible:
+            self.bar.pack(side=self.side, padx=5)
+            self.bar.start(15)
+            self.visible = True
+
+    def stop(self):
+        if self.visible:
+            self.bar.stop()
+            self.bar.pack_forget()
+            self.visible = False
+
+
+class TaskRunner:
+    """
+    Lance les tâches d'un onglet en arrière-plan.
+
+    submit(nom, travail, on_done, on_error) : travail(db) s'exécute dans le pool
+    avec une session dédiée, puis on_done(resultat) (ou on_error(exception))
+    est appelé dans la boucle Tk. Une nouvelle soumission sous le même nom
+    annule la précédente : retirée du pool si elle n'a pas démarré, son
+    résultat ignoré sinon.
+    """
+
+    def __init__(self, widget, indicator: LoadingIndicator = None):
+        self.widget = widget
+        self.indicator = indicator
+        self._resultats = queue.Queue()
+        self._generations = {}  # nom -> numéro de la dernière soumission
+        self._en_cours = {}  # nom -> (future, on_done, on_error)
+        self._poll_job = None
+
+    def submit(self, nom, travail, on_done, on_error=None):
+        self.cancel(nom)
+        generation = self._generations.get(nom, 0) + 1
+        self._generations[nom] = generation
+        future = get_executor().submit(self._executer, nom, generation, travail)
+        self._en_cours[nom] = (future, on_done, on_error)
+        self._refresh()
+        return future
+
+    def cancel(self, nom=None):
+        """Annule une tâche (ou toutes) : son résultat ne sera pas transmis"""
+        for cle in ([nom] if nom is not None else list(self._en_cours)):
+            tache = self._en_cours.pop(cle, None)
+            if tache:
+                tache[0].cancel()
+                self._generations[cle] = self._generations.get(cle, 0) + 1
+        self._refresh()
+
+    def is_running(self, nom):
+        return nom in self._en_cours
+
+    def _executer(self, nom, generation, travail):
+        if self._generations.get(nom) != generation:
+            return  # annulée avant de démarrer
+        db = SessionLocal()
+        try:
+            self._resultats.put((nom, generation, travail(db), None))
+        except Exception as e:
+            self._resultats.put((nom, generation, None, e))
+        finally:
+            db.close()
+
+    def _poll(self):
+        self._poll_job = None
+        if not self.widget.winfo_exists():
+            return
+        while True:
+            try:
+                nom, generation, resultat, erreur = self._resultats.get_nowait()
+            except queue.Empty:
+                break
+            if self._generations.get(nom) != generation or nom not in self._en_cours:
+                continue  # résultat d'une tâche annulée ou remplacée
+            _, on_done, on_error = self._en_cours.pop(nom)
+            try:
+                if erreur is None:
+                    on_done(resultat)
+                elif on_error:
+                    on_error(erreur)
+                else:
+                    raise erreur
+            except Exception as e:
+                messagebox.showerror("Erreur", f"Impossible de charger les données: {str(e)}")
+        self._refresh()
+
+    def _refresh(self):
+        """Met à jour l'indicateur et relève la file tant que des tâches sont en cours"""
+        if self.indicator and self._en_cours:
+            self.indicator.start()
+        elif self.indicator:
+            self.indicator.stop()
+        if self._en_cours and self._poll_job is None:
+            self._poll_job = self.widget.after(POLL_MS, self._poll)
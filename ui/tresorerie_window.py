@@ -5,6 +5,10 @@ from datetime import datetime, date
 from database import SessionLocal
 import crud
 from models import Tresorerie  # Importer la classe Tresorerie
+from ui.tasks import TaskRunner, LoadingIndicator
+
+# Nombre d'opérations chargées par page dans le tableau
+PAGE_SIZE = 200
 
 class TresorerieWindow(tk.Frame):
     def __init__(self, parent):
@@ -20,6 +24,9 @@ class TresorerieWindow(tk.Frame):
         ttk.Button(action_frame, text="Nouvelle opération", command=self.add_operation).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Actualiser", command=self.load_data).pack(side=tk.RIGHT, padx=5)
         
+        # Chargements en arrière-plan
+        self.tasks = TaskRunner(self, LoadingIndicator(action_frame))
+        
         # Frame pour les filtres
         filter_frame = ttk.Frame(self)
         filter_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -77,12 +84,12 @@ class TresorerieWindow(tk.Frame):
         self.tree.column("tiers", width=150)
         self.tree.column("piece", width=100, anchor=tk.CENTER)
         
-        # Ajouter une scrollbar
-        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Ajouter une scrollbar (chargement de la page suivante en fin de défilement)
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
         
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Événement de double-clic
         self.tree.bind("<Double-1>", lambda event: self.edit_operation())
@@ -97,98 +104,85 @@ class TresorerieWindow(tk.Frame):
         # Stocker la référence pour mise à jour
         setattr(self, f"{metric_key}_label", value_label)
     
-    def load_data(self):
-        try:
-            db = SessionLocal()
-            
-            # Charger les opérations
-            self.operations = db.query(Tresorerie).order_by(Tresorerie.date_operation.desc()).all()
-            
-            # Calculer les métriques
-            self.update_metrics(db)
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les nouvelles données
-            for op in self.operations:
-                client_fournisseur = ""
-                if op.client_id:
-                    client = crud.get_client(db, op.client_id)
-                    client_fournisseur = client.nom if client else ""
-                elif op.fournisseur_id:
-                    fournisseur = crud.get_fournisseur(db, op.fournisseur_id)
-                    client_fournisseur = fournisseur.nom if fournisseur else ""
-                
-                self.tree.insert("", tk.END, values=(
-                    op.id,
-                    op.date_operation.strftime("%Y-%m-%d"),
-                    op.type_operation,
-                    op.mode_paiement,
-                    f"{op.montant:.2f}",
-                    op.libelle,
-                    client_fournisseur,
-                    op.numero_piece
-                ))
-            
-            db.close()
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Impossible de charger les opérations: {str(e)}")
+    def load_data(self, date_debut=None, date_fin=None):
+        """Recharge les opérations et les métriques de la période (toutes par défaut)"""
+        self.period = (date_debut, date_fin)
+        self.last_key = None  # (date_operation, id) de la dernière ligne affichée
+        self.all_loaded = False
+        self.tasks.cancel("page")  # une page en cours pour l'ancienne période est abandonnée
+        
+        # Effacer les anciennes données
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        
+        self.tasks.submit(
+            "metriques",
+            lambda db: crud.get_tresorerie_totaux(db, date_debut, date_fin),
+            self.update_metrics,
+            lambda e: messagebox.showerror("Erreur", f"Impossible de calculer les métriques: {str(e)}")
+        )
+        self.load_next_page()
     
-    def update_metrics(self, db):
-        # Calculer les encaissements et décaissements
-        encaissements = sum(op.montant for op in self.operations if op.type_operation == "ENCAISSEMENT")
-        decaissements = sum(op.montant for op in self.operations if op.type_operation == "DECAISSEMENT")
-        solde = encaissements - decaissements
+    def load_next_page(self):
+        """Charge en arrière-plan la page suivante des opérations de la période"""
+        if self.all_loaded or self.tasks.is_running("page"):
+            return
         
-        # Mettre à jour les métriques
-        self.solde_label.config(text=f"{solde:.2f} DA")
-        self.encaissements_label.config(text=f"{encaissements:.2f} DA")
-        self.decaissements_label.config(text=f"{decaissements:.2f} DA")
+        date_debut, date_fin = self.period
+        last_key = self.last_key
+        self.tasks.submit(
+            "page",
+            lambda db: crud.get_tresorerie_operations(db, date_debut, date_fin, after=last_key, limit=PAGE_SIZE),
+            self.show_page,
+            lambda e: messagebox.showerror("Erreur", f"Impossible de charger les opérations: {str(e)}")
+        )
+    
+    def show_page(self, rows):
+        """Ajoute une page d'opérations à la fin du tableau"""
+        for op in rows:
+            self.tree.insert("", tk.END, values=(
+                op.id,
+                op.date_operation.strftime("%Y-%m-%d"),
+                op.type_operation,
+                op.mode_paiement,
+                f"{op.montant:.2f}",
+                op.libelle,
+                op.tiers,
+                op.numero_piece
+            ))
+        
+        if rows:
+            self.last_key = (rows[-1].date_operation, rows[-1].id)
+        if len(rows) < PAGE_SIZE:
+            self.all_loaded = True
+    
+    def on_tree_scroll(self, first, last):
+        """Met à jour la scrollbar et charge la page suivante à l'approche de la fin"""
+        self.scrollbar.set(first, last)
+        if float(last) >= 0.95 and not self.all_loaded:
+            self.after_idle(self.load_next_page)
+    
+    def update_metrics(self, totaux):
+        # Encaissements et décaissements calculés en SQL (get_tresorerie_totaux)
+        self.solde_label.config(text=f"{totaux['solde']:.2f} DA")
+        self.encaissements_label.config(text=f"{totaux['encaissements']:.2f} DA")
+        self.decaissements_label.config(text=f"{totaux['decaissements']:.2f} DA")
     
     def filter_operations(self):
         try:
             # Parser les dates
             date_debut = datetime.strptime(self.date_debut_var.get(), "%Y-%m-%d").date()
             date_fin = datetime.strptime(self.date_fin_var.get(), "%Y-%m-%d").date()
-            
-            if date_debut > date_fin:
-                messagebox.showerror("Erreur", "La date de début ne peut pas être postérieure à la date de fin")
-                return
-            
-            # Filtrer les opérations
-            filtered_ops = [
-                op for op in self.operations
-                if date_debut <= op.date_operation.date() <= date_fin
-            ]
-            
-            # Effacer les anciennes données
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Ajouter les données filtrées
-            for op in filtered_ops:
-                client_fournisseur = ""
-                if op.client_id:
-                    client = crud.get_client(db, op.client_id)
-                    client_fournisseur = client.nom if client else ""
-                elif op.fournisseur_id:
-                    fournisseur = crud.get_fournisseur(db, op.fournisseur_id)
-                    client_fournisseur = fournisseur.nom if fournisseur else ""
-                
-                self.tree.insert("", tk.END, values=(
-                    op.id,
-                    op.date_operation.strftime("%Y-%m-%d"),
-                    op.type_operation,
-                    op.mode_paiement,
-                    f"{op.montant:.2f}",
-                    op.libelle,
-                    client_fournisseur,
-                    op.numero_piece
-                ))
         except ValueError:
             messagebox.showerror("Erreur", "Format de date invalide")
+            return
+        
+        if date_debut > date_fin:
+            messagebox.showerror("Erreur", "La date de début ne peut pas être postérieure à la date de fin")
+            return
+        
+        # Filtrer les opérations en base
+        self.load_data(date_debut, date_fin)
     
     def add_operation(self):
         self.open_operation_form()
@@ -333,7 +327,7 @@ class TresorerieWindow(tk.Frame):
                             message = "Opération ajoutée avec succès"
                         
                         form.destroy()
-                        self.load_data()
+                        self.load_data(*self.period)
                         messagebox.showinfo("Succès", message)
                     except ValueError as e:
                         messagebox.showerror("Erreur", f"Valeur invalide: {str(e)}")